@@ -1,6 +1,12 @@
 from rest_framework import serializers
+import logging
 import uuid
+from decimal import Decimal
+from cliquepay import avatars, receipts, split_allocator
 from cliquepay.models import Expense, Group, User, GroupMember, ExpenseSplit
+
+logger = logging.getLogger(__name__)
+
 class UserRegistrationSerializer(serializers.Serializer):
     username = serializers.CharField(max_length=255, required=True)
     fullname = serializers.CharField(max_length=255, required=True)
@@ -49,6 +55,9 @@ class ConfirmResetPasswordSerializer(serializers.Serializer):
     
 class GetUserFriendsSerializer(serializers.Serializer):
     id_token = serializers.CharField(required=True)
+    cursor = serializers.CharField(required=False)
+    limit = serializers.IntegerField(required=False, min_value=1, max_value=200)
+    since_version = serializers.IntegerField(required=False, min_value=0)
 
 class GetResentVerificationCodeSerializer(serializers.Serializer):
     username = serializers.CharField(max_length=255, required=True)
@@ -78,7 +87,6 @@ class UpdateUserProfileSerializer(serializers.Serializer):
     id_token = serializers.CharField(required=True)
     full_name = serializers.CharField(required=False, max_length=150)
     phone_number = serializers.CharField(required=False, max_length=16)
-    avatar_url = serializers.URLField(required=False)
     currency = serializers.CharField(required=False, max_length=10)
 
 class FriendRequestSerializer(serializers.Serializer):
@@ -91,6 +99,10 @@ class FriendRequestSerializer(serializers.Serializer):
             raise serializers.ValidationError("Either username or email must be provided")
         return data
 
+class BulkFriendRequestSerializer(serializers.Serializer):
+    id_token = serializers.CharField(required=True)
+    user_ids = serializers.ListField(child=serializers.CharField(), allow_empty=False, max_length=100)
+
 class AcceptFriendRequestSerializer(serializers.Serializer):
     id_token = serializers.CharField(required=True)
     request_id = serializers.CharField(max_length=255, required=True)
@@ -129,6 +141,14 @@ class UploadProfilePictureSerializer(serializers.Serializer):
             raise serializers.ValidationError('Invalid ID token format')
         return value
 
+class ProfilePictureUploadUrlSerializer(serializers.Serializer):
+    id_token = serializers.CharField(required=True)
+    content_type = serializers.ChoiceField(choices=list(avatars.ALLOWED_CONTENT_TYPES))
+
+class ConfirmProfilePictureSerializer(serializers.Serializer):
+    id_token = serializers.CharField(required=True)
+    key = serializers.CharField(required=True, max_length=512)
+
 class ResetProfilePictureSerializer(serializers.Serializer):
     id_token = serializers.CharField(
         required=True,
@@ -221,14 +241,24 @@ class GroupCreateSerializer(serializers.ModelSerializer):
                     group=group,
                     user=user
                 )
-                print(f"Added member {user.full_name} to group {group.name}")
+                logger.debug("Added member %s to group %s", user.id, group.id)
             except User.DoesNotExist:
-                print(f"User with ID {member_id} not found, skipping")
-            except Exception as e:
-                print(f"Error adding member {member_id}: {str(e)}")
+                logger.info("User with ID %s not found, skipping", member_id)
+            except Exception:
+                logger.warning("Error adding member %s to group %s", member_id, group.id, exc_info=True)
         
         return group
 
+class SplitValueSerializer(serializers.Serializer):
+    user_id = serializers.CharField(required=True)
+    value = serializers.DecimalField(
+        max_digits=12, decimal_places=split_allocator.WEIGHT_PLACES, required=False, min_value=0
+    )
+
+class SplitItemSerializer(serializers.Serializer):
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    user_ids = serializers.ListField(child=serializers.CharField(), allow_empty=False)
+
 class ExpenseCreateSerializer(serializers.ModelSerializer):
 
     group_id = serializers.PrimaryKeyRelatedField(
@@ -237,22 +267,58 @@ class ExpenseCreateSerializer(serializers.ModelSerializer):
     friend_id = serializers.PrimaryKeyRelatedField(
         queryset=User.objects.all(),
         required=False)
+    split_mode = serializers.ChoiceField(
+        choices=split_allocator.SPLIT_MODES,
+        default='equal',
+        write_only=True)
+    # Participants and their amount / percentage / shares, defaults to everyone
+    splits = SplitValueSerializer(many=True, required=False, write_only=True)
+    items = SplitItemSerializer(many=True, required=False, write_only=True)
     
     class Meta:
         model = Expense
-        fields = ['group_id', 'friend_id', 'paid_by', 'total_amount', 
-                 'description', 'deadline', 'receipt_url']
+        fields = ['group_id', 'friend_id', 'paid_by', 'total_amount', 'currency',
+                 'description', 'deadline',
+                 'split_mode', 'splits', 'items']
     
     def validate(self, data):
         """
-            Check that exactly one of group_id or friend_id is provided.
+            Check that exactly one of group_id or friend_id is provided
+            and that the requested split adds up to the total.
         """
 
         if 'group_id' in data and 'friend_id' in data:
             raise serializers.ValidationError('Only one of group_id or friend_id is required')
         if 'group_id' not in data and 'friend_id' not in data:
             raise serializers.ValidationError('One of group_id or friend_id is required')
-        
+
+        if 'group_id' in data:
+            members = sorted(
+                GroupMember.objects.filter(group_id=data['group_id'].id).values_list('user_id', flat=True)
+            )
+        else:
+            members = [data['paid_by'].id, data['friend_id'].id]
+
+        splits = data.pop('splits', None)
+        items = data.pop('items', None)
+        if splits:
+            participants = [split['user_id'] for split in splits]
+            if len(set(participants)) != len(participants):
+                raise serializers.ValidationError('A user can only appear once in splits')
+            outsiders = set(participants) - set(members)
+            if outsiders:
+                raise serializers.ValidationError('Split users must be part of the expense')
+        else:
+            participants = members
+
+        values = {split['user_id']: split['value'] for split in splits or [] if 'value' in split}
+        try:
+            data['shares'] = split_allocator.allocate(
+                data['total_amount'], participants, data.pop('split_mode'), values, items
+            )
+        except split_allocator.SplitError as e:
+            raise serializers.ValidationError(str(e))
+
         return data
 
     def create(self, validated_data):
@@ -260,29 +326,17 @@ class ExpenseCreateSerializer(serializers.ModelSerializer):
         
         group_id = validated_data.pop('group_id', None).id if 'group_id' in validated_data else None
         friend_id = validated_data.pop('friend_id', None).id if 'friend_id' in validated_data else None
-        paid_by_id = validated_data.pop('paid_by').id if 'paid_by' in validated_data else None
-        remaining_amount = 0
-        # Calculate the remaining amount based on whether it's a group or friend expense
-        if group_id:
-            # For group expenses, we need to find how many members are in the group
-            group_members = GroupMember.objects.filter(group_id=group_id)
-            member_count = group_members.count()
-            
-            if member_count > 0:
-                # The person who paid is owed by everyone else
-                # So remaining amount is total minus their own share
-                payer_share = validated_data['total_amount'] / member_count
-                remaining_amount = validated_data['total_amount'] - payer_share
-            else:
-                # Edge case - if no members (shouldn't happen), set remaining to 0
-                remaining_amount = 0
-        elif friend_id:
-            # For friend expenses, it's a simple 50/50 split
-            remaining_amount = validated_data['total_amount'] / 2
-        else:
-            # Edge case - no group or friend (shouldn't happen)
-            remaining_amount = 0
-        # print(remaining_amount)
+        paid_by = validated_data.pop('paid_by', None)
+        paid_by_id = paid_by.id if paid_by else None
+        shares = validated_data.pop('shares')
+        # Expenses are recorded in the payer's currency unless one is given
+        if paid_by and not validated_data.get('currency'):
+            validated_data['currency'] = paid_by.currency
+
+        # The payer is owed everyone else's share
+        remaining_amount = sum(
+            (amount for user_id, amount in shares.items() if user_id != paid_by_id), Decimal('0')
+        )
         expense = Expense.objects.create(
             id=expense_id,
             friend_id=friend_id,
@@ -292,80 +346,113 @@ class ExpenseCreateSerializer(serializers.ModelSerializer):
             **validated_data
         )
         
-        # Splitting the expense amount among group members or a friend
-        if group_id:
-            group_members = GroupMember.objects.filter(group_id=group_id)
-            member_count = group_members.count()
-            
-            if member_count > 0:
-                split_amount = validated_data['total_amount'] / member_count
-                
-                for member in group_members:
-                    # Create a split for each member
-                    # The payer's split is marked as paid, others as unpaid
-                    is_payer = str(member.user_id) == str(paid_by_id)
-                    
-                    ExpenseSplit.objects.create(
-                        id=str(uuid.uuid4()),
-                        expense_id=expense_id,
-                        user_id=member.user_id,
-                        total_amount=split_amount,
-                        remaining_amount=0 if is_payer else split_amount,
-                        is_paid=is_payer
-                    )
-        elif friend_id:
-            # Create splits for a friend expense (just two people)
-            # Split for the payer
-            ExpenseSplit.objects.create(
-                id=str(uuid.uuid4()),
-                expense_id=expense_id,
-                user_id=paid_by_id,
-                total_amount=validated_data['total_amount'] / 2,
-                remaining_amount=0,
-                is_paid=True
-            )
-            
-            # Split for the friend
-            ExpenseSplit.objects.create(
+        # The payer's split (and any zero share) is marked as paid, others as unpaid
+        ExpenseSplit.objects.bulk_create([
+            ExpenseSplit(
                 id=str(uuid.uuid4()),
                 expense_id=expense_id,
-                user_id=friend_id,
-                total_amount=validated_data['total_amount'] / 2,
-                remaining_amount=validated_data['total_amount'] / 2,
-                is_paid=False
+                user_id=user_id,
+                total_amount=amount,
+                remaining_amount=0 if user_id == paid_by_id else amount,
+                is_paid=user_id == paid_by_id or amount == 0
             )
-        expense.save()
+            for user_id, amount in shares.items()
+        ])
         return expense
     
+class ImportExpensesSerializer(serializers.Serializer):
+    id_token = serializers.CharField(required=True)
+    file = serializers.FileField(required=True, allow_empty_file=False)
+    format = serializers.ChoiceField(choices=['csv', 'ndjson'], required=False)
+
+    def validate(self, data):
+        if 'format' not in data:
+            name = data['file'].name.lower()
+            if name.endswith('.csv'):
+                data['format'] = 'csv'
+            elif name.endswith(('.ndjson', '.jsonl')):
+                data['format'] = 'ndjson'
+            else:
+                raise serializers.ValidationError("format must be provided for this file type")
+        return data
+
+class UploadReceiptSerializer(serializers.Serializer):
+    id_token = serializers.CharField(required=True)
+    expense_id = serializers.CharField(required=True)
+    receipt = serializers.FileField(required=True, allow_empty_file=False)
+
+    def validate_receipt(self, value):
+        if value.size > receipts.MAX_RECEIPT_SIZE:
+            raise serializers.ValidationError('File size must be less than 10MB')
+        if value.content_type not in receipts.ALLOWED_CONTENT_TYPES:
+            raise serializers.ValidationError('Receipt must be a JPEG, PNG, WebP or PDF file')
+        return value
+
+class CreateRecurringExpenseSerializer(serializers.Serializer):
+    id_token = serializers.CharField(required=True)
+    group_id = serializers.CharField(required=False)
+    friend_id = serializers.CharField(required=False)
+    total_amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'))
+    currency = serializers.CharField(required=False, max_length=10)
+    description = serializers.CharField(required=False, allow_blank=True)
+    interval = serializers.ChoiceField(choices=['daily', 'weekly', 'monthly', 'yearly'], default='monthly')
+    interval_count = serializers.IntegerField(required=False, default=1, min_value=1, max_value=365)
+    start_at = serializers.DateTimeField(required=True)
+    end_at = serializers.DateTimeField(required=False)
+
+    def validate(self, data):
+        if ('group_id' in data) == ('friend_id' in data):
+            raise serializers.ValidationError('Exactly one of group_id or friend_id is required')
+        if 'end_at' in data and data['end_at'] < data['start_at']:
+            raise serializers.ValidationError('end_at must be after start_at')
+        return data
+
+class RecurringExpenseSerializer(serializers.Serializer):
+    id_token = serializers.CharField(required=True)
+    recurring_id = serializers.CharField(required=True)
+
 class ExpenseUpdateSerializer(serializers.ModelSerializer):
+    split_mode = serializers.ChoiceField(choices=split_allocator.SPLIT_MODES, required=False, write_only=True)
+    splits = SplitValueSerializer(many=True, required=False, write_only=True)
+    items = SplitItemSerializer(many=True, required=False, write_only=True)
+
     class Meta:
         model = Expense
-        fields = ['description', 'total_amount', 'deadline', 'receipt_url', 'remaining_amount', 'total_amount']
+        fields = ['description', 'total_amount', 'deadline', 'remaining_amount', 'total_amount',
+                  'split_mode', 'splits', 'items']
     
 class ExpenseGetSerializer(serializers.ModelSerializer):
     paid_by = serializers.CharField(source='paid_by.name', read_only=True)
-    friend_name = serializers.CharField(source='friend_id.full_name', read_only=True)
-    group_name = serializers.CharField(source='group_id.name', read_only=True)
+    friend_name = serializers.CharField(source='friend.full_name', read_only=True, allow_null=True)
+    group_name = serializers.CharField(source='group.name', read_only=True, allow_null=True)
 
     class Meta:
         model = Expense
         fields = ['id', 'paid_by', 'friend_name', 'group_name', 
-                 'total_amount', 'remaining_amount', 'description', 
-                 'created_at', 'deadline']
+                 'total_amount', 'remaining_amount', 'currency', 'description', 
+                 'created_at', 'updated_at', 'deadline', 'receipt_url', 'receipt_thumbnail_url']
 
 class SettlementPaymentSerializer(serializers.Serializer):
     id_token = serializers.CharField(required=True)
     user_id = serializers.CharField(required=False)
     group_id = serializers.CharField(required=False)
-    amount = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
-    settle_all = serializers.BooleanField(required=False)
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, min_value=Decimal('0.01'))
+    settle_all = serializers.BooleanField(required=False, default=False)
     description = serializers.CharField(required=False)
+    idempotency_key = serializers.CharField(required=False, max_length=128)
 
     def validate(self, data):
         if 'user_id' not in data and 'group_id' not in data:
             raise serializers.ValidationError("Either user_id or group_id must be provided")
+        if 'amount' not in data and not data.get('settle_all'):
+            raise serializers.ValidationError("Either amount or settle_all must be provided")
         return data
     
+class PaymentsFeedSerializer(serializers.Serializer):
+    id_token = serializers.CharField(required=True)
+    cursor = serializers.IntegerField(required=False, default=0, min_value=0)
+    limit = serializers.IntegerField(required=False, default=100, min_value=1, max_value=500)
+
 class GetSettlementDataSerializer(serializers.Serializer):
     id_token = serializers.CharField(required=True)
     friend_id = serializers.CharField(required=False, allow_null=True)
@@ -390,6 +477,11 @@ class InvitePersonSerializer(serializers.Serializer):
     invited_id = serializers.CharField(required=True)
     group_id = serializers.CharField(required=True)
 
+class BulkInviteSerializer(serializers.Serializer):
+    id_token = serializers.CharField(required=True)
+    group_id = serializers.CharField(required=True)
+    user_ids = serializers.ListField(child=serializers.CharField(), allow_empty=False, max_length=100)
+
 class LeaveGroupSerializer(serializers.Serializer):
     id_token = serializers.CharField(required=True)
     group_id = serializers.CharField(required=True)
@@ -402,6 +494,10 @@ class AcceptGroupInviteSerializer(serializers.Serializer):
     id_token = serializers.CharField(required=True)
     invite_id = serializers.CharField(required=True)
 
+class BulkAcceptGroupInvitesSerializer(serializers.Serializer):
+    id_token = serializers.CharField(required=True)
+    invite_ids = serializers.ListField(child=serializers.CharField(), allow_empty=False, max_length=100)
+
 class GetUserInvitesSerializer(serializers.Serializer):
     id_token = serializers.CharField(required=True)
 
@@ -429,6 +525,10 @@ class DeleteGroupSerializer(serializers.Serializer):
     id_token = serializers.CharField(required=True)
     group_id = serializers.CharField(required=True)
 
+class DeletionJobStatusSerializer(serializers.Serializer):
+    id_token = serializers.CharField(required=True)
+    job_id = serializers.CharField(required=True)
+
 class EditGroupSerializer(serializers.Serializer):
     id_token = serializers.CharField(required=True)
     group_id = serializers.CharField(required=True)
@@ -18,28 +18,42 @@ urlpatterns = [
     path('api/update-user-profile/',views.update_user_profile, name='update_user_profile'),
     path('api/send-friend-request/',views.send_friend_request, name='send_friend_request'),
     path('api/accept-friend-request/',views.accept_friend_request, name='accept_friend_request'),
+    path('api/send-friend-requests/', views.send_friend_requests, name='send_friend_requests'),
     path('api/remove-friend/',views.remove_friend, name='remove_friend'),
     path('api/block-user/',views.block_user, name='block_user'),
     path('api/update-profile-photo/',views.upload_profile_picture, name='update_profile_photo'),
     path('api/reset-profile-photo/',views.reset_profile_picture, name='reset_profile_photo'),
+    path('api/profile-picture-upload-url/', views.profile_picture_upload_url, name='profile_picture_upload_url'),
+    path('api/confirm-profile-picture/', views.confirm_profile_picture, name='confirm_profile_picture'),
+    path('api/local-storage-upload/', views.local_storage_upload, name='local_storage_upload'),
     path('api/get-direct-messages/',views.get_direct_messages, name='get_direct_messages'),
     path('api/get-group-messages/',views.get_group_messages, name='get_group_messages'),
     path('api/send-direct-message/',views.send_direct_message, name='send_direct_message'),
     path('api/search-user/',views.search_user, name='search_user'),
+    path('api/autocomplete-user/', views.autocomplete_user, name='autocomplete_user'),
     path('api/create-expense/', views.create_expense, name='create_expense'),
+    path('api/import-expenses/', views.import_expenses, name='import_expenses'),
+    path('api/upload-receipt/', views.upload_receipt, name='upload_receipt'),
+    path('api/create-recurring-expense/', views.create_recurring_expense, name='create_recurring_expense'),
+    path('api/get-recurring-expenses/', views.get_recurring_expenses, name='get_recurring_expenses'),
+    path('api/cancel-recurring-expense/', views.cancel_recurring_expense, name='cancel_recurring_expense'),
     path('api/transactions/', views.transactions, name='transactions'),
     path('api/update-expense/', views.update_expense, name='update_expense'),
     path('api/get-expense-detail/', views.get_expense_detail, name='get_expense_detail'),
     path('api/record-payment/', views.record_payment, name='record_payment'),
+    path('api/payments-feed/', views.payments_feed, name='payments_feed'),
     path('api/delete-expense/', views.delete_expense, name='delete_expense'),
     path('api/reject-friend-request/', views.reject_friend_request, name='reject_friend_request'),
     path('api/remove-friend/', views.remove_friend, name='remove_friend'),
     path('api/group-info/', views.get_group_info, name='get_group_info'),
+    path('api/group-summary/', views.get_group_summary, name='get_group_summary'),
     path('api/create-group/', views.create_group, name='create_group'),
     path('api/group-invite/',views.invite_to_group, name='group_invite'),
+    path('api/group-invite-bulk/', views.invite_users_to_group, name='group_invite_bulk'),
     path('api/leave-group/',views.leave_group, name='leave_group'),
     path('api/get-user-groups/',views.get_user_groups, name='get_user_groups'),
     path('api/accept-group-invite/',views.accept_group_invite, name='accept_group_invite'),
+    path('api/accept-group-invites/', views.accept_group_invites, name='accept_group_invites'),
     path('api/reject-group-invite/',views.reject_group_invite, name='reject_group_invite'),
     path('api/get-user-invites/',views.get_user_invites, name='get_user_invites'),
     path('api/cancel-group-invite/',views.cancel_group_invite, name='cancel_group_invite'),
@@ -48,8 +62,10 @@ urlpatterns = [
     path('api/send-group-message/',views.send_group_message, name='send_group_message'),
     path('api/search-invite/',views.invite_search, name='invite_search'),
     path('api/delete-group/',views.delete_group, name='delete_group'),
+    path('api/deletion-job-status/', views.deletion_job_status, name='deletion_job_status'),
     path('api/edit-group/',views.edit_group, name='edit_group'),
     path('api/remove-from-group/',views.remove_from_group, name='remove_from_group'),
     path('api/get-direct-messages-between-users/', views.get_direct_messages_between_users, name='get_direct_messages_between_users'),
     path('api/delete-profile/', views.delete_user_profile, name='delete_user_profile'),
+    path('api/metrics/', views.metrics_view, name='metrics'),
 ]
\ No newline at end of file
@@ -2,15 +2,19 @@ from rest_framework.reverse import reverse
 from rest_framework.response import Response
 from rest_framework.decorators import api_view
 from rest_framework import status
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
 from cliquepay.aws_cognito import CognitoService
 from cliquepay.db_service import DatabaseService
 from .serializers import *
-from cliquepay.storage_service import CloudStorageService
+from cliquepay.storage_service import get_storage_service
+from cliquepay import avatars, expense_import, friend_versions, fx, metrics, receipts, split_allocator
 from api.serializers import SearchUserSerializer, GetDirectMessagesBetweenUsersSerializer, GetDirectMessagesSerializer, GetGroupMessagesSerializer, InviteSearchListSerializer
+import hmac
 import logging
-from django.db import models
+from django.db import models, transaction
 from datetime import datetime
+from django.utils.dateparse import parse_datetime
 
 logger = logging.getLogger(__name__)
 
@@ -70,7 +74,7 @@ def api_root(request, format=None):
             'get-user-friends': {
                 'url': reverse('get_user_friends', request=request, format=format),
                 'method': 'POST',
-                'description': 'Extracts the user_sub from ID token,gets the user_id from database using user_sub and then makes a db query to get user friends using the user_id.'
+                'description': 'Extracts the user_sub from ID token,gets the user_id from database using user_sub and then makes a db query to get user friends using the user_id. Supports cursor pagination, ETag / If-None-Match and since_version deltas.'
             },
             'user-access': {
                 'url': reverse('verify_user_access', request=request, format=format),
@@ -92,6 +96,11 @@ def api_root(request, format=None):
                 'method': 'POST',
                 'description': 'send friend request to mentioned user.'
             },
+            'send-friend-requests': {
+                'url': reverse('send_friend_requests', request=request, format=format),
+                'method': 'POST',
+                'description': 'send friend requests to several users at once.'
+            },
             'accept-friend-request': {
                 'url': reverse('accept_friend_request', request=request, format=format),
                 'method': 'POST',
@@ -107,6 +116,16 @@ def api_root(request, format=None):
                 'method': 'POST',
                 'description': 'updates profile photo in the cloud.'
             },
+            'profile-picture-upload-url': {
+                'url': reverse('profile_picture_upload_url', request=request, format=format),
+                'method': 'POST',
+                'description': 'get a signed URL to upload a profile photo directly to storage.'
+            },
+            'confirm-profile-picture': {
+                'url': reverse('confirm_profile_picture', request=request, format=format),
+                'method': 'POST',
+                'description': 'confirm a direct profile photo upload.'
+            },
             'reset-profile-photo': {
                 'url': reverse('reset_profile_photo', request=request, format=format),
                 'method': 'POST',
@@ -132,6 +151,11 @@ def api_root(request, format=None):
                 'method': 'POST',
                 'description': 'search user by username or email.'
             },
+            'autocomplete-user': {
+                'url': reverse('autocomplete_user', request=request, format=format),
+                'method': 'POST',
+                'description': 'autocomplete users by username or name prefix.'
+            },
             'reject-friend-request': {
                 'url': reverse('reject_friend_request', request=request, format=format),
                 'method': 'POST',
@@ -147,6 +171,31 @@ def api_root(request, format=None):
                 'method': 'POST',
                 'description': 'create expense.'
             },
+            'import-expenses': {
+                'url': reverse('import_expenses', request=request, format=format),
+                'method': 'POST',
+                'description': 'bulk import expenses from a CSV or NDJSON file.'
+            },
+            'upload-receipt': {
+                'url': reverse('upload_receipt', request=request, format=format),
+                'method': 'POST',
+                'description': 'upload a receipt for an expense.'
+            },
+            'create-recurring-expense': {
+                'url': reverse('create_recurring_expense', request=request, format=format),
+                'method': 'POST',
+                'description': 'schedule an expense that repeats every interval.'
+            },
+            'get-recurring-expenses': {
+                'url': reverse('get_recurring_expenses', request=request, format=format),
+                'method': 'POST',
+                'description': 'get active recurring expenses.'
+            },
+            'cancel-recurring-expense': {
+                'url': reverse('cancel_recurring_expense', request=request, format=format),
+                'method': 'POST',
+                'description': 'stop a recurring expense.'
+            },
             'transactions': {
                 'url': reverse('transactions', request=request, format=format),
                 'method': 'POST',
@@ -163,6 +212,11 @@ def api_root(request, format=None):
                 'method':'POST',
                 'description':'get group information.'
             },
+            'get-group-summary':{
+                'url':reverse('get_group_summary', request=request, format=format),
+                'method':'POST',
+                'description':'get group totals and per-member balances.'
+            },
             'create-group':{
                 'url':reverse('create_group', request=request, format=format),
                 'method':'POST',
@@ -173,6 +227,11 @@ def api_root(request, format=None):
                 'method':'POST',
                 'description':'invite user to group.'
             },
+            'group-invite-bulk':{
+                'url':reverse('group_invite_bulk', request=request, format=format),
+                'method':'POST',
+                'description':'invite several users to a group at once.'
+            },
             'leave-group':{
                 'url':reverse('leave_group', request=request, format=format),
                 'method':'POST',
@@ -188,6 +247,11 @@ def api_root(request, format=None):
                 'method':'POST',
                 'description':'accept group invite.'
             },
+            'accept-group-invites':{
+                'url':reverse('accept_group_invites', request=request, format=format),
+                'method':'POST',
+                'description':'accept several group invites at once.'
+            },
             'reject-group-invite':{
                 'url':reverse('reject_group_invite', request=request, format=format),
                 'method':'POST',
@@ -213,6 +277,11 @@ def api_root(request, format=None):
                 'method':'POST',
                 'description':'get financial summary.'
             },
+            'payments-feed':{
+                'url':reverse('payments_feed', request=request, format=format),
+                'method':'POST',
+                'description':'get payments made or received since a cursor.'
+            },
             'get-settlement-data':{
                 'url':reverse('get_settlement_data', request=request, format=format),
                 'method':'POST',
@@ -231,7 +300,12 @@ def api_root(request, format=None):
             'delete-group':{
                 'url':reverse('delete_group', request=request, format=format),
                 'method':'POST',
-                'description':'delete group.'
+                'description':'delete group in a background job, returns the job id.'
+            },
+            'deletion-job-status':{
+                'url':reverse('deletion_job_status', request=request, format=format),
+                'method':'POST',
+                'description':'progress of a group deletion job.'
             },
             'edit-group':{
                 'url':reverse('edit_group', request=request, format=format),
@@ -248,6 +322,11 @@ def api_root(request, format=None):
                 'method': 'POST',
                 'description': 'Delete user profile and deactivate account.'
             },
+            'metrics': {
+                'url': reverse('metrics', request=request, format=format),
+                'method': 'GET',
+                'description': 'Prometheus metrics of this process, requires the METRICS_TOKEN bearer token.'
+            },
         },
         'version': '1.0.0',
         'status': 'online',
@@ -351,7 +430,6 @@ def user_login(request):
             result = cognito.login_user(username=req['username'],
             password= serializer.validated_data['password'])
             if result['status'] == 'SUCCESS':
-                print(req)
                 return Response({
                     'status': 'success',
                     'message': result['message'],
@@ -492,11 +570,17 @@ def confirm_reset_password(request):
 @api_view(['POST'])
 def get_user_friends(request):
     """
-    Confirm password reset with code
-    
+    Get the user's friendships, newest first.
+    The response carries an ETag; send it back in If-None-Match to get a
+    304 when nothing changed, or pass the returned version as since_version
+    to get only the friendships changed since.
+
     Request body:
     {
         "id_token": "QwErTYuioP",
+        "cursor": "next-cursor",  # Optional, from the previous page
+        "limit": 50,  # Optional, max 200, everything when omitted
+        "since_version": 12  # Optional, delta mode
     }
     """
     serializer = GetUserFriendsSerializer(data=request.data)
@@ -505,9 +589,20 @@ def get_user_friends(request):
         firstResult = cognito.get_user_id(serializer.validated_data['id_token'])
         if firstResult['status'] == 'SUCCESS':
             db = DatabaseService()
-            result = db.get_user_friends(firstResult.get('user_sub'))
-            if result['status'] == 'SUCCESS':
-                return Response(result, status=status.HTTP_200_OK)
+            user_sub = firstResult.get('user_sub')
+            params = {key: serializer.validated_data.get(key) for key in ('cursor', 'limit', 'since_version')}
+
+            version = db.get_friends_version(user_sub)
+            if version['status'] == 'SUCCESS':
+                etag = friend_versions.etag(user_sub, version['version'], *params.values())
+                if etag in request.headers.get('If-None-Match', ''):
+                    return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+                result = db.get_user_friends(user_sub, **params)
+                if result['status'] == 'SUCCESS':
+                    # Rows may be newer than the version read above, never older
+                    return Response(result, status=status.HTTP_200_OK, headers={'ETag': etag})
+                return Response(result, status=status.HTTP_400_BAD_REQUEST)
         
         return Response({
             'status': 'error',
@@ -633,14 +728,14 @@ def change_password(request):
 def update_user_profile(request):
     """
     Updates the user's profile fields using an id_token
-    and optional fields like full_name, phone_number, avatar_url, currency, etc.
+    and optional fields like full_name, phone_number, currency, etc.
+    The profile picture is changed through confirm-profile-picture.
 
     Request Body:
     {
         "id_token": "your-id-token",
         "full_name": "New Name",  # optional
         "phone_number": "+1234567890",  # optional
-        "avatar_url": "https://example.com/avatar.jpg",  # optional
         "currency": "USD"  # optional
     }
     """
@@ -653,7 +748,6 @@ def update_user_profile(request):
             update_result = db.update_user_details(decoded['user_sub'],
                 full_name=serializer.validated_data.get('full_name'),
                 phone_number=serializer.validated_data.get('phone_number'),
-                avatar_url=serializer.validated_data.get('avatar_url'),
                 currency=serializer.validated_data.get('currency')
             )
             if update_result['status'] == 'SUCCESS':
@@ -716,6 +810,38 @@ def send_friend_request(request):
         'errors': serializer.errors
     }, status=status.HTTP_400_BAD_REQUEST)    
 
+@api_view(['POST'])
+def send_friend_requests(request):
+    """
+    Send friend requests to up to 100 users in one call.
+    Users that cannot be sent a request are listed in "errors".
+
+    Request Body:
+    {
+        "id_token": "user-id-token",
+        "user_ids": ["user-id", "user-id"]
+    }
+    """
+    serializer = BulkFriendRequestSerializer(data=request.data)
+    if serializer.is_valid():
+        cognito = CognitoService()
+        decoded = cognito.get_user_id(serializer.validated_data['id_token'])
+        if decoded['status'] == 'SUCCESS':
+            db = DatabaseService()
+            result = db.send_friend_requests(
+                cognito_id=decoded['user_sub'],
+                user_ids=serializer.validated_data['user_ids']
+            )
+            if result['status'] == 'SUCCESS':
+                return Response(result, status=status.HTTP_200_OK)
+            return Response(result, status=status.HTTP_400_BAD_REQUEST)
+        return Response(decoded, status=status.HTTP_401_UNAUTHORIZED)
+    return Response({
+        'status': 'error',
+        'message': 'Invalid input',
+        'errors': serializer.errors
+    }, status=status.HTTP_400_BAD_REQUEST)
+
 @api_view(['POST'])
 def accept_friend_request(request):
     """
@@ -776,7 +902,9 @@ def block_user(request):
 @api_view(['POST'])
 def upload_profile_picture(request):
     """
-    Upload a profile picture for the user.
+    Upload a profile picture for the user through the API server.
+    Prefer profile-picture-upload-url + confirm-profile-picture, which
+    upload straight to storage.
     
     Request Body:
     {
@@ -793,12 +921,13 @@ def upload_profile_picture(request):
             user = db.get_user_by_cognito_id(getId['user_sub'])
             
             if user['status'] == 'SUCCESS':
-                storage = CloudStorageService()
+                storage = get_storage_service()
                 try:
-                    # Upload the new profile picture
+                    # Upload the new profile picture under the user's own prefix,
+                    # the old one is deleted in the background
                     new_url = storage.upload_profile_picture(
                         serializer.validated_data['profile_picture'],
-                        user['user_data'].get('avatar_url')
+                        prefix=avatars.picture_prefix(user['user_data']['id'])
                     )
                     
                     if new_url:
@@ -809,6 +938,12 @@ def upload_profile_picture(request):
                         )
                         
                         if update_result['status'] == 'SUCCESS':
+                            avatars.schedule_delete(
+                                user['user_data']['id'],
+                                user['user_data'].get('profile_photo'),
+                                user['user_data'].get('avatar_variants')
+                            )
+                            avatars.schedule_variants(user['user_data']['id'], new_url)
                             return Response({
                                 'status': 'success',
                                 'message': 'Profile picture updated successfully',
@@ -846,7 +981,7 @@ def upload_profile_picture(request):
                             },
                             'user_info': {
                                 'cognito_id': getId['user_sub'],
-                                'current_avatar': user['user_data'].get('avatar_url')
+                                'current_avatar': user['user_data'].get('profile_photo')
                             }
                         }
                     }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -868,6 +1003,116 @@ def upload_profile_picture(request):
         }
     }, status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(['POST'])
+def profile_picture_upload_url(request):
+    """
+    Issue a signed URL the client uploads a new profile picture to directly.
+    Follow up with confirm-profile-picture once the upload has finished.
+
+    Request Body:
+    {
+        "id_token": "your-id-token",
+        "content_type": "image/jpeg|image/png|image/webp|image/gif"
+    }
+
+    Returns the object key, the upload URL and the headers to send with the PUT.
+    """
+    serializer = ProfilePictureUploadUrlSerializer(data=request.data)
+    if serializer.is_valid():
+        cognito = CognitoService()
+        decoded = cognito.get_user_id(serializer.validated_data['id_token'])
+        if decoded['status'] != 'SUCCESS':
+            return Response(decoded, status=status.HTTP_401_UNAUTHORIZED)
+        try:
+            user = User.objects.get(cognito_id=decoded['user_sub'])
+        except User.DoesNotExist:
+            return Response({
+                'status': 'error',
+                'message': 'User not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        upload = avatars.create_upload(user, serializer.validated_data['content_type'])
+        return Response({
+            'status': 'success',
+            'message': 'Upload URL created successfully',
+            'upload': upload
+        }, status=status.HTTP_200_OK)
+
+    return Response({
+        'status': 'error',
+        'message': 'Invalid input',
+        'errors': serializer.errors
+    }, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['POST'])
+def confirm_profile_picture(request):
+    """
+    Verify a directly uploaded profile picture and make it the user's avatar.
+    The previous picture is deleted in the background.
+
+    Request Body:
+    {
+        "id_token": "your-id-token",
+        "key": "profile_pictures/<user-id>/<file>"  # from profile-picture-upload-url
+    }
+    """
+    serializer = ConfirmProfilePictureSerializer(data=request.data)
+    if serializer.is_valid():
+        cognito = CognitoService()
+        decoded = cognito.get_user_id(serializer.validated_data['id_token'])
+        if decoded['status'] != 'SUCCESS':
+            return Response(decoded, status=status.HTTP_401_UNAUTHORIZED)
+        try:
+            user = User.objects.get(cognito_id=decoded['user_sub'])
+            avatar_url = avatars.confirm_upload(user, serializer.validated_data['key'])
+        except User.DoesNotExist:
+            return Response({
+                'status': 'error',
+                'message': 'User not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+        except avatars.AvatarUploadError as e:
+            return Response({
+                'status': 'error',
+                'message': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'status': 'success',
+            'message': 'Profile picture updated successfully',
+            'avatar_url': avatar_url
+        }, status=status.HTTP_200_OK)
+
+    return Response({
+        'status': 'error',
+        'message': 'Invalid input',
+        'errors': serializer.errors
+    }, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['PUT'])
+def local_storage_upload(request):
+    """
+    Stand-in for a signed storage URL when STORAGE_BACKEND is 'local'.
+    Accepts the raw object body for a token issued by the local backend.
+    """
+    storage = get_storage_service()
+    payload = storage.read_upload_token(request.query_params.get('token', '')) \
+        if hasattr(storage, 'read_upload_token') else None
+    if payload is None:
+        return Response({
+            'status': 'error',
+            'message': 'Invalid or expired upload token'
+        }, status=status.HTTP_403_FORBIDDEN)
+
+    content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    if not content_length or content_length > payload['max_size']:
+        return Response({
+            'status': 'error',
+            'message': 'Upload is empty or too large'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    storage.upload_stream(request.stream, payload['key'], payload['content_type'])
+    return Response(status=status.HTTP_200_OK)
+
 @api_view(['POST'])
 def reset_profile_picture(request):
     """
@@ -887,12 +1132,10 @@ def reset_profile_picture(request):
             user = db.get_user_by_cognito_id(getId['user_sub'])
             
             if user['status'] == 'SUCCESS':
-                storage = CloudStorageService()
+                storage = get_storage_service()
                 try:
-                    # Reset the profile picture and get default URL
-                    default_url = storage.reset_profile_picture(
-                        user['user_data'].get('avatar_url')
-                    )
+                    # Get the default URL, the current picture is deleted in the background
+                    default_url = storage.reset_profile_picture(None)
                     
                     if default_url:
                         # Update the profile photo URL in the database
@@ -902,6 +1145,11 @@ def reset_profile_picture(request):
                         )
                         
                         if update_result['status'] == 'SUCCESS':
+                            avatars.schedule_delete(
+                                user['user_data']['id'],
+                                user['user_data'].get('profile_photo'),
+                                user['user_data'].get('avatar_variants')
+                            )
                             return Response({
                                 'status': 'success',
                                 'message': 'Profile picture reset successfully',
@@ -952,8 +1200,6 @@ def get_direct_messages(request):
         decoded = cognito.get_user_id(serializer.validated_data['id_token'])
         if decoded['status'] == 'SUCCESS':
             db = DatabaseService()
-            print(f"Decoded token: {decoded}")
-            print(f"user_sub: {decoded['user_sub']}")
             result = db.get_direct_messages(decoded['user_sub'], serializer.validated_data.get('page'), serializer.validated_data.get('page_size')) 
             if result['status'] == 'SUCCESS':
                 return JsonResponse(result, status=status.HTTP_200_OK)
@@ -1069,6 +1315,37 @@ def search_user(request):
     }, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['POST'])
+def autocomplete_user(request):
+    """
+    Autocomplete users by the start of their username or full name,
+    for search-as-you-type. Served from an in-memory index.
+    
+    Request Body:
+    {
+        id_token: "your-id-token",
+        query: "ab",
+        limit (optional) : 10,
+    }
+    """
+    serializer = SearchUserSerializer(data=request.data)
+    if serializer.is_valid():
+        cognito = CognitoService()
+        decoded = cognito.get_user_id(serializer.validated_data['id_token'])
+        if decoded['status'] == 'SUCCESS':
+            db = DatabaseService()
+            result = db.autocomplete_users(decoded['user_sub'], serializer.validated_data['query'], serializer.validated_data.get('limit'))
+            if result['status'] == 'SUCCESS':
+                return Response(result, status=status.HTTP_200_OK)
+            return JsonResponse(result, status=status.HTTP_400_BAD_REQUEST)
+        return JsonResponse(decoded, status=status.HTTP_401_UNAUTHORIZED)
+    return JsonResponse({
+        'status': 'error',
+        'message': 'Invalid input',
+        'errors': serializer.errors
+    }, status=status.HTTP_400_BAD_REQUEST)
+
+
 @api_view(['POST'])
 def create_expense(request):
     """
@@ -1081,7 +1358,9 @@ def create_expense(request):
         "description": "Expense description",
         "paid_by": "user-id",
         "deadline": "2021-12-31",
-        "receipt_url": "https://example.com/receipt.jpg"  # Optional
+        "split_mode": "equal|exact|percentage|shares|itemized",  # Optional, default equal
+        "splits": [{"user_id": "user-id", "value": 25.00}],  # Optional, default all members
+        "items": [{"amount": 12.50, "user_ids": ["user-id"]}]  # Itemized mode only
     }
     
     Returns:
@@ -1101,7 +1380,7 @@ def create_expense(request):
         request_data['paid_by'] = user_id
         
     except Exception as e:
-        print(f"Token verification error: {str(e)}")
+        logger.info("Token verification error: %s", e)
         return Response({
             "status": "error",
             "message": "Invalid token"
@@ -1115,7 +1394,9 @@ def create_expense(request):
             "errors": serializer.errors if not is_valid else None
         })
     
-    serializer.save()
+    # Expense and its splits are written together
+    with transaction.atomic():
+        serializer.save()
     
     return Response(
         {
@@ -1126,10 +1407,163 @@ def create_expense(request):
         status=status.HTTP_201_CREATED
     )
 
+@api_view(['POST'])
+def import_expenses(request):
+    """
+    Import a batch of expenses paid by the authenticated user from a
+    CSV or NDJSON file. Rows are validated and inserted in chunks; invalid
+    rows are skipped and reported with their row number.
+
+    Request Body (multipart):
+    {
+        "id_token": "your-id-token",
+        "file": file,  # columns: group_id|friend_id, total_amount, description, deadline, receipt_url
+        "format" (optional): "csv|ndjson"  # inferred from the file name otherwise
+    }
+    """
+    serializer = ImportExpensesSerializer(data=request.data)
+    if serializer.is_valid():
+        cognito = CognitoService()
+        decoded = cognito.get_user_id(serializer.validated_data['id_token'])
+        if decoded['status'] != 'SUCCESS':
+            return Response(decoded, status=status.HTTP_401_UNAUTHORIZED)
+
+        db = DatabaseService()
+        user = db.get_user_id_by_cognito_id(decoded['user_sub'])
+        if user['status'] != 'SUCCESS':
+            return Response(user, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            summary = expense_import.import_expenses(
+                expense_import.iter_rows(serializer.validated_data['file'], serializer.validated_data['format']),
+                payer_id=user['user_id']
+            )
+        except Exception as e:
+            return Response({
+                'status': 'error',
+                'message': f'Error importing expenses: {str(e)}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'status': 'SUCCESS',
+            'message': 'Import finished',
+            **summary
+        }, status=status.HTTP_200_OK)
+
+    return Response({
+        'status': 'error',
+        'message': 'Invalid input',
+        'errors': serializer.errors
+    }, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['POST'])
+def create_recurring_expense(request):
+    """
+    Schedule an expense that is recreated automatically every interval.
+
+    Request Body:
+    {
+        "id_token": "your-id-token",
+        "group_id": "group-id" OR "friend_id": "friend-id",
+        "total_amount": 1200.00,
+        "currency" (optional): "EUR",  # defaults to the user's currency
+        "description": "Rent",
+        "interval": "daily|weekly|monthly|yearly",
+        "interval_count" (optional): 1,
+        "start_at": "2025-05-01T00:00:00Z",
+        "end_at" (optional): "2026-05-01T00:00:00Z"
+    }
+    """
+    serializer = CreateRecurringExpenseSerializer(data=request.data)
+    if serializer.is_valid():
+        cognito = CognitoService()
+        decoded = cognito.get_user_id(serializer.validated_data['id_token'])
+        if decoded['status'] == 'SUCCESS':
+            db = DatabaseService()
+            result = db.create_recurring_expense(
+                cognito_id=decoded['user_sub'],
+                total_amount=serializer.validated_data['total_amount'],
+                interval=serializer.validated_data['interval'],
+                start_at=serializer.validated_data['start_at'],
+                group_id=serializer.validated_data.get('group_id'),
+                friend_id=serializer.validated_data.get('friend_id'),
+                description=serializer.validated_data.get('description', ''),
+                interval_count=serializer.validated_data['interval_count'],
+                end_at=serializer.validated_data.get('end_at'),
+                currency=serializer.validated_data.get('currency')
+            )
+            if result['status'] == 'SUCCESS':
+                return Response(result, status=status.HTTP_201_CREATED)
+            return Response(result, status=status.HTTP_400_BAD_REQUEST)
+        return Response(decoded, status=status.HTTP_401_UNAUTHORIZED)
+    return Response({
+        'status': 'error',
+        'message': 'Invalid input',
+        'errors': serializer.errors
+    }, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['POST'])
+def get_recurring_expenses(request):
+    """
+    Get the active recurring expenses of the user.
+
+    Request Body:
+    {
+        "id_token": "your-id-token"
+    }
+    """
+    serializer = GetUserGroupsSerializer(data=request.data)
+    if serializer.is_valid():
+        cognito = CognitoService()
+        decoded = cognito.get_user_id(serializer.validated_data['id_token'])
+        if decoded['status'] == 'SUCCESS':
+            db = DatabaseService()
+            result = db.get_recurring_expenses(decoded['user_sub'])
+            if result['status'] == 'SUCCESS':
+                return Response(result, status=status.HTTP_200_OK)
+            return Response(result, status=status.HTTP_400_BAD_REQUEST)
+        return Response(decoded, status=status.HTTP_401_UNAUTHORIZED)
+    return Response({
+        'status': 'error',
+        'message': 'Invalid input',
+        'errors': serializer.errors
+    }, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['POST'])
+def cancel_recurring_expense(request):
+    """
+    Stop a recurring expense. Expenses already created are kept.
+
+    Request Body:
+    {
+        "id_token": "your-id-token",
+        "recurring_id": "recurring-expense-id"
+    }
+    """
+    serializer = RecurringExpenseSerializer(data=request.data)
+    if serializer.is_valid():
+        cognito = CognitoService()
+        decoded = cognito.get_user_id(serializer.validated_data['id_token'])
+        if decoded['status'] == 'SUCCESS':
+            db = DatabaseService()
+            result = db.cancel_recurring_expense(
+                cognito_id=decoded['user_sub'],
+                recurring_id=serializer.validated_data['recurring_id']
+            )
+            if result['status'] == 'SUCCESS':
+                return Response(result, status=status.HTTP_200_OK)
+            return Response(result, status=status.HTTP_400_BAD_REQUEST)
+        return Response(decoded, status=status.HTTP_401_UNAUTHORIZED)
+    return Response({
+        'status': 'error',
+        'message': 'Invalid input',
+        'errors': serializer.errors
+    }, status=status.HTTP_400_BAD_REQUEST)
+
 @api_view(['GET'])
 def transactions(request):
     """
-    Get all transactions for the authenticated user, including:
+    Get one page of transactions for the authenticated user, including:
     - Expenses they paid for
     - Expenses they owe money for
     - Expenses they're involved with in any way
@@ -1137,7 +1571,10 @@ def transactions(request):
     Query Parameters:
     {
         "idToken": "your-id-token",
-        "filter": "all|paid|owed"  # Optional, defaults to "all"
+        "filter": "all|paid|owed",  # Optional, defaults to "all"
+        "cursor": "next-cursor",  # Optional, from the previous page
+        "since": "2025-04-01T00:00:00Z",  # Optional, only expenses changed after this
+        "limit": 50  # Optional, max 200
     }
     """
     try:
@@ -1149,6 +1586,23 @@ def transactions(request):
                 "status": "error",
                 "message": "idToken is required as a query parameter"
             }, status=status.HTTP_400_BAD_REQUEST)
+
+        since = request.query_params.get('since')
+        if since:
+            since = parse_datetime(since)
+            if since is None:
+                return Response({
+                    "status": "error",
+                    "message": "since must be an ISO 8601 datetime"
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            limit = min(max(int(request.query_params.get('limit', 50)), 1), 200)
+        except ValueError:
+            return Response({
+                "status": "error",
+                "message": "limit must be an integer"
+            }, status=status.HTTP_400_BAD_REQUEST)
             
         try:
             cognito = CognitoService()
@@ -1158,35 +1612,34 @@ def transactions(request):
             user_id = db.get_user_id_by_cognito_id(firstResult['user_sub'])['user_id']
             
         except Exception as e:
-            print(f"Token verification error: {str(e)}")
+            logger.info("Token verification error: %s", e)
             return Response({
                 "status": "error",
                 "message": "Invalid token"
             }, status=status.HTTP_401_UNAUTHORIZED)
         
-        # Query expenses based on filter
-        if filter_type == 'paid':
-            # Expenses the user paid for
-            expenses = Expense.objects.filter(paid_by=user_id)
-        elif filter_type == 'owed':
-            # Expenses where the user owes money
-            expenses = Expense.objects.filter(
-                splits__user=user_id,
-                splits__is_paid=False
-            ).exclude(paid_by=user_id)
-        else:
-            # All expenses the user is involved with (default)
-            expenses = Expense.objects.filter(
-                models.Q(paid_by=user_id) | 
-                models.Q(splits__user=user_id)
-            ).distinct()
+        result = db.get_transactions(
+            user_id,
+            filter_type=filter_type,
+            cursor=request.query_params.get('cursor'),
+            since=since,
+            limit=limit
+        )
+        if result['status'] != 'SUCCESS':
+            return Response({
+                "status": "error",
+                "message": result['message']
+            }, status=status.HTTP_400_BAD_REQUEST)
 
-        serializer = ExpenseGetSerializer(expenses, many=True)
+        serializer = ExpenseGetSerializer(result['expenses'], many=True)
         
         return Response({
             "status": "Returned",
             "message": "Expenses fetched successfully",
             "expenses": serializer.data,
+            "next_cursor": result['next_cursor'],
+            "has_more": result['has_more'],
+            "synced_at": result['synced_at'],
         })
         
     except Exception as e:
@@ -1199,6 +1652,7 @@ def transactions(request):
 def update_expense(request):
     """
     Update an existing expense record in the database.
+    If total_amount changes, the splits are rescaled in the same transaction.
     
     Request Body:
     {
@@ -1207,8 +1661,10 @@ def update_expense(request):
         "total_amount": 100.00,       # Optional
         "description": "Updated description",  # Optional
         "deadline": "2021-12-31",     # Optional
-        "receipt_url": "https://example.com/receipt.jpg",  # Optional
-        "remaining_amount": 50.00     # Optional
+        "remaining_amount": 50.00,    # Optional, ignored when the splits change
+        "split_mode": "equal|exact|percentage|shares|itemized",  # Optional, re-splits the current members
+        "splits": [{"user_id": "user-id", "value": 25.00}],  # Optional
+        "items": [{"amount": 12.50, "user_ids": ["user-id"]}]  # Itemized mode only
     }
     """
     try:
@@ -1219,51 +1675,58 @@ def update_expense(request):
                 "status": "error",
                 "message": "expense_id is required"
             }, status=status.HTTP_400_BAD_REQUEST)
-            
-        # Get the expense object
-        try:
-            expense = Expense.objects.get(id=expense_id)
-        except Expense.DoesNotExist:
-            return Response({
-                "status": "error",
-                "message": "Expense not found"
-            }, status=status.HTTP_404_NOT_FOUND)
-            
-        # Check if user has permission to update
-        if user_id != expense.paid_by_id:
-            return Response({
-                "status": "error",
-                "user_id": user_id,
-                "message": "You don't have permission to update this expense"
-            }, status=status.HTTP_403_FORBIDDEN)
-            
 
-        serializer = ExpenseUpdateSerializer(
-            instance=expense,
-            data=request.data,
-            partial=True 
-        )
-        
-        if not serializer.is_valid():
-            return Response({
-                "status": "error",
-                "errors": serializer.errors
-            }, status=status.HTTP_400_BAD_REQUEST)
-            
-        
-        # If total_amount changed, update the splits proportionally
-        if 'total_amount' in request.data and request.data['total_amount'] != expense.total_amount:
-            old_amount = float(expense.total_amount)
-            new_amount = float(request.data['total_amount'])
-            ratio = new_amount / old_amount
+        with transaction.atomic():
+            # Get the expense object, locked until the splits are rewritten
+            try:
+                expense = Expense.objects.select_for_update().get(id=expense_id)
+            except Expense.DoesNotExist:
+                return Response({
+                    "status": "error",
+                    "message": "Expense not found"
+                }, status=status.HTTP_404_NOT_FOUND)
+                
+            # Check if user has permission to update
+            if user_id != expense.paid_by_id:
+                return Response({
+                    "status": "error",
+                    "user_id": user_id,
+                    "message": "You don't have permission to update this expense"
+                }, status=status.HTTP_403_FORBIDDEN)
+
+            serializer = ExpenseUpdateSerializer(
+                instance=expense,
+                data=request.data,
+                partial=True 
+            )
             
-            # Update each split amount
-            splits = ExpenseSplit.objects.filter(expense_id=expense_id)
-            for split in splits:
-                split.total_amount = split.total_amount * ratio
-                split.remaining_amount = split.remaining_amount * ratio
-                split.save()
-        serializer.save()
+            if not serializer.is_valid():
+                return Response({
+                    "status": "error",
+                    "errors": serializer.errors
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            # If total_amount or the split changed, rewrite the splits in exact cents
+            split_mode = serializer.validated_data.pop('split_mode', None)
+            splits = serializer.validated_data.pop('splits', None) or []
+            items = serializer.validated_data.pop('items', None)
+            new_total = serializer.validated_data.get('total_amount', expense.total_amount)
+            if split_mode or new_total != expense.total_amount:
+                try:
+                    remaining_amount = DatabaseService.rescale_expense_splits(
+                        expense, new_total, split_mode,
+                        {split['user_id']: split['value'] for split in splits if 'value' in split},
+                        items
+                    )
+                except split_allocator.SplitError as e:
+                    transaction.set_rollback(True)
+                    return Response({
+                        "status": "error",
+                        "message": str(e)
+                    }, status=status.HTTP_400_BAD_REQUEST)
+                serializer.save(remaining_amount=remaining_amount)
+            else:
+                serializer.save()
     
         return Response({
             "status": "success",
@@ -1277,6 +1740,59 @@ def update_expense(request):
             "message": f"Error updating expense: {str(e)}"
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['POST'])
+def upload_receipt(request):
+    """
+    Upload a receipt for an expense paid by the user. The file is streamed
+    to storage in chunks; a thumbnail is generated in the background and
+    shows up as receipt_thumbnail_url on the expense.
+
+    Request Body (multipart):
+    {
+        "id_token": "your-id-token",
+        "expense_id": "expense-id",
+        "receipt": file  # JPEG, PNG, WebP or PDF, up to 10MB
+    }
+    """
+    serializer = UploadReceiptSerializer(data=request.data)
+    if serializer.is_valid():
+        cognito = CognitoService()
+        decoded = cognito.get_user_id(serializer.validated_data['id_token'])
+        if decoded['status'] != 'SUCCESS':
+            return Response(decoded, status=status.HTTP_401_UNAUTHORIZED)
+
+        try:
+            expense = Expense.objects.get(
+                id=serializer.validated_data['expense_id'],
+                paid_by__cognito_id=decoded['user_sub']
+            )
+        except Expense.DoesNotExist:
+            return Response({
+                "status": "error",
+                "message": "Expense not found"
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            receipt_url = receipts.store_receipt(expense, serializer.validated_data['receipt'])
+        except Exception as e:
+            logger.exception("Receipt upload failed for expense %s", expense.id)
+            return Response({
+                "status": "error",
+                "message": f"Error uploading receipt: {str(e)}"
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        return Response({
+            "status": "success",
+            "message": "Receipt uploaded successfully",
+            "receipt_url": receipt_url
+        }, status=status.HTTP_201_CREATED)
+
+    return Response({
+        'status': 'error',
+        'message': 'Invalid input',
+        'errors': serializer.errors
+    }, status=status.HTTP_400_BAD_REQUEST)
+
 @api_view(['GET'])
 def get_expense_detail(request):
     """
@@ -1309,14 +1825,19 @@ def get_expense_detail(request):
 @api_view(['POST'])
 def record_payment(request):
     """
-    Record a payment for settling up with a friend
+    Record a payment for settling up with a friend or inside a group.
+    Retries carrying the same idempotency key (body field or
+    Idempotency-Key header) return the original result; a key reused
+    for a different payment is rejected with 422.
     
     Request Body:
     {
         "id_token": "your-id-token",
-        "user_id": "user-id-to-pay",
-        "amount": 50.00,
-        "description": "Payment settlement"
+        "user_id": "user-id-to-pay" OR "group_id": "group-id",
+        "amount": 50.00,  # Optional when settle_all is true
+        "settle_all": false,  # Optional
+        "description": "Payment settlement",
+        "idempotency_key": "client-generated-uuid"  # Optional
     }
     """
     try:
@@ -1333,77 +1854,42 @@ def record_payment(request):
         decoded = cognito.get_user_id(serializer.validated_data['id_token'])
         if decoded['status'] != 'SUCCESS':
             return Response(decoded, status=status.HTTP_401_UNAUTHORIZED)
-        
-        db_user = User.objects.get(cognito_id=decoded['user_sub'])
-        print(f"Authenticated user: {db_user.name}")   
 
-        is_group_settlement = 'group_id' in serializer.validated_data
-        amount_to_settle = float(serializer.validated_data['amount'])
-        
-        if is_group_settlement:
-            # Group settlement logic
-            group_id = serializer.validated_data['group_id']
-            print(f"Processing group settlement for group {group_id}")
-
-            # Get all splits where current user owes money to other users in the group
-            splits_to_settle = ExpenseSplit.objects.filter(
-                user_id=db_user.id,
-                expense__group_id=group_id,
-                is_paid=False
-            )
+        db = DatabaseService()
+        result = db.record_payment(
+            cognito_id=decoded['user_sub'],
+            recipient_id=serializer.validated_data.get('user_id'),
+            group_id=serializer.validated_data.get('group_id'),
+            amount=serializer.validated_data.get('amount'),
+            settle_all=serializer.validated_data.get('settle_all', False),
+            description=serializer.validated_data.get('description', ''),
+            idempotency_key=(serializer.validated_data.get('idempotency_key')
+                             or request.headers.get('Idempotency-Key'))
+        )
 
-        else:
-            recipient_id = serializer.validated_data['user_id']
-            # Find all unsettled splits between these users
-            # Get all splits where current user owes money to the recipient
-            splits_to_settle = ExpenseSplit.objects.filter(
-                user_id=db_user.id,
-                expense__paid_by_id=recipient_id,
-                is_paid=False
-            ).order_by('created_at')
-        
-        if not splits_to_settle.exists():
+        if result['status'] == 'SUCCESS':
+            return Response({
+                "status": "success",
+                "message": result['message'],
+                "data": result['data']
+            }, status=status.HTTP_200_OK)
+
+        if result.get('error_code') == 'NO_SPLITS':
             return Response({
                 "status": "error",
-                "message": "No splits found to settle"
+                "message": result['message']
             }, status=status.HTTP_404_NOT_FOUND)
 
-        # Record payments for each split until the amount is fully paid
-        remaining_to_pay = amount_to_settle
-        settled_splits = []
-        for split in splits_to_settle:
-            if remaining_to_pay <= 0:
-                break
-            split_amount = min(float(split.remaining_amount), remaining_to_pay)
-            
-            # Update the split
-            split.remaining_amount = float(split.remaining_amount) - split_amount
-            if split.remaining_amount <= 0:
-                split.is_paid = True
-            split.save()
-            
-            # Update the expense's remaining amount
-            expense = split.expense
-            expense.remaining_amount = float(expense.remaining_amount) - split_amount
-            expense.save()
-            
-            remaining_to_pay -= split_amount
-            settled_splits.append({
-                'id': split.id,
-                'expense_id': split.expense_id,
-                'amount_paid': split_amount,
-                'is_fully_paid': split.is_paid
-            })
-        
+        if result.get('error_code') == 'IDEMPOTENCY_KEY_REUSED':
+            return Response({
+                "status": "error",
+                "message": result['message']
+            }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
         return Response({
-            "status": "success",
-            "message": "Payment recorded successfully",
-            "data": {
-                "amount_settled": amount_to_settle - remaining_to_pay,
-                "remaining_amount": remaining_to_pay if remaining_to_pay > 0 else 0,
-                "settled_splits": settled_splits
-            }
-        }, status=status.HTTP_200_OK)
+            "status": "error",
+            "message": result['message']
+        }, status=status.HTTP_400_BAD_REQUEST)
             
     except Exception as e:
         return Response({
@@ -1412,6 +1898,42 @@ def record_payment(request):
             'error': str(e),
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['POST'])
+def payments_feed(request):
+    """
+    Get the payments the user made or received after a cursor, oldest first.
+    Pass the returned next_cursor back to continue from where you left off.
+    Payments show up once they are PAYMENTS_FEED_SETTLE_SECONDS old, so no
+    payment committed out of id order is skipped.
+
+    Request Body:
+    {
+        "id_token": "your-id-token",
+        "cursor" (optional): 0,
+        "limit" (optional): 100
+    }
+    """
+    serializer = PaymentsFeedSerializer(data=request.data)
+    if serializer.is_valid():
+        cognito = CognitoService()
+        decoded = cognito.get_user_id(serializer.validated_data['id_token'])
+        if decoded['status'] == 'SUCCESS':
+            db = DatabaseService()
+            result = db.get_payments_since(
+                decoded['user_sub'],
+                cursor=serializer.validated_data['cursor'],
+                limit=serializer.validated_data['limit']
+            )
+            if result['status'] == 'SUCCESS':
+                return Response(result, status=status.HTTP_200_OK)
+            return Response(result, status=status.HTTP_400_BAD_REQUEST)
+        return Response(decoded, status=status.HTTP_401_UNAUTHORIZED)
+    return Response({
+        'status': 'error',
+        'message': 'Invalid input',
+        'errors': serializer.errors
+    }, status=status.HTTP_400_BAD_REQUEST)
+
 @api_view(['DELETE'])
 def delete_expense(request):
     """
@@ -1451,6 +1973,7 @@ def delete_expense(request):
 def get_financial_summary(request):
     """
     Get financial summary for dashboard.
+    Amounts are converted to the user's currency at each expense's date.
     
     """
     id_token = request.query_params.get('idToken')
@@ -1473,18 +1996,24 @@ def get_financial_summary(request):
         db_user = User.objects.get(cognito_id=user_id)
         
         # Now use the database primary key for queries
-        you_owe_splits = ExpenseSplit.objects.filter(
+        you_owe_splits = list(ExpenseSplit.objects.filter(
             user_id=db_user.id,  # Use DB primary key
             is_paid=False
-        ).exclude(expense__paid_by_id=db_user.id)
+        ).exclude(expense__paid_by_id=db_user.id).values_list(
+            'remaining_amount', 'expense__currency', 'expense__created_at'
+        ))
         
-        they_owe_splits = ExpenseSplit.objects.filter(
+        they_owe_splits = list(ExpenseSplit.objects.filter(
             expense__paid_by_id=db_user.id,  # Use DB primary key
             is_paid=False
-        ).exclude(user_id=db_user.id)
+        ).exclude(user_id=db_user.id).values_list(
+            'remaining_amount', 'expense__currency', 'expense__created_at'
+        ))
         
-        total_you_owe = sum(float(split.remaining_amount) for split in you_owe_splits)
-        total_they_owe = sum(float(split.remaining_amount) for split in they_owe_splits)
+        # Convert both sides in one pass
+        converted = fx.convert_many(you_owe_splits + they_owe_splits, db_user.currency)
+        total_you_owe = float(sum(converted[:len(you_owe_splits)]))
+        total_they_owe = float(sum(converted[len(you_owe_splits):]))
         total_bill = total_they_owe - total_you_owe
 
         
@@ -1495,6 +2024,7 @@ def get_financial_summary(request):
                 'youOwe': total_you_owe,
                 'theyOwe': total_they_owe,
                 'totalBill': total_bill,
+                'currency': db_user.currency,
             }
         }, status=status.HTTP_200_OK)
         
@@ -1504,10 +2034,17 @@ def get_financial_summary(request):
             'message': 'User not found'
         }, status=status.HTTP_404_NOT_FOUND)
 
+    except fx.FxRateError as e:
+        return Response({
+            'status': 'ERROR',
+            'message': str(e)
+        }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
 @api_view(['POST'])
 def get_settlement_data(request):
     """
-    Get data about money the user owes to others.
+    Get data about money the user owes to others, converted to the
+    user's currency.
     
     Request Body:
     {
@@ -1537,45 +2074,50 @@ def get_settlement_data(request):
             
             # THIS IS THE KEY CHANGE: Get splits where USER OWES OTHERS
             # (user is in the split but NOT the payer)
-            you_owe_splits = splits_query.filter(
+            you_owe_splits = list(splits_query.filter(
                 user_id=db_user.id  # User is part of the split
-            ).exclude(expense__paid_by_id=db_user.id)  # But user is not the payer
+            ).exclude(expense__paid_by_id=db_user.id).select_related(  # But user is not the payer
+                'expense__paid_by', 'expense__group'
+            ))
             
 
             
             # Filter by group if specified
             # if group_id:
             #     you_owe_splits = you_owe_splits.filter(expense__group_id=group_id)
+
+            # Convert every split to the user's currency in one pass
+            converted = fx.convert_many(
+                [(split.remaining_amount, split.expense.currency, split.expense.created_at) for split in you_owe_splits],
+                db_user.currency
+            )
             
             # Process the splits where user owes others
             user_owes = {}
-            for split in you_owe_splits:
-                paid_by_id = split.expense.paid_by_id
+            for split, amount in zip(you_owe_splits, converted):
+                paid_by_user = split.expense.paid_by
+                paid_by_id = paid_by_user.id
                 if paid_by_id not in user_owes:
-                    try:
-                        paid_by_user = User.objects.get(id=paid_by_id)
-                        user_owes[paid_by_id] = {
-                            'id': paid_by_id,
-                            'name': paid_by_user.full_name,
-                            'avatar_url': paid_by_user.avatar_url,
-                            'amount': 0,
-                            'expenses': []
-                        }
-                    except User.DoesNotExist:
-                        continue
-                group = None
-                if split.expense.group_id:
-                    group = Group.objects.get(id=split.expense.group_id)
-
-                user_owes[paid_by_id]['amount'] += float(split.remaining_amount)
+                    user_owes[paid_by_id] = {
+                        'id': paid_by_id,
+                        'name': paid_by_user.full_name,
+                        'avatar_url': paid_by_user.list_avatar_url,
+                        'amount': 0,
+                        'expenses': []
+                    }
+                group = split.expense.group
+
+                user_owes[paid_by_id]['amount'] += float(amount)
                 user_owes[paid_by_id]['expenses'].append({
                     'id': split.expense.id,
                     'description': split.expense.description,
-                    'amount': float(split.remaining_amount),
+                    'amount': float(amount),
+                    'original_amount': float(split.remaining_amount),
+                    'original_currency': split.expense.currency,
                     'created_at': split.expense.created_at.isoformat(),
                     'deadline': split.expense.deadline.isoformat() if split.expense.deadline else None,
                     'group_id': split.expense.group_id,
-                    'group_name': group.name if split.expense.group_id else None,
+                    'group_name': group.name if group else None,
                 })
                 
             # Combine data and calculate totals
@@ -1586,13 +2128,13 @@ def get_settlement_data(request):
                 data['type'] = 'to_pay'  # Explicitly mark as "to pay"
                 all_settlements.append(data)
 
-            print(all_settlements)
             
             response_data = {
                 'status': 'SUCCESS',
                 'message': 'Settlement data fetched successfully',
                 'settlements': all_settlements,
-                'total_to_pay': total_to_pay
+                'total_to_pay': total_to_pay,
+                'currency': db_user.currency
             }
             
             return Response(response_data, status=status.HTTP_200_OK)
@@ -1602,6 +2144,12 @@ def get_settlement_data(request):
                 'status': 'ERROR',
                 'message': 'User not found'
             }, status=status.HTTP_404_NOT_FOUND)
+
+        except fx.FxRateError as e:
+            return Response({
+                'status': 'ERROR',
+                'message': str(e)
+            }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
             
         except Exception as e:
             return Response({
@@ -1710,6 +2258,36 @@ def get_group_info(request):
         'errors': serializer.errors
     }, status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(['POST'])
+def get_group_summary(request):
+    """
+    Get the group's total spent, outstanding balance and each member's
+    paid / share / net position, in the requesting user's currency.
+    requires user passed in to be a member of the group.
+
+    Request Body:
+    {
+        "id_token" : "user-id-token",
+        "group_id" : "group-id",
+    }
+    """
+    serializer = GetGroupInfoSerializer(data=request.data)
+    if serializer.is_valid():
+        cognito = CognitoService()
+        decoded = cognito.get_user_id(serializer.validated_data['id_token'])
+        if decoded['status'] == 'SUCCESS':
+            db = DatabaseService()
+            result = db.get_group_summary(decoded['user_sub'], serializer.validated_data['group_id'])
+            if result['status'] == 'SUCCESS':
+                return Response(result, status=status.HTTP_200_OK)
+            return Response(result, status=status.HTTP_400_BAD_REQUEST)
+        return Response(decoded, status=status.HTTP_401_UNAUTHORIZED)
+    return Response({
+        'status': 'error',
+        'message': 'Invalid input',
+        'errors': serializer.errors
+    }, status=status.HTTP_400_BAD_REQUEST)
+
 @api_view(['POST'])
 def create_group(request):
     """
@@ -1776,6 +2354,40 @@ def invite_to_group(request):
         'errors': serializer.errors
     }, status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(['POST'])
+def invite_users_to_group(request):
+    """
+    Invite up to 100 users to a group in one call (admins only).
+    Users that cannot be invited are listed in "errors".
+
+    Request Body:
+    {
+        "id_token": "your-id-token",
+        "group_id": "group-id",
+        "user_ids": ["user-id", "user-id"]
+    }
+    """
+    serializer = BulkInviteSerializer(data=request.data)
+    if serializer.is_valid():
+        cognito = CognitoService()
+        decoded = cognito.get_user_id(serializer.validated_data['id_token'])
+        if decoded['status'] == 'SUCCESS':
+            db = DatabaseService()
+            result = db.invite_users_to_group(
+                user_sub=decoded['user_sub'],
+                group_id=serializer.validated_data['group_id'],
+                user_ids=serializer.validated_data['user_ids']
+            )
+            if result['status'] == 'SUCCESS':
+                return Response(result, status=status.HTTP_200_OK)
+            return Response(result, status=status.HTTP_400_BAD_REQUEST)
+        return Response(decoded, status=status.HTTP_401_UNAUTHORIZED)
+    return Response({
+        'status': 'error',
+        'message': 'Invalid input',
+        'errors': serializer.errors
+    }, status=status.HTTP_400_BAD_REQUEST)
+
 @api_view(['POST'])
 def leave_group(request):
     """
@@ -1824,7 +2436,6 @@ def get_user_groups(request):
         if decoded['status'] == 'SUCCESS':
             db = DatabaseService()
             result = db.get_user_groups(decoded['user_sub'])
-            print(result)
             if result['status'] == 'SUCCESS':
                 return Response(result, status=status.HTTP_200_OK)
             return Response(result, status=status.HTTP_400_BAD_REQUEST)
@@ -1866,6 +2477,38 @@ def accept_group_invite(request):
         'errors': serializer.errors
     }, status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(['POST'])
+def accept_group_invites(request):
+    """
+    Accept up to 100 group invitations in one call.
+    Invitations that cannot be accepted are listed in "errors".
+
+    Request Body:
+    {
+        "id_token": "your-id-token",
+        "invite_ids": ["invite-id", "invite-id"]
+    }
+    """
+    serializer = BulkAcceptGroupInvitesSerializer(data=request.data)
+    if serializer.is_valid():
+        cognito = CognitoService()
+        decoded = cognito.get_user_id(serializer.validated_data['id_token'])
+        if decoded['status'] == 'SUCCESS':
+            db = DatabaseService()
+            result = db.accept_group_invites(
+                user_sub=decoded['user_sub'],
+                invite_ids=serializer.validated_data['invite_ids']
+            )
+            if result['status'] == 'SUCCESS':
+                return Response(result, status=status.HTTP_200_OK)
+            return Response(result, status=status.HTTP_400_BAD_REQUEST)
+        return Response(decoded, status=status.HTTP_401_UNAUTHORIZED)
+    return Response({
+        'status': 'error',
+        'message': 'Invalid input',
+        'errors': serializer.errors
+    }, status=status.HTTP_400_BAD_REQUEST)
+
 @api_view(['POST'])
 def reject_group_invite(request):
     """
@@ -2028,7 +2671,8 @@ def invite_search(request):
 @api_view(['POST'])
 def delete_group(request):
     """
-    Delete a group.
+    Delete a group. The deletion runs in the background; poll
+    deletion-job-status with the returned job_id for progress.
 
     Request Body:
     {
@@ -2047,7 +2691,7 @@ def delete_group(request):
                 group_id=serializer.validated_data['group_id']
             )
             if result['status'] == 'SUCCESS':
-                return Response(result, status=status.HTTP_200_OK)
+                return Response(result, status=status.HTTP_202_ACCEPTED)
             return Response(result, status=status.HTTP_400_BAD_REQUEST)
         return Response(decoded, status=status.HTTP_401_UNAUTHORIZED)
     return Response({
@@ -2056,6 +2700,37 @@ def delete_group(request):
         'errors': serializer.errors
     }, status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(['POST'])
+def deletion_job_status(request):
+    """
+    Progress of a group deletion started by the user.
+
+    Request Body:
+    {
+        "id_token": "your-id-token",
+        "job_id": "job-id"
+    }
+    """
+    serializer = DeletionJobStatusSerializer(data=request.data)
+    if serializer.is_valid():
+        cognito = CognitoService()
+        decoded = cognito.get_user_id(serializer.validated_data['id_token'])
+        if decoded['status'] == 'SUCCESS':
+            db = DatabaseService()
+            result = db.get_deletion_job(
+                user_sub=decoded['user_sub'],
+                job_id=serializer.validated_data['job_id']
+            )
+            if result['status'] == 'SUCCESS':
+                return Response(result, status=status.HTTP_200_OK)
+            return Response(result, status=status.HTTP_404_NOT_FOUND)
+        return Response(decoded, status=status.HTTP_401_UNAUTHORIZED)
+    return Response({
+        'status': 'error',
+        'message': 'Invalid input',
+        'errors': serializer.errors
+    }, status=status.HTTP_400_BAD_REQUEST)
+
 @api_view(['POST'])
 def edit_group(request):
     """
@@ -2163,8 +2838,9 @@ def get_direct_messages_between_users(request):
 @api_view(['POST'])
 def delete_user_profile(request):
     """
-    Delete user profile - removes profile picture from storage and
-    deactivates the user account in Cognito.
+    Delete user profile - starts the deletion job of the account, which
+    also removes the profile picture from storage, and deactivates the
+    user account in Cognito.
     
     Request body:
     {
@@ -2181,11 +2857,8 @@ def delete_user_profile(request):
         if auth_result['status'] != 'SUCCESS':
             return Response(auth_result, status=status.HTTP_401_UNAUTHORIZED)
         
-        # Delete user's profile picture from cloud storage if not default
-        storage = CloudStorageService()
-        storage.delete_user_profile_picture(auth_result['user_sub'])
-        
-        # Delete user data from the database using the dedicated method
+        # Delete user data from the database using the dedicated method; the
+        # job deletes the profile picture once the account row is gone
         db = DatabaseService()
         delete_result = db.delete_user_account(auth_result['user_sub'])
         
@@ -2214,4 +2887,19 @@ def delete_user_profile(request):
         'status': 'error',
         'message': 'Invalid input',
         'errors': serializer.errors
-    }, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+    }, status=status.HTTP_400_BAD_REQUEST)
+
+def metrics_view(request):
+    """
+    Counters and latency histograms of this process in the Prometheus text
+    format. Scrapers authenticate with "Authorization: Bearer <METRICS_TOKEN>";
+    the client address is not used, behind a proxy every request comes from
+    the proxy. Without a METRICS_TOKEN setting the endpoint is disabled.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if not token:
+        return HttpResponse(status=status.HTTP_404_NOT_FOUND)
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(credentials.encode(), token.encode()):
+        return HttpResponse(status=status.HTTP_403_FORBIDDEN)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
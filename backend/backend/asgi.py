@@ -6,6 +6,7 @@ import os
 import django
 import json
 import asyncio
+import logging
 from datetime import datetime
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
@@ -18,6 +19,9 @@ from channels.auth import AuthMiddlewareStack
 
 from cliquepay.middleware import TokenAuthMiddleware
 from cliquepay.message_broker import broker
+from cliquepay import metrics
+
+logger = logging.getLogger('cliquepay.sse')
 
 # Import Django's ASGI application
 django_asgi_app = get_asgi_application()
@@ -50,7 +54,8 @@ class SSEConsumer:
         channel = self.scope['url_route']['kwargs']['channel']
         user = self.scope['user']
         
-        print(f"SSE connection established for channel: {channel}")
+        logger.debug("SSE connection established for channel %s", channel)
+        metrics.gauge_add('cliquepay_sse_connections', 1)
         queue = None
         
         try:
@@ -62,14 +67,12 @@ class SSEConsumer:
             
             # Get a queue for this user's channel and SUBSCRIBE IT
             queue = broker.get_queue(channel)
-            print(f"Subscribed queue to channel: {channel}")
             
             # Listen for messages from the broker
             while self.active:
                 try:
                     # Wait for a message with timeout
                     message = await asyncio.wait_for(queue.get(), timeout=30)
-                    print(f"Received message in channel {channel}: {message}")
                     
                     # Send the message to the client
                     await self.send_event(
@@ -84,8 +87,8 @@ class SSEConsumer:
                         data={"timestamp": datetime.now().isoformat()}
                     )
                 
-        except Exception as e:
-            print(f"SSE connection error: {e}")
+        except Exception:
+            logger.warning("SSE connection error on channel %s", channel, exc_info=True)
             await self.send_event(
                 event="error",
                 data={"message": "Connection error occurred"}
@@ -93,13 +96,13 @@ class SSEConsumer:
         finally:
             # Clean up subscription when done
             self.active = False
+            metrics.gauge_add('cliquepay_sse_connections', -1)
             if queue:
                 try:
                     if hasattr(broker, 'unsubscribe'):
                         await broker.unsubscribe(channel, queue)
-                    print(f"Unsubscribed from channel: {channel}")
-                except Exception as cleanup_error:
-                    print(f"Error while unsubscribing: {cleanup_error}")
+                except Exception:
+                    logger.warning("Error while unsubscribing from channel %s", channel, exc_info=True)
     
     async def send_event(self, event, data):
         """Helper to send an SSE event"""
@@ -111,11 +114,13 @@ class SSEConsumer:
         
         event_text = f"id: {event_data['id']}\nevent: {event_data['event']}\ndata: {json.dumps(event_data['data'])}\n\n"
         
-        await self.send({
-            'type': 'http.response.body',
-            'body': event_text.encode('utf-8'),
-            'more_body': True,
-        })
+        with metrics.timer('cliquepay_sse_send_seconds'):
+            await self.send({
+                'type': 'http.response.body',
+                'body': event_text.encode('utf-8'),
+                'more_body': True,
+            })
+        metrics.inc('cliquepay_sse_events_total', event=event)
     
     async def send_error(self, message):
         """Send error message and close connection"""
@@ -1,8 +1,11 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 class CliquepayConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cliquepay'
     
     def ready(self):
-        import cliquepay.signal
\ No newline at end of file
+        import cliquepay.signal
+        from cliquepay import metrics
+        connection_created.connect(metrics.instrument_connection, dispatch_uid='cliquepay.metrics')
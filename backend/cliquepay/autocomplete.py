@@ -0,0 +1,145 @@
+"""
+Username / full name autocomplete backed by a Redis sorted set.
+
+Every user contributes entries "<token>\\x00<user_id>" with score 0 to one
+sorted set, where the tokens are the lowercased username, full name and
+each word of the full name. A prefix lookup is then a single ZRANGEBYLEX.
+The entries written for each user are remembered in a per-user set so an
+update or delete can remove exactly those.
+
+The index is maintained from the User post_save / post_delete signals
+after commit; rebuild_autocomplete_index recreates it from the database.
+Lookups return None when Redis is unavailable so callers can fall back to
+the database search.
+"""
+
+import logging
+
+import redis
+from .models import User
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+INDEX_KEY = 'autocomplete:users'
+USER_ENTRIES_KEY = 'autocomplete:user:{}'
+SEPARATOR = '\x00'
+# Sorts after any UTF-8 continuation of a prefix
+MAX_CHAR = '\U0010ffff'
+MAX_PREFIX_LENGTH = 50
+
+
+def tokens_for(name, full_name):
+    tokens = {name.lower(), full_name.lower()} | {word for word in full_name.lower().split()}
+    return {token for token in tokens if token}
+
+
+def _entries(user_id, name, full_name):
+    return {f"{token}{SEPARATOR}{user_id}" for token in tokens_for(name or '', full_name or '')}
+
+
+def _write_user(pipe, user_id, name, full_name, index_key=INDEX_KEY):
+    entries = _entries(user_id, name, full_name)
+    entries_key = USER_ENTRIES_KEY.format(user_id)
+    pipe.delete(entries_key)
+    if entries:
+        pipe.zadd(index_key, {entry: 0 for entry in entries})
+        pipe.sadd(entries_key, *entries)
+
+
+def index_user(user_id, name, full_name):
+    """Replace the entries of one user."""
+    client = get_redis()
+    try:
+        old_entries = client.smembers(USER_ENTRIES_KEY.format(user_id))
+        pipe = client.pipeline(transaction=True)
+        if old_entries:
+            pipe.zrem(INDEX_KEY, *old_entries)
+        _write_user(pipe, user_id, name, full_name)
+        pipe.execute()
+    except redis.RedisError:
+        logger.warning("Could not index user %s for autocomplete", user_id, exc_info=True)
+
+
+def remove_user(user_id):
+    client = get_redis()
+    try:
+        entries_key = USER_ENTRIES_KEY.format(user_id)
+        old_entries = client.smembers(entries_key)
+        pipe = client.pipeline(transaction=True)
+        if old_entries:
+            pipe.zrem(INDEX_KEY, *old_entries)
+        pipe.delete(entries_key)
+        pipe.execute()
+    except redis.RedisError:
+        logger.warning("Could not remove user %s from autocomplete", user_id, exc_info=True)
+
+
+def lookup(prefix, limit=10, exclude_ids=()):
+    """
+    User ids whose username, full name or a word of it starts with prefix.
+
+    Returns:
+        list[str] | None: Up to `limit` ids in lexicographic order of the
+        matched token, or None when the index cannot be reached
+    """
+    prefix = prefix.strip().lower()[:MAX_PREFIX_LENGTH]
+    if not prefix:
+        return []
+
+    exclude_ids = set(exclude_ids)
+    found = []
+    offset = 0
+    # Several tokens can point to the same user, so over-fetch
+    batch = max(limit * 3, 20)
+    try:
+        client = get_redis()
+        while len(found) < limit:
+            entries = client.zrangebylex(INDEX_KEY, f"[{prefix}", f"[{prefix}{MAX_CHAR}", start=offset, num=batch)
+            for entry in entries:
+                user_id = entry.rsplit(SEPARATOR, 1)[1]
+                if user_id not in exclude_ids and user_id not in found:
+                    found.append(user_id)
+                    if len(found) == limit:
+                        break
+            if len(entries) < batch:
+                break
+            offset += batch
+    except redis.RedisError:
+        logger.warning("Autocomplete index unavailable", exc_info=True)
+        return None
+    return found
+
+
+def rebuild(chunk_size=5000):
+    """
+    Recreate the index from the database into a temporary key and swap it
+    in atomically. Signal updates made while it runs may be lost, so run
+    it when the index is known to be wrong (e.g. after a Redis flush).
+    Returns the number of users indexed.
+    """
+    client = get_redis()
+    temp_key = f"{INDEX_KEY}:rebuild"
+    client.delete(temp_key)
+
+    indexed = 0
+    last_id = ''
+    while True:
+        rows = list(
+            User.objects.filter(id__gt=last_id).order_by('id')
+            .values_list('id', 'name', 'full_name')[:chunk_size]
+        )
+        if not rows:
+            break
+        pipe = client.pipeline(transaction=False)
+        for user_id, name, full_name in rows:
+            _write_user(pipe, user_id, name, full_name, index_key=temp_key)
+        pipe.execute()
+        indexed += len(rows)
+        last_id = rows[-1][0]
+
+    if indexed:
+        client.rename(temp_key, INDEX_KEY)
+    else:
+        client.delete(INDEX_KEY)
+    return indexed
@@ -0,0 +1,197 @@
+"""
+Direct-to-storage profile picture uploads.
+
+The API hands out a signed upload URL under a per-user key; the client PUTs
+the image straight to storage and then confirms the key. Confirmation only
+checks the object's metadata and swaps the avatar URL, so the Django worker
+never reads image bytes. The previous photo is deleted by a background job.
+
+After the swap a background job builds the size variants: the original is
+decoded once in a worker process, every size is rendered as WebP from that
+image, and the variants are stored under keys derived from the user id and
+a hash of the original, so reprocessing the same photo is idempotent.
+"""
+
+import hashlib
+import io
+import logging
+import uuid
+
+from PIL import Image, ImageOps
+
+from . import background, friend_versions, group_info
+from .models import User
+from .storage_service import DEFAULT_PROFILE_PICTURE, get_storage_service
+
+logger = logging.getLogger(__name__)
+
+MAX_AVATAR_SIZE = 5 * 1024 * 1024
+ALLOWED_CONTENT_TYPES = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+    'image/webp': 'webp',
+    'image/gif': 'gif',
+}
+AVATAR_SIZES = (512, 128, 64)
+WEBP_QUALITY = 80
+
+
+class AvatarUploadError(ValueError):
+    """Raised when a confirmed upload is missing or not acceptable."""
+
+
+def picture_prefix(user_id):
+    return f"profile_pictures/{user_id}/"
+
+
+def upload_prefix(user):
+    return picture_prefix(user.id)
+
+
+def variant_prefix(user_id):
+    return f"avatars/{user_id}/"
+
+
+def create_upload(user, content_type):
+    """
+    Issue a signed URL for a new profile picture.
+
+    Returns:
+        dict: key, upload_url, method, headers and expires_in (seconds)
+    """
+    storage = get_storage_service()
+    key = f"{upload_prefix(user)}{uuid.uuid4()}.{ALLOWED_CONTENT_TYPES[content_type]}"
+    upload_url, headers = storage.generate_upload_url(key, content_type, MAX_AVATAR_SIZE)
+    return {
+        'key': key,
+        'upload_url': upload_url,
+        'method': 'PUT',
+        'headers': headers,
+        'expires_in': 15 * 60,
+    }
+
+
+def confirm_upload(user, key):
+    """
+    Verify an uploaded profile picture and make it the user's avatar.
+
+    Returns:
+        str: The new avatar URL
+    Raises:
+        AvatarUploadError: If the object is missing, foreign or not an allowed image
+    """
+    if not key.startswith(upload_prefix(user)) or '..' in key:
+        raise AvatarUploadError('Upload key does not belong to this user')
+
+    storage = get_storage_service()
+    metadata = storage.get_metadata(key)
+    if metadata is None:
+        raise AvatarUploadError('Upload not found')
+    if metadata['content_type'] not in ALLOWED_CONTENT_TYPES or metadata['size'] > MAX_AVATAR_SIZE:
+        background.submit(storage.delete, key)
+        raise AvatarUploadError('Upload must be a JPEG, PNG, WebP or GIF image under 5MB')
+
+    avatar_url = storage.make_public(key)
+    old_url, old_variants = user.avatar_url, user.avatar_variants
+    User.objects.filter(id=user.id).update(avatar_url=avatar_url, avatar_variants={})
+    user.avatar_url, user.avatar_variants = avatar_url, {}
+    group_info.invalidate_user(user.id)
+    friend_versions.profile_changed(user.id)
+
+    if old_url != avatar_url:
+        schedule_delete(user.id, old_url, old_variants)
+    schedule_variants(user.id, avatar_url)
+    return avatar_url
+
+
+def schedule_delete(user_id, url, variants=None):
+    """Delete a user's replaced profile picture and its variants in the background, keeping the default one."""
+    urls = [url] if url and DEFAULT_PROFILE_PICTURE not in url else []
+    urls += list((variants or {}).values())
+    if urls:
+        background.submit_on_commit(delete_stored_files, user_id, urls)
+
+
+def delete_stored_files(user_id, urls):
+    """
+    Delete a user's stored pictures. Only keys under the user's own upload and
+    variant prefixes are deleted; any other URL is left alone.
+    """
+    storage = get_storage_service()
+    prefixes = (picture_prefix(user_id), variant_prefix(user_id))
+    for url in urls:
+        key = storage.key_from_url(url)
+        if key and key.startswith(prefixes) and '..' not in key:
+            storage.delete(key)
+
+
+def schedule_variants(user_id, avatar_url):
+    """Build the size variants of a newly stored avatar in the background."""
+    if avatar_url and DEFAULT_PROFILE_PICTURE not in avatar_url:
+        background.submit_on_commit(process_avatar, user_id, avatar_url)
+
+
+def render_variants(data, sizes=AVATAR_SIZES):
+    """
+    Decode an image once and render square WebP variants, largest first.
+    Runs in a worker process, so it only takes and returns bytes.
+
+    Returns:
+        dict: width -> WebP bytes
+    """
+    with Image.open(io.BytesIO(data)) as source:
+        # Shrink while decoding where the format allows (JPEG)
+        source.draft('RGB', (max(sizes), max(sizes)))
+        image = ImageOps.exif_transpose(source)
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+    rendered = {}
+    for size in sorted(sizes, reverse=True):
+        # Each size is resampled from the previous, smaller than the original
+        image = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        output = io.BytesIO()
+        image.save(output, 'WEBP', quality=WEBP_QUALITY, method=4)
+        rendered[size] = output.getvalue()
+    return rendered
+
+
+def variant_key(user_id, digest, size):
+    return f"{variant_prefix(user_id)}{digest}/{size}.webp"
+
+
+def process_avatar(user_id, avatar_url):
+    """Render, store and attach the size variants of a user's avatar."""
+    storage = get_storage_service()
+    key = storage.key_from_url(avatar_url)
+    if not key:
+        return
+
+    # Avatars are capped at MAX_AVATAR_SIZE, so the original fits in memory
+    original = io.BytesIO()
+    storage.download_to_file(key, original)
+    data = original.getvalue()
+    # Hash the key too, so a re-upload of the same bytes never shares keys with the old copy
+    digest = hashlib.sha256(key.encode() + data).hexdigest()[:16]
+
+    rendered = background.get_process_pool().submit(render_variants, data).result()
+    variants = {
+        str(size): storage.upload_stream(io.BytesIO(webp), variant_key(user_id, digest, size), 'image/webp')
+        for size, webp in rendered.items()
+    }
+
+    # Skip if the user changed their avatar meanwhile
+    updated = User.objects.filter(id=user_id, avatar_url=avatar_url).update(avatar_variants=variants)
+    if not updated:
+        _delete_variants(list(variants.values()))
+        return
+    group_info.invalidate_user(user_id)
+    friend_versions.profile_changed(user_id)
+    logger.info("Stored %d avatar variants for user %s", len(variants), user_id)
+
+
+def _delete_variants(urls):
+    storage = get_storage_service()
+    for url in urls:
+        key = storage.key_from_url(url)
+        if key:
+            storage.delete(key)
@@ -3,19 +3,65 @@ import jwt
 import hmac
 import hashlib
 import base64
+import logging
+import threading
 from botocore.exceptions import ClientError
 from django.conf import settings
+from . import metrics
 from .db_service import *
 
+logger = logging.getLogger(__name__)
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class InstrumentedClient:
+    """
+    Times every call of the wrapped boto3 client in
+    cliquepay_cognito_call_seconds and counts calls that raise.
+    Attributes that are not methods (client.exceptions) pass through.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def __getattr__(self, name):
+        attribute = getattr(self.client, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            with metrics.timer('cliquepay_cognito_call_seconds', operation=name):
+                try:
+                    return attribute(*args, **kwargs)
+                except Exception:
+                    metrics.inc('cliquepay_cognito_errors_total', operation=name)
+                    raise
+        return call
+
+
+def get_client():
+    """
+    Process-wide Cognito client, created on first use. boto3 clients are
+    thread safe, and building one per request reloads the service model.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = InstrumentedClient(boto3.client(
+                    'cognito-idp',
+                    region_name=settings.COGNITO_AWS_REGION
+                ))
+    return _client
+
+
 class CognitoService:
     def __init__(self):
-        self.client = boto3.client(
-            'cognito-idp',
-            region_name=settings.COGNITO_AWS_REGION
-        )
+        self.client = get_client()
         self.client_id = settings.COGNITO_APP_CLIENT_ID
         self.client_secret = settings.COGNITO_APP_CLIENT_SECRET
-        print(settings.COGNITO_AWS_REGION)
     def get_secret_hash(self, username):
         message = username + self.client_id
         dig = hmac.new(
@@ -431,7 +477,6 @@ class CognitoService:
             
             # Get the username from the first user
             username = response['Users'][0]['Username']
-            print(username)
             confirm_params = {
                 'ClientId': self.client_id,
                 'Username': username,
@@ -0,0 +1,61 @@
+"""
+Process-local background executor for work that should not block a request
+(thumbnails, storage cleanup). Jobs are best effort: they run in a thread
+pool after the surrounding transaction commits, and failures are logged.
+CPU-bound work (image resizing) is handed from those jobs to a separate
+process pool so it does not hold the GIL of the web process.
+"""
+
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_process_pool = None
+_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'BACKGROUND_WORKERS', 4),
+                    thread_name_prefix='cliquepay-bg'
+                )
+    return _executor
+
+
+def get_process_pool():
+    global _process_pool
+    if _process_pool is None:
+        with _lock:
+            if _process_pool is None:
+                _process_pool = ProcessPoolExecutor(max_workers=getattr(settings, 'IMAGE_WORKERS', 2))
+    return _process_pool
+
+
+def _run(fn, args, kwargs):
+    try:
+        return fn(*args, **kwargs)
+    except Exception:
+        logger.exception("Background job %s failed", getattr(fn, '__name__', fn))
+    finally:
+        # Worker threads keep their own DB connections
+        close_old_connections()
+
+
+def submit(fn, *args, **kwargs):
+    """Run fn(*args, **kwargs) in the background now."""
+    return get_executor().submit(_run, fn, args, kwargs)
+
+
+def submit_on_commit(fn, *args, **kwargs):
+    """Run fn(*args, **kwargs) in the background once the current transaction commits."""
+    transaction.on_commit(lambda: submit(fn, *args, **kwargs))
@@ -0,0 +1,348 @@
+"""
+Seeded synthetic data for the API benchmarks.
+
+generate() fills the database with users, friendships whose degrees follow
+a power law (a few users with hundreds of friends, most with a handful),
+groups of log-normal size, direct and group messages concentrated on a
+minority of busy threads, and group and friend expenses with equal splits.
+The same seed always produces the same graph and the same message and
+expense distribution, so runs on different commits are comparable.
+
+Rows are written with bulk_create in batches, which skips the model
+signals: the friend graph, membership and group caches load the new rows
+lazily on first use. Seeded users are recognised by a COGNITO_PREFIX
+cognito id, which real accounts never have (Cognito assigns UUID subs),
+and seeded groups by a seeded creator; cleanup() removes both and
+everything attached to them in pk-ordered chunks. Group names are free
+text and never used to find seeded rows.
+"""
+
+import math
+import random
+import uuid
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import deletion_jobs, expense_import
+from .models import (
+    DirectMessage, Expense, ExpenseSplit, Friendship, FriendshipChange, Group, GroupMember,
+    GroupMessage, GroupReadReceipt, User,
+)
+
+SEED_DOMAIN = 'api-bench.cliquepay.invalid'
+COGNITO_PREFIX = 'bench-'
+GROUP_PREFIX = 'bench-'
+
+SYLLABLES = ['ka', 'ri', 'to', 'mo', 'an', 'el', 'sa', 'lu', 'ne', 'vi', 'or', 'da', 'jo', 'mi']
+WORDS = ['lunch', 'rent', 'taxi', 'groceries', 'tickets', 'coffee', 'hotel', 'dinner', 'fuel', 'gift',
+         'sure', 'thanks', 'tomorrow', 'paid', 'sent', 'when', 'ok', 'see', 'you', 'later']
+
+# Share of friendships in each status
+STATUS_WEIGHTS = ((Friendship.ACCEPTED, 85), (Friendship.PENDING, 10), (Friendship.BLOCKED, 5))
+
+
+def _seeded(field=None):
+    prefix = f'{field}__' if field else ''
+    return Q(**{f'{prefix}cognito_id__startswith': COGNITO_PREFIX, f'{prefix}email__endswith': f'@{SEED_DOMAIN}'})
+
+
+def seeded_users():
+    return User.objects.filter(_seeded())
+
+
+def seeded_groups():
+    return Group.objects.filter(_seeded('created_by'))
+
+
+def _skewed(rng, items, power=3):
+    """Random item, heavily favouring the start of the list"""
+    return items[int(len(items) * rng.random() ** power)]
+
+
+def _sentence(rng, words=(3, 12)):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(*words)))
+
+
+def _insert(model, rows, batch_size):
+    with transaction.atomic():
+        model.objects.bulk_create(rows, batch_size=batch_size)
+
+
+def _users(rng, count, batch_size, log, tag=''):
+    user_ids = []
+    batch = []
+    for index in range(count):
+        first = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+        last = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+        user_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        user_ids.append(user_id)
+        batch.append(User(
+            id=user_id,
+            cognito_id=f'{COGNITO_PREFIX}{user_id}',
+            name=f'{first.lower()}{last.lower()}{tag}{index}',
+            full_name=f'{first} {last}',
+            email=f'{first.lower()}.{tag}{index}@{SEED_DOMAIN}',
+        ))
+        if len(batch) == batch_size:
+            _insert(User, batch, batch_size)
+            batch = []
+    _insert(User, batch, batch_size)
+    log(f'{count} users')
+    return user_ids
+
+
+def _degrees(rng, count, mean_degree, max_degree):
+    # Pareto with alpha 2 has mean 2 * scale
+    alpha = 2.0
+    scale = mean_degree * (alpha - 1) / alpha
+    return [min(max_degree, max(1, int(scale * rng.paretovariate(alpha)))) for _ in range(count)]
+
+
+def _friendships(rng, user_ids, mean_degree, batch_size, log):
+    """Chung-Lu style graph: endpoints drawn in proportion to each user's target degree"""
+    degrees = _degrees(rng, len(user_ids), mean_degree, max_degree=max(1, len(user_ids) // 2))
+    cum_weights = list(accumulate(degrees))
+    statuses, weights = zip(*STATUS_WEIGHTS)
+
+    pairs = set()
+    accepted = []
+    batch = []
+    for _ in range(sum(degrees) // 2):
+        a, b = (user_ids[bisect_left(cum_weights, rng.random() * cum_weights[-1])] for _ in range(2))
+        pair = Friendship.ordered(a, b)
+        if a == b or pair in pairs:
+            continue
+        pairs.add(pair)
+        status = rng.choices(statuses, weights)[0]
+        if status == Friendship.ACCEPTED:
+            accepted.append(pair)
+        batch.append(Friendship(
+            id=str(uuid.UUID(int=rng.getrandbits(128))),
+            user1_id=pair[0], user2_id=pair[1], status=status, action_user_id=rng.choice(pair)
+        ))
+        if len(batch) == batch_size:
+            _insert(Friendship, batch, batch_size)
+            batch = []
+    _insert(Friendship, batch, batch_size)
+    log(f'{len(pairs)} friendships, {len(accepted)} accepted, max degree {max(degrees)}')
+    return accepted
+
+
+def _groups(rng, user_ids, count, mean_size, batch_size, log):
+    members_by_group = {}
+    groups = []
+    members = []
+    for index in range(count):
+        group_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        size = max(2, min(len(user_ids), int(rng.lognormvariate(math.log(mean_size), 0.6))))
+        group_members = rng.sample(user_ids, size)
+        members_by_group[group_id] = group_members
+        groups.append(Group(
+            id=group_id, name=f'{GROUP_PREFIX}{index}', created_by_id=group_members[0],
+            description=_sentence(rng)
+        ))
+        members.extend(
+            GroupMember(group_id=group_id, user_id=user_id, role='admin' if position == 0 else 'member')
+            for position, user_id in enumerate(group_members)
+        )
+    _insert(Group, groups, batch_size)
+    for start in range(0, len(members), batch_size):
+        _insert(GroupMember, members[start:start + batch_size], batch_size)
+    log(f'{count} groups, {len(members)} memberships')
+    return members_by_group
+
+
+def _direct_messages(rng, accepted, count, batch_size, log):
+    if not accepted:
+        return
+    threads = list(accepted)
+    rng.shuffle(threads)
+    batch = []
+    for _ in range(count):
+        sender_id, recipient_id = _skewed(rng, threads)
+        if rng.random() < 0.5:
+            sender_id, recipient_id = recipient_id, sender_id
+        batch.append(DirectMessage(
+            id=str(uuid.UUID(int=rng.getrandbits(128))),
+            sender_id=sender_id, recipient_id=recipient_id, content=_sentence(rng),
+            is_read=rng.random() < 0.8
+        ))
+        if len(batch) == batch_size:
+            _insert(DirectMessage, batch, batch_size)
+            batch = []
+    _insert(DirectMessage, batch, batch_size)
+    log(f'{count} direct messages')
+
+
+def _group_messages(rng, members_by_group, count, batch_size, log):
+    if not members_by_group:
+        return
+    group_ids = list(members_by_group)
+    batch = []
+    for _ in range(count):
+        group_id = _skewed(rng, group_ids)
+        batch.append(GroupMessage(
+            id=str(uuid.UUID(int=rng.getrandbits(128))),
+            group_id=group_id, sender_id=rng.choice(members_by_group[group_id]), content=_sentence(rng)
+        ))
+        if len(batch) == batch_size:
+            _insert(GroupMessage, batch, batch_size)
+            batch = []
+    _insert(GroupMessage, batch, batch_size)
+    log(f'{count} group messages')
+
+
+def _expenses(rng, accepted, members_by_group, count, batch_size, log):
+    group_ids = list(members_by_group)
+    expenses = []
+    splits = []
+    written = 0
+
+    def flush():
+        with transaction.atomic():
+            Expense.objects.bulk_create(expenses, batch_size=batch_size)
+            ExpenseSplit.objects.bulk_create(splits, batch_size=batch_size)
+        expenses.clear()
+        splits.clear()
+
+    for _ in range(count):
+        data = {
+            'group_id': None, 'friend_id': None,
+            'total_amount': Decimal(rng.randint(100, 50000)) / 100,
+            'currency': 'USD', 'description': _sentence(rng, (1, 4)),
+            'deadline': None, 'receipt_url': None,
+        }
+        if group_ids and (not accepted or rng.random() < 0.7):
+            data['group_id'] = _skewed(rng, group_ids, power=2)
+            data['paid_by'] = rng.choice(members_by_group[data['group_id']])
+        elif accepted:
+            data['paid_by'], data['friend_id'] = rng.sample(_skewed(rng, accepted, power=2), 2)
+        else:
+            break
+        expense, expense_splits = expense_import.build_expense(data, members_by_group)
+        expenses.append(expense)
+        splits.extend(expense_splits)
+        written += 1
+        if len(splits) >= batch_size:
+            flush()
+    flush()
+    log(f'{written} expenses')
+
+
+def generate(seed=0, users=10000, mean_friends=20, groups=1000, group_size=6, direct_messages=1000000,
+             group_messages=500000, expenses=200000, batch_size=5000, log=lambda message: None):
+    """
+    Write a synthetic data set. The same arguments always produce the same
+    data; call cleanup() first to regenerate it.
+
+    Returns:
+        dict: the arguments, for the benchmark report
+    """
+    rng = random.Random(seed)
+    user_ids = _users(rng, users, batch_size, log)
+    accepted = _friendships(rng, user_ids, mean_friends, batch_size, log)
+    members_by_group = _groups(rng, user_ids, groups, group_size, batch_size, log)
+    _direct_messages(rng, accepted, direct_messages, batch_size, log)
+    _group_messages(rng, members_by_group, group_messages, batch_size, log)
+    _expenses(rng, accepted, members_by_group, expenses, batch_size, log)
+    return {
+        'seed': seed, 'users': users, 'mean_friends': mean_friends, 'groups': groups,
+        'group_size': group_size, 'direct_messages': direct_messages,
+        'group_messages': group_messages, 'expenses': expenses,
+    }
+
+
+def generate_group(seed=0, members=8, expenses=10000, days=365, currencies=('USD',), batch_size=5000,
+                   log=lambda message: None):
+    """
+    Write one seeded group whose members share `expenses` equal-split
+    expenses, spread over the last `days` days and the given currencies,
+    for the group summary benchmark. The same seed always produces the
+    same group; if it already exists it is reused as is.
+
+    Returns:
+        str: The group id
+    """
+    rng = random.Random(seed)
+    group_id = str(uuid.UUID(int=rng.getrandbits(128)))
+    if Group.objects.filter(id=group_id).exists():
+        log(f'Reusing group {group_id}')
+        return group_id
+
+    user_ids = _users(rng, members, batch_size, log, tag=f'g{seed}-')
+    with transaction.atomic():
+        Group.objects.create(id=group_id, name=f'{GROUP_PREFIX}summary-{seed}', created_by_id=user_ids[0])
+        GroupMember.objects.bulk_create([
+            GroupMember(group_id=group_id, user_id=user_id, role='admin' if position == 0 else 'member')
+            for position, user_id in enumerate(user_ids)
+        ])
+
+    members_by_group = {group_id: user_ids}
+    now = timezone.now()
+    batch = []
+    dates = []
+    splits = []
+
+    def flush():
+        with transaction.atomic():
+            Expense.objects.bulk_create(batch, batch_size=batch_size)
+            # bulk_create stamps created_at with the current time, spread the dates afterwards
+            for expense, created_at in zip(batch, dates):
+                expense.created_at = created_at
+            Expense.objects.bulk_update(batch, ['created_at'], batch_size=batch_size)
+            ExpenseSplit.objects.bulk_create(splits, batch_size=batch_size)
+        batch.clear()
+        dates.clear()
+        splits.clear()
+
+    for _ in range(expenses):
+        expense, expense_splits = expense_import.build_expense({
+            'group_id': group_id, 'friend_id': None, 'paid_by': rng.choice(user_ids),
+            'total_amount': Decimal(rng.randint(100, 50000)) / 100, 'currency': rng.choice(currencies),
+            'description': _sentence(rng, (1, 4)), 'deadline': None, 'receipt_url': None,
+        }, members_by_group)
+        batch.append(expense)
+        dates.append(now - timedelta(days=rng.randrange(days), seconds=rng.randrange(86400)))
+        splits.extend(expense_splits)
+        if len(splits) >= batch_size:
+            flush()
+    flush()
+    log(f'Group {group_id}: {members} members, {expenses} expenses')
+    return group_id
+
+
+def cleanup_steps():
+    in_groups = _seeded('group__created_by')
+    Step = deletion_jobs.Step
+    return [
+        Step('group_read_receipts', GroupReadReceipt, in_groups | _seeded('user')),
+        Step('group_messages', GroupMessage, in_groups | _seeded('sender')),
+        Step('group_members', GroupMember, in_groups | _seeded('user')),
+        Step('expense_splits', ExpenseSplit, _seeded('user') | _seeded('expense__paid_by')),
+        Step('expenses', Expense, _seeded('paid_by')),
+        Step('direct_messages', DirectMessage, _seeded('sender') | _seeded('recipient')),
+        Step('friendship_changes', FriendshipChange, _seeded('user')),
+        Step('friendships', Friendship, _seeded('user1') | _seeded('user2')),
+        Step('groups', Group, _seeded('created_by')),
+        Step('users', User, _seeded()),
+    ]
+
+
+def cleanup(chunk_size=5000, log=lambda message: None):
+    """Delete every seeded row in pk-ordered chunks. Returns the row counts per table."""
+    counts = defaultdict(int)
+    for step in cleanup_steps():
+        while True:
+            deleted = deletion_jobs.run_chunk(step, chunk_size)
+            if not deleted:
+                break
+            counts[step.name] += deleted
+        log(f'{step.name}: {counts[step.name]} deleted')
+    return dict(counts)
@@ -1,8 +1,57 @@
 import uuid
+import base64
+import hashlib
+import json
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
 from .models import *
-from django.db.models import Exists, OuterRef, Subquery, Count, F 
+from . import (
+    autocomplete, deletion_jobs, friend_graph, friend_versions, group_info, group_membership, group_summary,
+    notifications, split_allocator, user_search,
+)
+from django.conf import settings
+from django.db import connection, transaction, IntegrityError
+from django.db.models import Case, DecimalField, Subquery, Count, F, Sum, Value, When
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
+logger = logging.getLogger(__name__)
+
+
+def _encode_cursor(created_at, pk):
+    """Opaque keyset cursor for (created_at, id) ordered listings."""
+    raw = f"{created_at.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def _decode_cursor(cursor):
+    """Inverse of _encode_cursor, raises ValueError on malformed input."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        created_at, pk = raw.split('|', 1)
+        return datetime.fromisoformat(created_at), pk
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def _request_fingerprint(*params):
+    """Digest of a write request's parameters, stored with its idempotency key."""
+    return hashlib.sha256(json.dumps(params, default=str).encode('utf-8')).hexdigest()
+
+
+def _replay(previous, fingerprint):
+    """Stored result of an idempotent request, unless the key came with different parameters."""
+    # Keys stored before fingerprints were recorded have an empty request_hash
+    if previous.request_hash and previous.request_hash != fingerprint:
+        return {
+            'status': 'ERROR',
+            'error_code': 'IDEMPOTENCY_KEY_REUSED',
+            'message': 'This idempotency key was already used for a different request'
+        }
+    return previous.response
+
 
 class DatabaseService:
     @staticmethod
@@ -41,7 +90,7 @@ class DatabaseService:
                 }
             }
         except Exception as e:
-            print(e)
+            logger.exception("Could not create user %s", name)
             return {
                 'status': 'ERROR',
                 'message': str(e)
@@ -72,6 +121,7 @@ class DatabaseService:
                     'updated_at': user.updated_at,
                     'currency' : user.currency,
                     'profile_photo' : user.avatar_url,
+                    'avatar_variants' : user.avatar_variants,
                 }
             }
         except User.DoesNotExist:
@@ -81,58 +131,119 @@ class DatabaseService:
             }
         
     @staticmethod
-    def get_user_friends(user_id):
+    def _friend_entry(friendship, user):
+        friend = friendship.user2 if friendship.user1_id == user.id else friendship.user1
+        if friendship.status == Friendship.BLOCKED:
+            return {
+                'friend_id': "null",
+                'username': friend.name,
+                'friend_name': friend.full_name,
+                'email': "null",
+                'profile_photo': friend.list_avatar_url,
+                'status': friendship.get_status_display(),
+                'initiator': friendship.action_user_id == user.id,
+                'created_at': friendship.created_at
+            }
+        return {
+            'friend_id': friend.id,
+            'username': friend.name,
+            'friend_name': friend.full_name,
+            'email': friend.email,
+            'profile_photo': friend.list_avatar_url,
+            'status': friendship.get_status_display(),
+            'initiator': friendship.action_user_id,
+            'created_at': friendship.created_at,
+            'friendship_id': friendship.id
+        }
+
+    @staticmethod
+    def get_friends_version(cognito_id):
         """
-        Get all friends efficiently using a single query
+        Current friends_version of a user, bumped on every friendship change
+
+        Returns:
+            dict: Status and version
+        """
+        version = User.objects.filter(cognito_id=cognito_id).values_list('friends_version', flat=True).first()
+        if version is None:
+            return {
+                'status': 'ERROR',
+                'message': 'User not found'
+            }
+        return {
+            'status': 'SUCCESS',
+            'version': version
+        }
+
+    @staticmethod
+    def get_user_friends(user_id, cursor=None, limit=None, since_version=None):
+        """
+        Get the user's friendships, newest first.
+
+        Args:
+            user_id (str): Cognito user ID
+            cursor (str, optional): next_cursor returned by the previous page
+            limit (int, optional): Page size, everything when omitted
+            since_version (int, optional): Only friendships changed after this
+                friends version; deleted ones are listed in 'removed'
+        Returns:
+            dict: Friendships plus the friends version they reflect
         """
         try:
             user = User.objects.get(cognito_id=user_id)
-            friendships = Friendship.objects.filter(
-                models.Q(user1=user) | models.Q(user2=user)
-            ).select_related('user1', 'user2', 'action_user')
+            friendships = Friendship.objects.select_related('user1', 'user2')
 
-            friends_list = []
-            for friendship in friendships:
-                friend = friendship.user2 if friendship.user1.id == user.id else friendship.user1
-                if(friendship.status == 'BLOCKED' or friendship.status == 'blocked'):
-                    friends_list.append({
-                        'friend_id': "null",
-                        'username': friend.name,
-                        'friend_name': friend.full_name,
-                        'email': "null",
-                        'profile_photo': friend.avatar_url,
-                        'status': friendship.status,
-                        'initiator': friendship.action_user.id == user_id,
-                        'created_at': friendship.created_at
-                    })
-                else:
-                    friends_list.append({   
-                        'friend_id': friend.id,
-                        'username': friend.name,
-                        'friend_name': friend.full_name,
-                        'email': friend.email,
-                        'profile_photo': friend.avatar_url,
-                        'status': friendship.status,
-                        'initiator': friendship.action_user.id,
-                        'created_at': friendship.created_at,
-                        'friendship_id': friendship.id
-                    })
+            if since_version is not None:
+                friendship_ids, version, has_more = friend_versions.changes_since(user.id, since_version, limit)
+                existing = friendships.in_bulk(friendship_ids)
+                return {
+                    'status': 'SUCCESS',
+                    'friends': [DatabaseService._friend_entry(existing[friendship_id], user)
+                                for friendship_id in friendship_ids if friendship_id in existing],
+                    'removed': [friendship_id for friendship_id in friendship_ids if friendship_id not in existing],
+                    'version': version,
+                    'has_more': has_more
+                }
+
+            page_filter = None
+            if cursor:
+                cursor_created_at, cursor_id = _decode_cursor(cursor)
+                page_filter = (
+                    models.Q(created_at__lt=cursor_created_at) |
+                    models.Q(created_at=cursor_created_at, id__lt=cursor_id)
+                )
+            keys = Friendship.of_user(user.id, ('id', 'created_at'), extra=page_filter).order_by('-created_at', '-id')
+            keys = list(keys[:limit + 1] if limit else keys)
+            has_more = bool(limit) and len(keys) > limit
+            if has_more:
+                keys = keys[:limit]
+            friendships_by_id = friendships.in_bulk([friendship_id for friendship_id, _ in keys])
+            friendships = [friendships_by_id[friendship_id] for friendship_id, _ in keys if friendship_id in friendships_by_id]
 
             return {
                 'status': 'SUCCESS',
-                'friends': friends_list
+                'friends': [DatabaseService._friend_entry(friendship, user) for friendship in friendships],
+                'version': user.friends_version,
+                'next_cursor': _encode_cursor(friendships[-1].created_at, friendships[-1].id) if has_more else None,
+                'has_more': has_more
             }
         except User.DoesNotExist:
             return {
                 'status': 'ERROR',
                 'message': 'User not found'
             }
+        except ValueError as e:
+            return {
+                'status': 'ERROR',
+                'message': str(e)
+            }
 
     @staticmethod
-    def update_user_details(cognito_id, full_name=None, phone_number=None, avatar_url=None, currency=None):
+    def update_user_details(cognito_id, full_name=None, phone_number=None, currency=None):
         """
-        Update user fields (full_name, phone_number, avatar_url, currency, etc.)
-        based on kwargs only if they exist.
+        Update user fields (full_name, phone_number, currency, etc.)
+        based on kwargs only if they exist. The avatar and its variants
+        change only through update_profile_photo and avatars.confirm_upload.
         """
         try:
             user = User.objects.get(cognito_id=cognito_id)
@@ -142,8 +253,6 @@ class DatabaseService:
                 user.full_name = full_name
             if phone_number:
                 user.phone_number = phone_number
-            if avatar_url:
-                user.avatar_url = avatar_url
             if currency:
                 user.currency = currency
 
@@ -196,13 +305,10 @@ class DatabaseService:
                 }
 
             # Check if friendship already exists
-            existing_friendship = Friendship.objects.filter(
-                (models.Q(user1=user) & models.Q(user2=user2)) |
-                (models.Q(user1=user2) & models.Q(user2=user))
-            ).first()
+            relation = friend_graph.relation(user.id, user2.id)
 
-            if existing_friendship:
-                if existing_friendship.status == 'ACCEPTED':
+            if relation:
+                if relation == friend_graph.ACCEPTED:
                     return {
                         'status': 'ERROR',
                         'message': 'Friendship already exists'
@@ -226,7 +332,7 @@ class DatabaseService:
                 user1=user1,
                 user2=user2,
                 action_user=sender,
-                status='PENDING'
+                status=Friendship.PENDING
             )
 
             friend = recipient
@@ -238,8 +344,8 @@ class DatabaseService:
                         'id': friendship.id,
                         'friend_name': friend.full_name,
                         'username': friend.name,
-                        'profile_photo': friend.avatar_url,
-                        'status': friendship.status,
+                        'profile_photo': friend.list_avatar_url,
+                        'status': friendship.get_status_display(),
                         'created_at': friendship.created_at
                     }
 
@@ -256,6 +362,102 @@ class DatabaseService:
                 'message': str(e)
             }
 
+    @staticmethod
+    def send_friend_requests(cognito_id, user_ids):
+        """
+        Send friend requests to several users at once.
+        Recipients are checked against the sender's preloaded relations and
+        every new request is inserted with a single bulk_create.
+
+        Args:
+            cognito_id (str): Cognito ID of the sender
+            user_ids (list): IDs of the recipients
+        Returns:
+            dict: The requests sent and an error per recipient that was skipped
+        """
+        try:
+            user = User.objects.get(cognito_id=cognito_id)
+            user_ids = list(dict.fromkeys(user_ids))
+            recipients = User.objects.in_bulk(user_ids)
+            relations = friend_graph.relations(user.id)
+
+            errors = []
+            friendships = []
+            for recipient_id in user_ids:
+                relation = relations.get(recipient_id)
+                if recipient_id not in recipients:
+                    errors.append({'user_id': recipient_id, 'message': 'User not found'})
+                elif recipient_id == user.id:
+                    errors.append({'user_id': recipient_id, 'message': 'Cannot send friend request to yourself'})
+                elif relation == friend_graph.ACCEPTED:
+                    errors.append({'user_id': recipient_id, 'message': 'Friendship already exists'})
+                elif relation == friend_graph.BLOCKED:
+                    errors.append({'user_id': recipient_id, 'message': 'Cannot send friend request to this user'})
+                elif relation:
+                    errors.append({'user_id': recipient_id, 'message': 'Friend request is pending'})
+                else:
+                    user1_id, user2_id = Friendship.ordered(user.id, recipient_id)
+                    friendships.append(Friendship(
+                        id=str(uuid.uuid4()),
+                        user1_id=user1_id,
+                        user2_id=user2_id,
+                        action_user=user,
+                        status=Friendship.PENDING
+                    ))
+
+            with transaction.atomic():
+                Friendship.objects.bulk_create(friendships, ignore_conflicts=True)
+                # Pairs that raced with another request were skipped by the database
+                created_ids = set(
+                    Friendship.objects.filter(id__in=[f.id for f in friendships]).values_list('id', flat=True)
+                )
+                created = [f for f in friendships if f.id in created_ids]
+                # bulk_create does not send the Friendship signals
+                friend_graph.record_change(*created)
+                friend_versions.bump(*created)
+                notifications.publish_on_commit(
+                    notifications.notification(
+                        f.user2_id if f.user1_id == user.id else f.user1_id,
+                        'friend_request',
+                        f'{user.full_name} sent you a friend request',
+                        friendship_id=f.id
+                    ) for f in created
+                )
+
+            sent = []
+            for friendship in friendships:
+                friend_id = friendship.user2_id if friendship.user1_id == user.id else friendship.user1_id
+                if friendship.id in created_ids:
+                    friend = recipients[friend_id]
+                    sent.append({
+                        'id': friendship.id,
+                        'friend_id': friend.id,
+                        'friend_name': friend.full_name,
+                        'username': friend.name,
+                        'profile_photo': friend.list_avatar_url,
+                        'status': friendship.get_status_display(),
+                        'created_at': friendship.created_at
+                    })
+                else:
+                    errors.append({'user_id': friend_id, 'message': 'Friend request is pending'})
+
+            return {
+                'status': 'SUCCESS',
+                'message': f'{len(sent)} friend requests sent',
+                'friendships': sent,
+                'errors': errors
+            }
+        except User.DoesNotExist:
+            return {
+                'status': 'ERROR',
+                'message': 'User not found'
+            }
+        except Exception as e:
+            return {
+                'status': 'ERROR',
+                'message': str(e)
+            }
+
     @staticmethod
     def get_user_id_by_cognito_id(cognito_id):
         """
@@ -297,22 +499,22 @@ class DatabaseService:
             friendship = Friendship.objects.get(id=request_id)
 
             # Verify the user is the recipient of the friend request
-            if friendship.action_user.id == user.id:
+            if friendship.action_user_id == user.id or user.id not in (friendship.user1_id, friendship.user2_id):
                 return {
                     'status': 'ERROR',
                     'message': 'User not authorized to accept this friend request'
                 }
 
             # Verify the request is pending
-            if friendship.status != 'PENDING':
+            if friendship.status != Friendship.PENDING:
                 return {
                     'status': 'ERROR',
-                    'message': f'Friend request is not pending, current status: {friendship.status}'
+                    'message': f'Friend request is not pending, current status: {friendship.get_status_display()}'
                 }
 
             # Accept the friend request
-            friendship.status = 'ACCEPTED'
-            friendship.save()
+            friendship.status = Friendship.ACCEPTED
+            friendship.save(update_fields=['status'])
 
             return {
                 'status': 'SUCCESS',
@@ -382,33 +584,31 @@ class DatabaseService:
                 }
 
             # Check if a friendship record already exists (either pending, accepted, or previously blocked)
-            friendship = Friendship.objects.filter(
-                (models.Q(user1=user) & models.Q(user2=blocked_user)) |
-                (models.Q(user1=blocked_user) & models.Q(user2=user))
-            ).first()
+            friendship = Friendship.between(user.id, blocked_user.id).first()
 
             if friendship:
-                if friendship.status == 'BLOCKED':
+                if friendship.status == Friendship.BLOCKED:
                     return {
                         'status': 'ERROR',
                         'message': 'User is already blocked'
                     }
                 else:
                     # Update existing relationship status to BLOCKED
-                    friendship.status = 'BLOCKED'
+                    friendship.status = Friendship.BLOCKED
                     friendship.action_user = user
-                    friendship.save()
+                    friendship.save(update_fields=['status', 'action_user'])
                     return {
                         'status': 'SUCCESS',
                         'message': 'User blocked successfully'
                     }
             else:
                 # No friendship record exists, so create a new one with BLOCKED status
+                user1_id, user2_id = Friendship.ordered(user.id, blocked_user.id)
                 friendship = Friendship.objects.create(
-                    user1=user,
-                    user2=blocked_user,
+                    user1_id=user1_id,
+                    user2_id=user2_id,
                     action_user=user,
-                    status='BLOCKED'
+                    status=Friendship.BLOCKED
                 )
                 return {
                     'status': 'SUCCESS',
@@ -441,6 +641,8 @@ class DatabaseService:
         try:
             user = User.objects.get(cognito_id=cognito_id)
             user.avatar_url = photo_url
+            # Variants of the previous photo no longer apply
+            user.avatar_variants = {}
             user.save()
             
             return {
@@ -526,7 +728,7 @@ class DatabaseService:
                     'user_id': partner.id,
                     'username': partner.name,
                     'full_name': partner.full_name,
-                    'profile_photo': partner.avatar_url,
+                    'profile_photo': partner.list_avatar_url,
                     'email': partner.email,
                     'conversation_last_msg': {
                         'message_id': last_message.id,
@@ -534,8 +736,8 @@ class DatabaseService:
                         'message_type': last_message.message_type,
                         'created_at': last_message.created_at,
                         'is_read': last_message.is_read,
-                        'sender_id': last_message.sender.id,
-                        'is_sent_by_me': last_message.sender.id == user.id
+                        'sender_id': last_message.sender_id,
+                        'is_sent_by_me': last_message.sender_id == user.id
                     }
                 }
                 conversations.append(conversation)
@@ -558,13 +760,12 @@ class DatabaseService:
                 'pagination': pagination
             }
         except User.DoesNotExist:
-            print(f"User not found with cognito_id: {cognito_id}")
             return {
                 'status': 'ERROR',
                 'message': 'User not found'
             }
         except Exception as e:
-            print(f"Exception in get_direct_messages: {type(e).__name__}: {str(e)}")
+            logger.exception("Could not list conversations of %s", cognito_id)
             return {
                 'status': 'ERROR',
                 'message': str(e)
@@ -583,10 +784,9 @@ class DatabaseService:
         '''
         try:
             user = User.objects.get(cognito_id=cognito_id)
-            group = Group.objects.get(id=group_id)
             
-            # Check if user is a member
-            is_member = GroupMember.objects.filter(user=user, group=group).exists()
+            # Check if user is a member, also rejects unknown groups
+            is_member = group_membership.is_member(group_id, user.id)
             if not is_member:
                 return {
                     'status': 'ERROR',
@@ -594,20 +794,20 @@ class DatabaseService:
                 }
                 
             # Get total messages for pagination
-            total_messages = GroupMessage.objects.filter(group=group).count()
+            total_messages = GroupMessage.objects.filter(group_id=group_id).count()
             total_pages = (total_messages + page_size - 1) // page_size
             
             # Apply proper pagination with ordering
             start_idx = (page - 1) * page_size
             
             # Order messages by newest first (more typical for chat interfaces)
-            messages = GroupMessage.objects.filter(group=group) \
+            messages = GroupMessage.objects.filter(group_id=group_id) \
                 .select_related('sender', 'group') \
                 .order_by('-created_at')[start_idx:start_idx+page_size]
             
             # Get read receipt for efficient status checking
             try:
-                read_receipt = GroupReadReceipt.objects.get(user=user, group=group)
+                read_receipt = GroupReadReceipt.objects.get(user=user, group_id=group_id)
                 last_read_time = read_receipt.last_read_message.created_at
             except GroupReadReceipt.DoesNotExist:
                 last_read_time = None
@@ -661,11 +861,6 @@ class DatabaseService:
                 'status': 'ERROR',
                 'message': 'User not found'
             }
-        except Group.DoesNotExist:
-            return {
-                'status': 'ERROR',
-                'message': 'Group not found'
-            }
         except Exception as e:
             return {
                 'status': 'ERROR',
@@ -693,25 +888,23 @@ class DatabaseService:
                         'status': 'ERROR',
                         'message': 'Cannot send message to yourself'
                     }
-                relation = Friendship.objects.filter(   
-                    ((models.Q(user1=sender) & models.Q(user2=recipient)) or
-                    (models.Q(user1=recipient) & models.Q(user2=sender))) and
-                    models.Q(status='Accepted' or 'accepted')
-                )
-
-                if(relation):
-                    message = DirectMessage.objects.create(
-                        sender=sender,
-                        recipient=recipient,
-                        content=content,
-                        message_type=message_type,
-                        file_url=file_url
-                    )
+                if not friend_graph.are_friends(sender.id, recipient.id):
                     return {
-                        'status': 'SUCCESS',
-                        'message': 'Direct message sent successfully',
-                        'message_id': message.id
+                        'status': 'ERROR',
+                        'message': 'You can only message your friends'
                     }
+                message = DirectMessage.objects.create(
+                    sender=sender,
+                    recipient=recipient,
+                    content=content,
+                    message_type=message_type,
+                    file_url=file_url
+                )
+                return {
+                    'status': 'SUCCESS',
+                    'message': 'Direct message sent successfully',
+                    'message_id': message.id
+                }
         except User.DoesNotExist:
             return {
                 'status': 'ERROR',
@@ -737,31 +930,20 @@ class DatabaseService:
         try:
             user = User.objects.get(cognito_id=cognito_id)
 
-            # Find users matching search criteria
-            users = User.objects.filter(
-                models.Q(name__icontains=search_term) |
-                models.Q(email__icontains=search_term) |
-                models.Q(full_name__icontains=search_term)
-            ).exclude(id=user.id)[:limit]
-
-            # Annotate each user with friendship status
-            users = users.annotate(
-                is_friend=Exists(
-                    Friendship.objects.filter(
-                        # The outerRef here refrences the user in the main query
-                        (models.Q(user1=OuterRef('pk')) & models.Q(user2=user)) |
-                        (models.Q(user1=user) & models.Q(user2=OuterRef('pk')))
-                    )
-                )
-            )[:limit]
+            # Find users matching search criteria, exact and prefix matches first
+            users = user_search.search_queryset(search_term, User.objects.exclude(id=user.id))
+
+            # Friendship status of every result from the cached friend graph
+            relations = friend_graph.relations(user.id)
+            users = users[:limit]
 
             # Then map results to dictionaries
             users_list = [{
                 'user_id': u.id,
                 'username': u.name,
                 'full_name': u.full_name,               
-                'profile_photo': u.avatar_url,
-                'is_friend': u.is_friend
+                'profile_photo': u.list_avatar_url,
+                'is_friend': u.id in relations
             } for u in users]
             return {
                 'status': 'SUCCESS',
@@ -778,6 +960,50 @@ class DatabaseService:
                 'message': str(e)
             }
         
+    @staticmethod
+    def autocomplete_users(cognito_id, prefix, limit=10):
+        '''
+        Users whose username, full name or a word of it starts with prefix,
+        served from the autocomplete index. Falls back to search_users when
+        the index is unavailable.
+        Args:
+            cognito_id (str): Cognito user ID
+            prefix (str): Text typed so far
+            limit (int, optional): Maximum number of results to return
+        Returns:
+            dict: Status of the operation and the matching users
+        '''
+        try:
+            user = User.objects.get(cognito_id=cognito_id)
+            user_ids = autocomplete.lookup(prefix, limit, exclude_ids={user.id})
+            if user_ids is None:
+                return DatabaseService.search_users(cognito_id, prefix, limit)
+
+            users = User.objects.in_bulk(user_ids)
+            statuses = friend_graph.relations(user.id)
+            users_list = [{
+                'user_id': u.id,
+                'username': u.name,
+                'full_name': u.full_name,
+                'profile_photo': u.list_avatar_url,
+                'is_friend': u.id in statuses,
+                'friendship_status': statuses.get(u.id)
+            } for u in (users[user_id] for user_id in user_ids if user_id in users)]
+            return {
+                'status': 'SUCCESS',
+                'users': users_list
+            }
+        except User.DoesNotExist:
+            return {
+                'status': 'ERROR',
+                'message': 'User not found'
+            }
+        except Exception as e:
+            return {
+                'status': 'ERROR',
+                'message': str(e)
+            }
+
     @staticmethod
     def reject_friend_request(cognito_id, request_id):
         """
@@ -793,18 +1019,18 @@ class DatabaseService:
 
         try:
             user = User.objects.get(cognito_id=cognito_id)
-            friendship = Friendship.objects.select_related('user1', 'user2').get(id= request_id)
+            friendship = Friendship.objects.get(id=request_id)
 
-            if friendship.user1 != user and friendship.user2 != user:
+            if user.id not in (friendship.user1_id, friendship.user2_id):
                 return {
                     'status': 'ERROR',
                     'message': 'User not authorized to reject this friend request'
                 }
 
-            if friendship.status != 'PENDING':
+            if friendship.status != Friendship.PENDING:
                 return {
                     'status': 'ERROR',
-                    'message': f'Friend request is not pending, current status: {friendship.status}'
+                    'message': f'Friend request is not pending, current status: {friendship.get_status_display()}'
                 }
 
             friendship.delete()
@@ -844,12 +1070,13 @@ class DatabaseService:
         """
         try:
             user = User.objects.get(cognito_id=cognito_id)
-            friendship = Friendship.objects.filter(id=friendship_id).select_related('user1', 'user2').first()
+            friendship = Friendship.objects.filter(id=friendship_id).first()
             if friendship:
-                if friendship.user1 == user or friendship.user2 == user:
+                if user.id in (friendship.user1_id, friendship.user2_id):
                     if block:
-                        friendship.status = 'BLOCKED'
-                        friendship.save()
+                        friendship.status = Friendship.BLOCKED
+                        friendship.action_user = user
+                        friendship.save(update_fields=['status', 'action_user'])
                     else:
                         friendship.delete()
                     return {
@@ -889,63 +1116,22 @@ class DatabaseService:
             dict: operation status and info if successful. 
         """
         try:
-            # First, get the user
-            user = User.objects.get(cognito_id=user_sub)
-            # Check if the user has access to group
-            if not GroupMember.objects.filter(user=user, group_id=group_id).exists():
+            user_id = User.objects.filter(cognito_id=user_sub).values_list('id', flat=True).first()
+            if user_id is None:
+                raise User.DoesNotExist
+
+            # Check if the user has access to group, against the membership
+            # cache rather than the member list of the (display only) info cache
+            if not group_membership.is_member(group_id, user_id):
                 return {
                     'status': 'ERROR',
                     'message': 'User is not a member of this group'
                 }
-
-            group = Group.objects.get(id=group_id)
-            members = group.members.all().select_related('user')
-            group_members = []
-            
-            for member in members:
-                data_payload = {
-                    'user_id' : member.user.id,
-                    'username': member.user.name,
-                    'full_name': member.user.full_name,
-                    'profile_photo': member.user.avatar_url,
-                    'phone_number': member.user.phone_number,
-                    'role' : member.role,
-                    'joined_at': member.joined_at,
-                    'status': 'member'
-                }
-                group_members.append(data_payload)
-            
-            # Get pending invitations for this group
-            invitations = GroupInvitation.objects.filter(group=group).select_related('invited_user')
-            invited_users = []
-            
-            for invite in invitations:
-                invited_users.append({
-                    'user_id': invite.invited_user.id,
-                    'username': invite.invited_user.name,
-                    'full_name': invite.invited_user.full_name,
-                    'profile_photo': invite.invited_user.avatar_url,
-                    'invited_at': invite.created_at,
-                    'invited_by': invite.invited_by.id,
-                    'invite_id': invite.id,
-                    'status': 'invited'
-                })
-            
-            group_data = {
-                'group_name' : group.name,
-                'group_id': group.id,
-                'description': group.description,
-                'created_at': group.created_at,
-                'photo_url': group.photo_url,
-                'group_size': len(members),
-                'created_by': group.created_by.id
-            }
+            info = group_info.get(group_id)
 
             return {
                 'status' : 'SUCCESS',
-                'group_info': group_data,
-                'group_members' : group_members,
-                'invited_users': invited_users
+                **info
             }
         except User.DoesNotExist:
             return {
@@ -1023,7 +1209,7 @@ class DatabaseService:
             group = Group.objects.get(id=group_id)
 
             # Check if the user is an admin of the group
-            if not GroupMember.objects.filter(user=user, group=group, role='admin').exists():
+            if not group_membership.is_admin(group.id, user.id):
                 return {
                     'status': 'ERROR',
                     'message': 'User is not an admin of this group'
@@ -1036,6 +1222,12 @@ class DatabaseService:
                     'message': 'User is already a member of this group'
                 }
 
+            if GroupInvitation.objects.filter(invited_user=invited_user, group=group).exists():
+                return {
+                    'status': 'ERROR',
+                    'message': 'User is already invited to this group'
+                }
+
             # Create a new invitation
             invitation = GroupInvitation.objects.create(
                 group=group,
@@ -1064,6 +1256,104 @@ class DatabaseService:
                 'message': str(e)
             }
 
+    @staticmethod
+    def invite_users_to_group(user_sub, group_id, user_ids):
+        """
+        (Only admins can invite)
+        Invite several users to your group at once. Members and pending
+        invitations are preloaded once and the new invitations are inserted
+        with a single bulk_create.
+        Args:
+            user_sub (str): Cognito ID of the user inviting
+            group_id (str): ID of the group
+            user_ids (list): IDs of the users being invited
+        Returns:
+            dict: The invitations created and an error per user that was skipped
+        """
+        try:
+            user = User.objects.get(cognito_id=user_sub)
+            group = Group.objects.get(id=group_id)
+
+            # Check if the user is an admin of the group
+            if not group_membership.is_admin(group.id, user.id):
+                return {
+                    'status': 'ERROR',
+                    'message': 'User is not an admin of this group'
+                }
+
+            user_ids = list(dict.fromkeys(user_ids))
+            existing_users = set(User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+            members = set(
+                GroupMember.objects.filter(group=group, user_id__in=user_ids).values_list('user_id', flat=True)
+            )
+            invited = set(
+                GroupInvitation.objects.filter(group=group, invited_user_id__in=user_ids)
+                .values_list('invited_user_id', flat=True)
+            )
+
+            errors = []
+            invitations = []
+            for invited_id in user_ids:
+                if invited_id not in existing_users:
+                    errors.append({'user_id': invited_id, 'message': 'User not found'})
+                elif invited_id in members:
+                    errors.append({'user_id': invited_id, 'message': 'User is already a member of this group'})
+                elif invited_id in invited:
+                    errors.append({'user_id': invited_id, 'message': 'User is already invited to this group'})
+                else:
+                    invitations.append(GroupInvitation(
+                        id=str(uuid.uuid4()),
+                        group=group,
+                        invited_user_id=invited_id,
+                        invited_by=user
+                    ))
+
+            with transaction.atomic():
+                GroupInvitation.objects.bulk_create(invitations, ignore_conflicts=True)
+                created_ids = set(
+                    GroupInvitation.objects.filter(id__in=[i.id for i in invitations]).values_list('id', flat=True)
+                )
+                # bulk_create does not send the GroupInvitation signals
+                group_info.invalidate(group.id)
+                notifications.publish_on_commit(
+                    notifications.notification(
+                        invitation.invited_user_id,
+                        'group_invite',
+                        f'{user.full_name} invited you to {group.name}',
+                        invitation_id=invitation.id,
+                        group_id=str(group.id)
+                    ) for invitation in invitations if invitation.id in created_ids
+                )
+
+            errors.extend(
+                {'user_id': invitation.invited_user_id, 'message': 'User is already invited to this group'}
+                for invitation in invitations if invitation.id not in created_ids
+            )
+            return {
+                'status': 'SUCCESS',
+                'message': f'{len(created_ids)} users invited to the group',
+                'invitations': [{
+                    'invitation_id': invitation.id,
+                    'user_id': invitation.invited_user_id
+                } for invitation in invitations if invitation.id in created_ids],
+                'errors': errors
+            }
+        except User.DoesNotExist:
+            return {
+                'status': 'ERROR',
+                'message': 'User not found'
+            }
+        except Group.DoesNotExist:
+            return {
+                'status': 'ERROR',
+                'message': 'Group not found'
+            }
+        except Exception as e:
+            return {
+                'status': 'ERROR',
+                'message': str(e)
+            }
+
     @staticmethod    
     def leave_group(user_sub, group_id):
         """
@@ -1076,18 +1366,15 @@ class DatabaseService:
         """
         try:
             user = User.objects.get(cognito_id=user_sub)
-            group = Group.objects.get(id=group_id)
 
-            # Check if the user is a member of the group
-            if not GroupMember.objects.filter(user=user, group=group).exists():
+            # Remove the user from the group, nothing is deleted for non-members and unknown groups
+            deleted, _ = GroupMember.objects.filter(user=user, group_id=group_id).delete()
+            if not deleted:
                 return {
                     'status': 'ERROR',
                     'message': 'User is not a member of this group'
                 }
 
-            # Remove the user from the group
-            GroupMember.objects.filter(user=user, group=group).delete()
-
             return {
                 'status': 'SUCCESS',
                 'message': 'User left the group successfully'
@@ -1097,11 +1384,6 @@ class DatabaseService:
                 'status': 'ERROR',
                 'message': 'User not found'
             }
-        except Group.DoesNotExist:
-            return{
-                'status': 'ERROR',
-                'message': 'Group not found'
-            }
         except Exception as e:
             return {
                 'status' : 'ERROR',
@@ -1210,7 +1492,7 @@ class DatabaseService:
                 }
 
             # Check if the group already has the user as a member
-            if GroupMember.objects.filter(user=user, group=invitation.group).exists():
+            if GroupMember.objects.filter(user=user, group_id=invitation.group_id).exists():
                 return {
                     'status': 'ERROR',
                     'message': 'User is already a member of this group'
@@ -1246,6 +1528,88 @@ class DatabaseService:
                 'message': str(e)
             }
     
+    @staticmethod
+    def accept_group_invites(user_sub, invite_ids):
+        """
+        Accept several group invites at once. The memberships are inserted
+        with a single bulk_create and the accepted invitations deleted with
+        one query; the other members of each group are notified in one
+        broker pipeline.
+        Args:
+            user_sub (str): Cognito ID of the user accepting the invites
+            invite_ids (list): IDs of the group invitations
+        Returns:
+            dict: The groups joined and an error per invitation that was skipped
+        """
+        try:
+            user = User.objects.get(cognito_id=user_sub)
+            invite_ids = list(dict.fromkeys(invite_ids))
+            # Only the invited user's own invitations are found
+            invitations = GroupInvitation.objects.filter(
+                id__in=invite_ids, invited_user=user
+            ).select_related('group').in_bulk()
+            member_groups = set(
+                GroupMember.objects.filter(
+                    user=user, group_id__in=[i.group_id for i in invitations.values()]
+                ).values_list('group_id', flat=True)
+            )
+
+            errors = []
+            accepted = []
+            for invite_id in invite_ids:
+                invitation = invitations.get(invite_id)
+                if invitation is None:
+                    errors.append({'invite_id': invite_id, 'message': 'Group invitation not found'})
+                elif invitation.group_id in member_groups:
+                    errors.append({'invite_id': invite_id, 'message': 'User is already a member of this group'})
+                else:
+                    # Two invitations to the same group only add one membership
+                    member_groups.add(invitation.group_id)
+                    accepted.append(invitation)
+
+            with transaction.atomic():
+                GroupMember.objects.bulk_create(
+                    [GroupMember(user=user, group_id=invitation.group_id, role='member') for invitation in accepted],
+                    ignore_conflicts=True
+                )
+                # Delete the invitations after acceptance
+                GroupInvitation.objects.filter(id__in=[invitation.id for invitation in accepted]).delete()
+
+                group_names = {invitation.group_id: invitation.group.name for invitation in accepted}
+                # bulk_create does not send the GroupMember signals
+                group_info.invalidate(*group_names)
+                group_membership.record_change(
+                    *GroupMember.objects.filter(user=user, group_id__in=group_names).only('group_id', 'user_id', 'role')
+                )
+                members = GroupMember.objects.filter(
+                    group_id__in=group_names
+                ).exclude(user=user).values_list('group_id', 'user_id')
+                notifications.publish_on_commit(
+                    notifications.group_update(member_id, group_id, f'{user.full_name} joined {group_names[group_id]}')
+                    for group_id, member_id in members
+                )
+
+            return {
+                'status': 'SUCCESS',
+                'message': f'{len(accepted)} group invitations accepted',
+                'groups': [{
+                    'invite_id': invitation.id,
+                    'group_id': invitation.group_id,
+                    'group_name': invitation.group.name
+                } for invitation in accepted],
+                'errors': errors
+            }
+        except User.DoesNotExist:
+            return {
+                'status': 'ERROR',
+                'message': 'User not found'
+            }
+        except Exception as e:
+            return {
+                'status': 'ERROR',
+                'message': str(e)
+            }
+
     @staticmethod
     def reject_group_invite(user_sub, invite_id):
         """
@@ -1389,14 +1753,14 @@ class DatabaseService:
         """
         try:
             sender = User.objects.get(cognito_id=sender_id)
-            group = Group.objects.get(id=group_id)
 
             # Check if the user is a member of the group
-            if not GroupMember.objects.filter(user=sender, group=group).exists():
+            if not group_membership.is_member(group_id, sender.id):
                 return {
                     'status': 'ERROR',
                     'message': 'User is not a member of this group'
                 }
+            group = Group.objects.get(id=group_id)
 
             message = GroupMessage.objects.create(
                 sender=sender,
@@ -1405,20 +1769,23 @@ class DatabaseService:
                 message_type=message_type,
                 file_url=file_url
             )
-            # Update last message of the user
+            # Update last message of the user, as a single upsert
             try:
-                read_receipt, created = GroupReadReceipt.objects.get_or_create(
-                    user=sender,
-                    group=group,
-                    defaults={'last_read_message': message}
-                )
-                if not created:
-                    read_receipt.last_read_message = message
-                    read_receipt.save()
+                receipt = GroupReadReceipt(user=sender, group=group, last_read_message=message)
+                if connection.features.supports_update_conflicts_with_target:
+                    GroupReadReceipt.objects.bulk_create(
+                        [receipt], update_conflicts=True, unique_fields=['user', 'group'],
+                        update_fields=['last_read_message']
+                    )
+                else:
+                    # MySQL upserts on any unique key and rejects unique_fields
+                    GroupReadReceipt.objects.bulk_create(
+                        [receipt], update_conflicts=True, update_fields=['last_read_message']
+                    )
                     
-            except Exception as e:
+            except Exception:
                 # Just log the error but don't fail the message sending
-                print(f"Error updating read receipt: {str(e)}")
+                logger.warning("Error updating read receipt of %s in group %s", sender.id, group_id, exc_info=True)
 
             return {
                 'status': 'SUCCESS',
@@ -1456,33 +1823,26 @@ class DatabaseService:
         """
         try:
             user = User.objects.get(cognito_id=user_sub)
-            group = Group.objects.get(id=group_id)
+            members = group_membership.roles(group_id)
 
-            # Check if the user is an admin of the group
-            if not GroupMember.objects.filter(user=user, group=group, role='admin').exists():
+            # Check if the user is an admin of the group, also rejects unknown groups
+            if members.get(user.id) != group_membership.ADMIN:
                 return {
                     'status': 'ERROR',
                     'message': 'User is not an admin of this group'
                 }
 
-            # Find users matching search criteria
-            users = User.objects.filter(
-                models.Q(name__icontains=search_term) |
-                models.Q(email__icontains=search_term) |
-                models.Q(full_name__icontains=search_term)
-            ).exclude(
-                models.Q(id=user.id) | 
-                models.Q(id__in=Subquery(
-                    GroupMember.objects.filter(group_id=group_id).values('user__id')
-                ))
-            )[:15]
+            # Find users matching search criteria, exact and prefix matches first
+            users = user_search.search_queryset(search_term, User.objects.exclude(
+                id__in=[user.id, *members]
+            ))[:15]
 
             # Map results to dictionaries
             users_list = [{
                 'user_id': u.id,
                 'username': u.name,
                 'full_name': u.full_name,
-                'profile_photo': u.avatar_url
+                'profile_photo': u.list_avatar_url
             } for u in users]
 
             return {
@@ -1494,11 +1854,6 @@ class DatabaseService:
                 'status': 'ERROR',
                 'message': 'User not found'
             }
-        except Group.DoesNotExist:
-            return {
-                'status': 'ERROR',
-                'message': 'Group not found'
-            }
         except Exception as e:
             return {
                 'status': 'ERROR',
@@ -1508,47 +1863,60 @@ class DatabaseService:
     @staticmethod
     def delete_group(user_sub, group_id):
         '''
-        Verifies if the user is an admin and deletes the group.
+        Verifies if the user is an admin and starts a background job that
+        deletes the group with its members, messages and expenses in chunks.
 
         Args:
             user_sub(str): cognito id of the user,
             group_id(str): id of the group to be deleted
         Returns:
-            dict: dict with status of the delete operation.
+            dict: dict with status of the delete operation and the job id.
         '''
         try:
             user = User.objects.get(cognito_id=user_sub)
-            group = Group.objects.get(id=group_id)
     
-            if not GroupMember.objects.filter(user=user, group=group, role='admin').exists():
+            # Also rejects unknown groups
+            if not group_membership.is_admin(group_id, user.id):
                 return {
                     'status': 'ERROR',
                     'message': 'User is not an admin of this group'
                 }
             
-            # Delete all group members and messages
-            GroupMember.objects.filter(group=group).delete()
-            GroupMessage.objects.filter(group=group).delete()
-
-            GroupInvitation.objects.filter(group=group).delete()
-            # Delete the group itself
-            group.delete()
+            job = deletion_jobs.start('group', group_id, user_sub)
 
             return {
                 'status' : 'SUCCESS',
-                'message' : 'Group deleted successfully'
+                'message' : 'Group deletion started',
+                'job_id': job.id
             }
         except User.DoesNotExist:
             return {
                 'status': 'ERROR',
                 'message': 'User not found'
             }
-        except Group.DoesNotExist:
-            return{
+    
+    @staticmethod
+    def get_deletion_job(user_sub, job_id):
+        '''
+        Progress of a deletion job started by the user.
+
+        Args:
+            user_sub(str): cognito id of the user who started the job
+            job_id(str): id returned by delete_group
+        Returns:
+            dict: status and progress of the job.
+        '''
+        job = DeletionJob.objects.filter(id=job_id, requested_by=user_sub).first()
+        if job is None:
+            return {
                 'status': 'ERROR',
-                'message': 'Group not found'
+                'message': 'Deletion job not found'
             }
-    
+        return {
+            'status': 'SUCCESS',
+            'job': deletion_jobs.progress(job)
+        }
+
     @staticmethod
     def edit_group(user_sub, group_id, group_name=None, group_description=None):
         """
@@ -1565,14 +1933,14 @@ class DatabaseService:
         """
         try:
             user = User.objects.get(cognito_id=user_sub)
-            group = Group.objects.get(id=group_id)
 
             # Check if the user is an admin of the group
-            if not GroupMember.objects.filter(user=user, group=group, role='admin').exists():
+            if not group_membership.is_admin(group_id, user.id):
                 return {
                     'status': 'ERROR',
                     'message': 'User is not an admin of this group'
                 }
+            group = Group.objects.get(id=group_id)
 
             # Update group details
             if group_name:
@@ -1616,26 +1984,22 @@ class DatabaseService:
         """
         try:
             user = User.objects.get(cognito_id=user_sub)
-            group = Group.objects.get(id=group_id)
-            member_to_remove = User.objects.get(id=user_id)
 
-            # Check if the user is an admin of the group
-            if not GroupMember.objects.filter(user=user, group=group, role='admin').exists():
+            # Check if the user is an admin of the group, also rejects unknown groups
+            if not group_membership.is_admin(group_id, user.id):
                 return {
                     'status': 'ERROR',
                     'message': 'User is not an admin of this group'
                 }
 
-            # Check if the member to remove is part of the group
-            if not GroupMember.objects.filter(user=member_to_remove, group=group).exists():
+            # Remove the member from the group, checked against the table rather than the cache
+            deleted, _ = GroupMember.objects.filter(user_id=user_id, group_id=group_id).delete()
+            if not deleted:
                 return {
                     'status': 'ERROR',
                     'message': 'User is not a member of this group'
                 }
 
-            # Remove the member from the group
-            GroupMember.objects.filter(user=member_to_remove, group=group).delete()
-
             return {
                 'status': 'SUCCESS',
                 'message': 'User removed from the group successfully'
@@ -1645,11 +2009,6 @@ class DatabaseService:
                 'status': 'ERROR',
                 'message': 'User not found'
             }
-        except Group.DoesNotExist:
-            return {
-                'status': 'ERROR',
-                'message': 'Group not found'
-            }
         except Exception as e:
             return {
                 'status': 'ERROR',
@@ -1691,13 +2050,14 @@ class DatabaseService:
             ).select_related('sender', 'recipient').order_by('created_at')[start_idx:start_idx+page_size]
 
             messages_list = []
+            unread_ids = []
 
             for message in messages:
                 messages_list.append({
                     'id': message.id,
                     'sender_id': message.sender.id,
                     'sender_name': message.sender.full_name,
-                    'sender_avatar': message.sender.avatar_url,
+                    'sender_avatar': message.sender.list_avatar_url,
                     'recipient_id': message.recipient.id,
                     'recipient_name': message.recipient.full_name,
                     'content': message.content,
@@ -1709,11 +2069,12 @@ class DatabaseService:
                     'status': "READ" if message.is_read else "DELIVERED"
                 })
                 
-                # Mark as read if recipient is viewing
                 if message.recipient == user and not message.is_read:
-                    message.is_read = True
-                    message.read_at = timezone.now()
-                    message.save(update_fields=['is_read', 'read_at'])
+                    unread_ids.append(message.id)
+
+            # Mark the page as read if recipient is viewing, in one UPDATE
+            if unread_ids:
+                DirectMessage.objects.filter(id__in=unread_ids).update(is_read=True, read_at=timezone.now())
                     
             pagination = {
                 'current_page': page,
@@ -1742,13 +2103,14 @@ class DatabaseService:
     @staticmethod
     def delete_user_account(cognito_id):
         """
-        Delete a user account and all associated data from the database
+        Delete a user account and all associated data from the database.
+        The rows are removed in chunks by a background job.
         
         Args:
             cognito_id (str): Cognito user ID
             
         Returns:
-            dict: Status of the deletion operation
+            dict: Status of the deletion operation and the job id
         """
         try:
             user = User.objects.get(cognito_id=cognito_id)
@@ -1760,14 +2122,13 @@ class DatabaseService:
                 'email': user.email
             }
             
-            # Delete the user - this will cascade to related records if
-            # on_delete=CASCADE is set in the model relationships
-            user.delete()
+            job = deletion_jobs.start('user', user.id, cognito_id)
             
             return {
                 'status': 'SUCCESS',
-                'message': 'User account deleted successfully',
-                'deleted_user': user_info
+                'message': 'User account deletion started',
+                'deleted_user': user_info,
+                'job_id': job.id
             }
         except User.DoesNotExist:
             return {
@@ -1780,3 +2141,601 @@ class DatabaseService:
                 'message': f'Error deleting user: {str(e)}'
             }
 
+    @staticmethod
+    def record_payment(cognito_id, recipient_id=None, group_id=None, amount=None,
+                       settle_all=False, description='', idempotency_key=None):
+        """
+        Settle the user's unpaid splits towards a friend or inside a group.
+
+        All the splits involved are locked with one SELECT ... FOR UPDATE (oldest
+        first), the payment is allocated in Decimal and written back with a single
+        bulk_update plus one UPDATE of all the affected expenses, inside one transaction.
+        The payment itself is appended to the Payment/PaymentAllocation ledger
+        in the same transaction. Repeating a request with the same idempotency_key returns the stored
+        result instead of paying twice; reusing the key with different parameters is an error.
+
+        Args:
+            cognito_id (str): Cognito ID of the paying user
+            recipient_id (str, optional): ID of the friend being paid
+            group_id (str, optional): ID of the group being settled
+            amount (Decimal, optional): Amount to pay, required unless settle_all
+            settle_all (bool): Pay off every matching split
+            description (str, optional): Note stored with the payment
+            idempotency_key (str, optional): Client generated key for safe retries
+
+        Returns:
+            dict: Status of the payment and the splits it settled
+        """
+        try:
+            user = User.objects.get(cognito_id=cognito_id)
+
+            fingerprint = _request_fingerprint(
+                None if group_id else recipient_id, group_id,
+                None if amount is None else Decimal(amount), bool(settle_all), description or ''
+            )
+            if idempotency_key:
+                previous = IdempotencyKey.objects.filter(
+                    user=user, endpoint='record_payment', key=idempotency_key
+                ).first()
+                if previous:
+                    return _replay(previous, fingerprint)
+
+            if amount is None and not settle_all:
+                return {
+                    'status': 'ERROR',
+                    'message': 'Either amount or settle_all must be provided'
+                }
+
+            with transaction.atomic():
+                splits_query = ExpenseSplit.objects.select_for_update().filter(
+                    user_id=user.id,
+                    is_paid=False
+                )
+                if group_id:
+                    splits_query = splits_query.filter(expense__group_id=group_id)
+                else:
+                    splits_query = splits_query.filter(expense__paid_by_id=recipient_id)
+                splits = list(
+                    splits_query.annotate(
+                        payee_id=F('expense__paid_by_id'),
+                        expense_group_id=F('expense__group_id')
+                    ).order_by('created_at', 'id')
+                )
+
+                if not splits:
+                    return {
+                        'status': 'ERROR',
+                        'error_code': 'NO_SPLITS',
+                        'message': 'No splits found to settle'
+                    }
+
+                if amount is None:
+                    amount = sum((split.remaining_amount for split in splits), Decimal('0'))
+                amount = Decimal(amount)
+
+                # Allocate the payment to the oldest splits first
+                remaining_to_pay = amount
+                paid_per_expense = defaultdict(Decimal)
+                settled_splits = []
+                allocated = []
+                for split in splits:
+                    if remaining_to_pay <= 0:
+                        break
+                    split_amount = min(split.remaining_amount, remaining_to_pay)
+                    split.remaining_amount -= split_amount
+                    split.is_paid = split.remaining_amount <= 0
+                    remaining_to_pay -= split_amount
+                    paid_per_expense[split.expense_id] += split_amount
+                    allocated.append((split, split_amount))
+                    settled_splits.append({
+                        'id': split.id,
+                        'expense_id': split.expense_id,
+                        'amount_paid': float(split_amount),
+                        'is_fully_paid': split.is_paid
+                    })
+
+                ExpenseSplit.objects.bulk_update(
+                    [split for split, _ in allocated], ['remaining_amount', 'is_paid']
+                )
+                payment = Payment.objects.create(
+                    payer=user,
+                    recipient_id=None if group_id else recipient_id,
+                    group_id=group_id,
+                    amount=amount - remaining_to_pay,
+                    description=description or ''
+                )
+                PaymentAllocation.objects.bulk_create([
+                    PaymentAllocation(
+                        payment=payment,
+                        split_id=split.id,
+                        expense_id=split.expense_id,
+                        recipient_id=split.payee_id,
+                        amount=split_amount
+                    )
+                    for split, split_amount in allocated
+                ])
+                Expense.objects.filter(id__in=paid_per_expense).update(
+                    remaining_amount=F('remaining_amount') - Case(
+                        *[When(id=expense_id, then=Value(paid)) for expense_id, paid in paid_per_expense.items()],
+                        output_field=DecimalField(max_digits=10, decimal_places=2)
+                    ),
+                    updated_at=timezone.now()
+                )
+                group_summary.invalidate(*{split.expense_group_id for split, _ in allocated})
+
+                result = {
+                    'status': 'SUCCESS',
+                    'message': 'Payment recorded successfully',
+                    'data': {
+                        'payment_id': payment.id,
+                        'amount_settled': float(amount - remaining_to_pay),
+                        'remaining_amount': float(max(remaining_to_pay, Decimal('0'))),
+                        'settled_splits': settled_splits
+                    }
+                }
+
+                if idempotency_key:
+                    IdempotencyKey.objects.create(
+                        user=user,
+                        endpoint='record_payment',
+                        key=idempotency_key,
+                        request_hash=fingerprint,
+                        response=result
+                    )
+
+            return result
+        except User.DoesNotExist:
+            return {
+                'status': 'ERROR',
+                'message': 'User not found'
+            }
+        except IntegrityError:
+            # A concurrent request with the same key committed first and this
+            # transaction was rolled back, so hand back the winner's result.
+            previous = IdempotencyKey.objects.filter(
+                user__cognito_id=cognito_id, endpoint='record_payment', key=idempotency_key
+            ).first()
+            if previous:
+                return _replay(previous, fingerprint)
+            return {
+                'status': 'ERROR',
+                'message': 'Payment could not be recorded, please retry'
+            }
+        except Exception as e:
+            return {
+                'status': 'ERROR',
+                'message': str(e)
+            }
+
+    @staticmethod
+    def get_payments_since(cognito_id, cursor=0, limit=100):
+        """
+        Incremental feed of payments the user made or received, oldest first.
+
+        Ids are allocated at insert time but become visible at commit, so a
+        payment can appear after a higher id was already served. The feed
+        therefore holds back payments younger than
+        PAYMENTS_FEED_SETTLE_SECONDS (10 by default, far longer than a
+        record_payment transaction): once a payment is served, every lower
+        id has either committed or rolled back.
+
+        Args:
+            cognito_id (str): Cognito user ID
+            cursor (int): Last payment id already seen by the caller (0 = start)
+            limit (int): Maximum number of payments to return
+        Returns:
+            dict: Payments with their allocations and the cursor for the next call
+        """
+        try:
+            user = User.objects.get(cognito_id=cognito_id)
+
+            received = PaymentAllocation.objects.filter(recipient=user).values('payment_id')
+            settled_before = timezone.now() - timedelta(
+                seconds=getattr(settings, 'PAYMENTS_FEED_SETTLE_SECONDS', 10)
+            )
+            payments = Payment.objects.filter(
+                models.Q(payer=user) | models.Q(id__in=Subquery(received)),
+                id__gt=cursor,
+                created_at__lte=settled_before
+            ).prefetch_related('allocations').order_by('id')[:limit]
+
+            payments_list = []
+            for payment in payments:
+                payments_list.append({
+                    'payment_id': payment.id,
+                    'payer_id': payment.payer_id,
+                    'recipient_id': payment.recipient_id,
+                    'group_id': payment.group_id,
+                    'amount': float(payment.amount),
+                    'description': payment.description,
+                    'created_at': payment.created_at,
+                    'allocations': [{
+                        'split_id': allocation.split_id,
+                        'expense_id': allocation.expense_id,
+                        'recipient_id': allocation.recipient_id,
+                        'amount': float(allocation.amount)
+                    } for allocation in payment.allocations.all()]
+                })
+
+            return {
+                'status': 'SUCCESS',
+                'payments': payments_list,
+                'next_cursor': payments_list[-1]['payment_id'] if payments_list else cursor,
+                'has_more': len(payments_list) == limit
+            }
+        except User.DoesNotExist:
+            return {
+                'status': 'ERROR',
+                'message': 'User not found'
+            }
+        except Exception as e:
+            return {
+                'status': 'ERROR',
+                'message': str(e)
+            }
+
+    @staticmethod
+    def check_split_balances(split_ids):
+        """
+        Compare the stored remaining_amount of splits (and their expenses)
+        with the value derived from the payment ledger.
+
+        Splits settled before the ledger existed have no allocations, so they
+        show up as mismatches and need a one-off backfill.
+
+        Args:
+            split_ids (iterable): IDs of the splits to check
+        Returns:
+            list: One dict per split or expense whose stored balance disagrees
+        """
+        splits = ExpenseSplit.objects.filter(id__in=list(split_ids)).exclude(
+            user_id=F('expense__paid_by_id')
+        ).annotate(
+            allocated=Coalesce(
+                Sum('allocations__amount'),
+                Value(Decimal('0')),
+                output_field=models.DecimalField(max_digits=10, decimal_places=2)
+            )
+        ).values('id', 'expense_id', 'total_amount', 'remaining_amount', 'allocated')
+
+        mismatches = []
+        expense_ids = set()
+        for split in splits:
+            expense_ids.add(split['expense_id'])
+            expected = split['total_amount'] - split['allocated']
+            if expected != split['remaining_amount']:
+                mismatches.append({
+                    'type': 'split',
+                    'id': split['id'],
+                    'stored': split['remaining_amount'],
+                    'expected': expected
+                })
+
+        # Expense.remaining_amount must equal what the non-payers still owe
+        expenses = Expense.objects.filter(id__in=expense_ids).annotate(
+            owed=Coalesce(
+                Sum(
+                    'splits__remaining_amount',
+                    filter=~models.Q(splits__user_id=F('paid_by_id'))
+                ),
+                Value(Decimal('0')),
+                output_field=models.DecimalField(max_digits=10, decimal_places=2)
+            )
+        ).values('id', 'remaining_amount', 'owed')
+        for expense in expenses:
+            if expense['owed'] != expense['remaining_amount']:
+                mismatches.append({
+                    'type': 'expense',
+                    'id': expense['id'],
+                    'stored': expense['remaining_amount'],
+                    'expected': expense['owed']
+                })
+
+        return mismatches
+
+    @staticmethod
+    def get_transactions(user_id, filter_type='all', cursor=None, since=None, limit=50):
+        """
+        Get one page of the expenses a user is involved in, newest first.
+
+        Page keys come from a UNION of the "paid by me" and "split with me"
+        branches (no OR join, no DISTINCT), then the page is loaded in one
+        query with its payer, friend and group joined in.
+
+        Args:
+            user_id (str): Database ID of the user
+            filter_type (str): 'all', 'paid' or 'owed'
+            cursor (str, optional): next_cursor returned by the previous page
+            since (datetime, optional): Only expenses changed after this time
+            limit (int): Page size
+        Returns:
+            dict: Expense instances for the page plus pagination info
+        """
+        try:
+            synced_at = timezone.now()
+
+            if filter_type == 'paid':
+                branches = [Expense.objects.filter(paid_by_id=user_id)]
+            elif filter_type == 'owed':
+                branches = [
+                    Expense.objects.filter(
+                        splits__user_id=user_id,
+                        splits__is_paid=False
+                    ).exclude(paid_by_id=user_id)
+                ]
+            else:
+                branches = [
+                    Expense.objects.filter(paid_by_id=user_id),
+                    Expense.objects.filter(splits__user_id=user_id),
+                ]
+
+            page_filter = models.Q()
+            if cursor:
+                cursor_created_at, cursor_id = _decode_cursor(cursor)
+                page_filter &= (
+                    models.Q(created_at__lt=cursor_created_at) |
+                    models.Q(created_at=cursor_created_at, id__lt=cursor_id)
+                )
+            if since:
+                page_filter &= models.Q(updated_at__gt=since)
+
+            branches = [branch.filter(page_filter).values_list('id', 'created_at') for branch in branches]
+            keys = branches[0].union(*branches[1:]) if len(branches) > 1 else branches[0]
+            keys = list(keys.order_by('-created_at', '-id')[:limit + 1])
+
+            has_more = len(keys) > limit
+            keys = keys[:limit]
+
+            expenses_by_id = Expense.objects.select_related(
+                'paid_by', 'friend', 'group'
+            ).in_bulk([expense_id for expense_id, _ in keys])
+
+            return {
+                'status': 'SUCCESS',
+                'expenses': [expenses_by_id[expense_id] for expense_id, _ in keys if expense_id in expenses_by_id],
+                'next_cursor': _encode_cursor(keys[-1][1], keys[-1][0]) if has_more else None,
+                'has_more': has_more,
+                'synced_at': synced_at
+            }
+        except Exception as e:
+            return {
+                'status': 'ERROR',
+                'message': str(e)
+            }
+
+    @staticmethod
+    def rescale_expense_splits(expense, new_total, split_mode=None, values=None, items=None):
+        """
+        Rescale the splits of an expense to a new total in exact cents.
+
+        Without split_mode, split totals are redistributed proportionally with
+        largest-remainder rounding so they add up to new_total; with one, the
+        existing participants are re-split with split_allocator.allocate.
+        What each member already paid is kept, so their remaining share
+        becomes new share minus paid; a new share below what a member has
+        already paid is rejected rather than dropping the overpayment.
+        Must be called inside
+        transaction.atomic() together with the expense update; the splits
+        are locked for the duration.
+
+        Args:
+            expense (Expense): The expense being updated (locked by the caller)
+            new_total (Decimal): The new total_amount
+            split_mode (str, optional): One of split_allocator.SPLIT_MODES
+            values (dict, optional): user_id -> amount / percentage / shares
+            items (list, optional): Items for the itemized mode
+        Returns:
+            Decimal: New remaining_amount for the expense
+        Raises:
+            split_allocator.SplitError: If the split does not add up, or a
+                new share is below what its member already paid
+        """
+        splits = list(
+            ExpenseSplit.objects.select_for_update().filter(expense_id=expense.id).order_by('created_at', 'id')
+        )
+        if split_mode:
+            shares = split_allocator.allocate(
+                new_total, [split.user_id for split in splits], split_mode, values, items
+            )
+            new_totals = [shares[split.user_id] for split in splits]
+        else:
+            new_totals = split_allocator.rescale([split.total_amount for split in splits], new_total)
+
+        remaining = Decimal('0')
+        for split, split_total in zip(splits, new_totals):
+            already_paid = split.total_amount - split.remaining_amount
+            split.total_amount = split_total
+            if split.user_id == expense.paid_by_id:
+                split.remaining_amount = Decimal('0')
+            else:
+                if split_total < already_paid:
+                    raise split_allocator.SplitError(
+                        f'The new share of user {split.user_id} ({split_total}) is below the '
+                        f'{already_paid} they already paid'
+                    )
+                split.remaining_amount = split_total - already_paid
+                remaining += split.remaining_amount
+            split.is_paid = split.remaining_amount <= 0
+
+        ExpenseSplit.objects.bulk_update(splits, ['total_amount', 'remaining_amount', 'is_paid'])
+        return remaining
+
+    @staticmethod
+    def create_recurring_expense(cognito_id, total_amount, interval, start_at,
+                                 group_id=None, friend_id=None, description='',
+                                 interval_count=1, end_at=None, currency=None):
+        """
+        Schedule an expense that is recreated every interval.
+
+        Args:
+            cognito_id (str): Cognito ID of the paying user
+            total_amount (Decimal): Amount of each occurrence
+            interval (str): 'daily', 'weekly', 'monthly' or 'yearly'
+            start_at (datetime): Time of the first occurrence
+            group_id (str, optional): Group to split with
+            friend_id (str, optional): Friend to split with
+            description (str, optional): Description copied to every expense
+            interval_count (int): Number of intervals between occurrences
+            end_at (datetime, optional): No occurrences after this time
+            currency (str, optional): Currency of the amount, the payer's by default
+        Returns:
+            dict: Status of the operation and the rule id
+        """
+        try:
+            user = User.objects.get(cognito_id=cognito_id)
+
+            if group_id and not group_membership.is_member(group_id, user.id):
+                return {
+                    'status': 'ERROR',
+                    'message': 'User is not a member of this group'
+                }
+            if friend_id and not User.objects.filter(id=friend_id).exists():
+                return {
+                    'status': 'ERROR',
+                    'message': 'Friend not found'
+                }
+
+            rule = RecurringExpense.objects.create(
+                paid_by=user,
+                group_id=group_id,
+                friend_id=friend_id,
+                total_amount=total_amount,
+                currency=(currency or user.currency).upper(),
+                description=description or '',
+                interval=interval,
+                interval_count=interval_count,
+                start_at=start_at,
+                next_run_at=start_at,
+                end_at=end_at
+            )
+            return {
+                'status': 'SUCCESS',
+                'message': 'Recurring expense scheduled successfully',
+                'recurring_id': rule.id,
+                'next_run_at': rule.next_run_at
+            }
+        except User.DoesNotExist:
+            return {
+                'status': 'ERROR',
+                'message': 'User not found'
+            }
+        except Exception as e:
+            return {
+                'status': 'ERROR',
+                'message': str(e)
+            }
+
+    @staticmethod
+    def get_recurring_expenses(cognito_id):
+        """
+        Get the active recurring expenses paid by the user.
+
+        Args:
+            cognito_id (str): Cognito user ID
+        Returns:
+            dict: Status of the operation and the list of rules
+        """
+        try:
+            user = User.objects.get(cognito_id=cognito_id)
+            rules = RecurringExpense.objects.filter(paid_by=user, is_active=True) \
+                .select_related('group', 'friend').order_by('next_run_at')
+
+            return {
+                'status': 'SUCCESS',
+                'recurring_expenses': [{
+                    'recurring_id': rule.id,
+                    'group_id': rule.group_id,
+                    'group_name': rule.group.name if rule.group else None,
+                    'friend_id': rule.friend_id,
+                    'friend_name': rule.friend.full_name if rule.friend else None,
+                    'total_amount': float(rule.total_amount),
+                    'currency': rule.currency,
+                    'description': rule.description,
+                    'interval': rule.interval,
+                    'interval_count': rule.interval_count,
+                    'next_run_at': rule.next_run_at,
+                    'end_at': rule.end_at
+                } for rule in rules]
+            }
+        except User.DoesNotExist:
+            return {
+                'status': 'ERROR',
+                'message': 'User not found'
+            }
+        except Exception as e:
+            return {
+                'status': 'ERROR',
+                'message': str(e)
+            }
+
+    @staticmethod
+    def cancel_recurring_expense(cognito_id, recurring_id):
+        """
+        Stop a recurring expense; expenses already created are kept.
+
+        Args:
+            cognito_id (str): Cognito ID of the paying user
+            recurring_id (str): ID of the recurring expense
+        Returns:
+            dict: Status of the cancel operation
+        """
+        try:
+            user = User.objects.get(cognito_id=cognito_id)
+            updated = RecurringExpense.objects.filter(
+                id=recurring_id, paid_by=user, is_active=True
+            ).update(is_active=False)
+            if not updated:
+                return {
+                    'status': 'ERROR',
+                    'message': 'Recurring expense not found'
+                }
+            return {
+                'status': 'SUCCESS',
+                'message': 'Recurring expense cancelled successfully'
+            }
+        except User.DoesNotExist:
+            return {
+                'status': 'ERROR',
+                'message': 'User not found'
+            }
+        except Exception as e:
+            return {
+                'status': 'ERROR',
+                'message': str(e)
+            }
+
+    @staticmethod
+    def get_group_summary(user_sub, group_id):
+        """
+        Get the group's totals and each member's net position.
+        requires user passed in to be a member of the group.
+        Amounts are returned in the requesting user's currency.
+
+        Args:
+            user_sub (str): Cognito ID of the requesting user
+            group_id (str): ID of the group
+        Returns:
+            dict: Status of the operation and the summary
+        """
+        try:
+            # Membership check and the user's currency in one query
+            currency = (
+                GroupMember.objects.filter(user__cognito_id=user_sub, group_id=group_id)
+                .values_list('user__currency', flat=True)
+                .first()
+            )
+            if currency is None:
+                return {
+                    'status': 'ERROR',
+                    'message': 'User is not a member of this group'
+                }
+            return {
+                'status': 'SUCCESS',
+                'message': 'Group summary fetched successfully',
+                'summary': group_summary.build_summary(group_id, currency)
+            }
+        except Exception as e:
+            return {
+                'status': 'ERROR',
+                'message': str(e)
+            }
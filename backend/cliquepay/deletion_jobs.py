@@ -0,0 +1,246 @@
+"""
+Chunked, resumable deletion of groups and user accounts.
+
+Deleting a large group or an old account through Model.delete() makes
+Django's collector load every dependent row into memory and remove them
+all in one long transaction. Instead, a DeletionJob walks a fixed list of
+steps, children before parents. Each step removes (or detaches, for
+SET_NULL relations) the matching rows in primary-key ordered chunks. Every
+chunk is a raw DELETE / UPDATE over a pk range in its own short
+transaction. The job saves its step and per-step row counts after every
+chunk, so it can be resumed after a crash by running it again.
+
+Raw deletes skip signals, so steps that need them run a `before` hook on
+each chunk. Friendships update the friend graph and versions, memberships
+update the membership cache and drop the cached group info, and expenses
+queue their stored receipts for deletion. Message file URLs are supplied
+by clients and never point at files this code stored, so they are left
+alone. The group or user row itself is deleted last with a normal
+delete(), when nothing is left to cascade; a user's profile picture and
+its variants are deleted from storage once that final step commits.
+
+Jobs start in the background thread pool after the request commits;
+run_deletion_jobs picks up pending, failed and stalled ones.
+"""
+
+import logging
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import (
+    avatars, background, friend_graph, friend_versions, group_info, group_membership, group_summary, receipts,
+)
+from .models import (
+    DeletionJob, DirectMessage, Expense, ExpenseSplit, Friendship, FriendshipChange, Group,
+    GroupInvitation, GroupMember, GroupMessage, GroupReadReceipt, IdempotencyKey, Payment,
+    PaymentAllocation, RecurringExpense, User,
+)
+
+logger = logging.getLogger(__name__)
+
+# `nullify` lists the fields to set to NULL instead of deleting the rows
+Step = namedtuple('Step', ['name', 'model', 'filter', 'nullify', 'before'], defaults=(None, None))
+
+
+def _chunk_size():
+    return getattr(settings, 'DELETION_CHUNK_SIZE', 1000)
+
+
+def _expense_files(chunk):
+    for expense_id, receipt_url, thumbnail_url in chunk.values_list('id', 'receipt_url', 'receipt_thumbnail_url'):
+        urls = [url for url in (receipt_url, thumbnail_url) if url]
+        if urls:
+            background.submit_on_commit(receipts.delete_stored_files, expense_id, urls)
+    group_summary.invalidate(*set(chunk.values_list('group_id', flat=True)))
+
+
+def _split_groups(chunk):
+    group_summary.invalidate(*set(chunk.values_list('expense__group_id', flat=True)))
+
+
+def _invitations_removed(chunk):
+    group_info.invalidate(*set(chunk.values_list('group_id', flat=True)))
+
+
+def _memberships_removed(chunk):
+    pairs = list(chunk.values_list('group_id', 'user_id'))
+    group_membership.record_removal(*pairs)
+    group_info.invalidate(*{group_id for group_id, _ in pairs})
+
+
+def _created_groups(chunk):
+    group_info.invalidate(*chunk.values_list('id', flat=True))
+
+
+def _friendships_removed(chunk):
+    friendships = list(chunk.only('id', 'user1_id', 'user2_id'))
+    friend_graph.record_removal(*((f.user1_id, f.user2_id) for f in friendships))
+    friend_versions.bump(*friendships)
+
+
+def group_steps(group_id):
+    return [
+        # Members first, so the group disappears from everyone's list right away
+        Step('group_members', GroupMember, Q(group_id=group_id), before=_memberships_removed),
+        Step('group_invitations', GroupInvitation, Q(group_id=group_id), before=_invitations_removed),
+        Step('group_read_receipts', GroupReadReceipt, Q(group_id=group_id)),
+        Step('group_messages', GroupMessage, Q(group_id=group_id)),
+        Step('recurring_expenses', RecurringExpense, Q(group_id=group_id)),
+        Step('allocation_expenses', PaymentAllocation, Q(expense__group_id=group_id), nullify=('expense', 'split')),
+        Step('allocation_splits', PaymentAllocation, Q(split__expense__group_id=group_id), nullify=('split',)),
+        Step('expense_splits', ExpenseSplit, Q(expense__group_id=group_id)),
+        Step('expenses', Expense, Q(group_id=group_id), before=_expense_files),
+        Step('payments', Payment, Q(group_id=group_id), nullify=('group',)),
+    ]
+
+
+def user_steps(user_id):
+    expenses = Q(paid_by_id=user_id) | Q(friend_id=user_id)
+    return [
+        Step('friendships', Friendship,
+             Q(user1_id=user_id) | Q(user2_id=user_id) | Q(action_user_id=user_id),
+             before=_friendships_removed),
+        Step('friendship_changes', FriendshipChange, Q(user_id=user_id)),
+        Step('direct_messages', DirectMessage, Q(sender_id=user_id) | Q(recipient_id=user_id)),
+        Step('group_read_receipts', GroupReadReceipt,
+             Q(user_id=user_id) | Q(last_read_message__sender_id=user_id)),
+        Step('group_messages', GroupMessage, Q(sender_id=user_id)),
+        Step('group_members', GroupMember, Q(user_id=user_id), before=_memberships_removed),
+        Step('group_invitations', GroupInvitation, Q(invited_user_id=user_id) | Q(invited_by_id=user_id),
+             before=_invitations_removed),
+        Step('created_groups', Group, Q(created_by_id=user_id), nullify=('created_by',), before=_created_groups),
+        Step('idempotency_keys', IdempotencyKey, Q(user_id=user_id)),
+        Step('recurring_expenses', RecurringExpense, expenses),
+        Step('payment_allocations', PaymentAllocation, Q(recipient_id=user_id) | Q(payment__payer_id=user_id)),
+        Step('allocation_expenses', PaymentAllocation,
+             Q(expense__paid_by_id=user_id) | Q(expense__friend_id=user_id), nullify=('expense', 'split')),
+        Step('allocation_splits', PaymentAllocation, Q(split__user_id=user_id), nullify=('split',)),
+        Step('payments', Payment, Q(payer_id=user_id)),
+        Step('received_payments', Payment, Q(recipient_id=user_id), nullify=('recipient',)),
+        Step('expense_splits', ExpenseSplit,
+             Q(user_id=user_id) | Q(expense__paid_by_id=user_id) | Q(expense__friend_id=user_id),
+             before=_split_groups),
+        Step('expenses', Expense, expenses, before=_expense_files),
+    ]
+
+
+def _delete_group(group_id):
+    Group.objects.filter(id=group_id).delete()
+    group_summary.invalidate(group_id)
+    group_info.invalidate(group_id)
+    group_membership.drop(group_id)
+
+
+def _delete_user(user_id):
+    # Nothing is left to cascade; delete() still sends the User signals
+    for user in User.objects.filter(id=user_id):
+        avatars.schedule_delete(user.id, user.avatar_url, user.avatar_variants)
+        user.delete()
+
+
+PLANS = {
+    'group': (group_steps, _delete_group),
+    'user': (user_steps, _delete_user),
+}
+
+
+def run_chunk(step, chunk_size):
+    """Delete or detach one pk-ordered chunk of a step. Returns the row count."""
+    manager = step.model._base_manager
+    pks = list(manager.filter(step.filter).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+    if not pks:
+        return 0
+
+    with transaction.atomic():
+        chunk = manager.filter(step.filter, pk__gte=pks[0], pk__lte=pks[-1])
+        if step.before:
+            step.before(chunk)
+        if step.nullify:
+            return chunk.update(**{field: None for field in step.nullify})
+        return chunk._raw_delete(chunk.db)
+
+
+def start(kind, target_id, requested_by):
+    """
+    Create a deletion job, or return the unfinished one for the same target,
+    and run it in the background once the current transaction commits.
+    """
+    job = DeletionJob.objects.filter(kind=kind, target_id=target_id).exclude(status='done').first()
+    if job is None:
+        job = DeletionJob.objects.create(kind=kind, target_id=target_id, requested_by=requested_by)
+    if job.status != 'running':
+        background.submit_on_commit(run, job.id)
+    return job
+
+
+def run(job_id, chunk_size=None):
+    """
+    Run a pending or failed job to completion from its saved step.
+    Returns the job, or None when another worker already holds it.
+    """
+    chunk_size = chunk_size or _chunk_size()
+    claimed = DeletionJob.objects.filter(
+        id=job_id, status__in=('pending', 'failed')
+    ).update(status='running', error='', updated_at=timezone.now())
+    if not claimed:
+        return None
+
+    job = DeletionJob.objects.get(id=job_id)
+    steps, finalize = PLANS[job.kind]
+    steps = steps(job.target_id)
+    try:
+        while job.step < len(steps):
+            step = steps[job.step]
+            while True:
+                count = run_chunk(step, chunk_size)
+                if not count:
+                    break
+                job.progress[step.name] = job.progress.get(step.name, 0) + count
+                job.save(update_fields=['progress', 'updated_at'])
+            job.step += 1
+            job.save(update_fields=['step', 'updated_at'])
+
+        with transaction.atomic():
+            finalize(job.target_id)
+        job.status = 'done'
+        job.finished_at = timezone.now()
+    except Exception as e:
+        logger.exception("Deletion job %s failed at step %s", job.id, job.step)
+        job.status = 'failed'
+        job.error = str(e)
+    job.save(update_fields=['status', 'error', 'finished_at', 'updated_at'])
+    return job
+
+
+def release_stalled(stalled_after=timedelta(minutes=15)):
+    """
+    Mark running jobs without progress for `stalled_after` as failed, e.g.
+    after the process running them died, so run() can pick them up again.
+    """
+    return DeletionJob.objects.filter(
+        status='running', updated_at__lt=timezone.now() - stalled_after
+    ).update(status='failed', error='Stalled, resuming')
+
+
+def progress(job):
+    """Status payload of a job for the API"""
+    steps, _ = PLANS[job.kind]
+    names = [step.name for step in steps(job.target_id)]
+    return {
+        'job_id': job.id,
+        'kind': job.kind,
+        'target_id': job.target_id,
+        'job_status': job.status,
+        'step': names[job.step] if job.step < len(names) else None,
+        'steps_done': min(job.step, len(names)),
+        'steps_total': len(names),
+        'progress': job.progress,
+        'error': job.error or None,
+        'created_at': job.created_at,
+        'finished_at': job.finished_at
+    }
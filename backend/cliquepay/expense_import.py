@@ -0,0 +1,248 @@
+"""
+Bulk expense import from CSV or NDJSON streams.
+
+Rows are read lazily from the stream and handled in chunks: each chunk
+preloads the users, groups and group members it references once, validates
+every row against that snapshot, and writes the valid expenses and their
+splits with bulk_create in one transaction. Invalid rows are reported with
+their row number and never block the rest of the chunk.
+
+Expected columns / keys per row:
+    paid_by, group_id OR friend_id, total_amount, currency (optional, payer's by default),
+    description (optional), deadline (optional, ISO 8601), receipt_url (optional)
+"""
+
+import csv
+import io
+import json
+import uuid
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from .models import Expense, ExpenseSplit, Group, GroupMember, User
+from . import group_summary, split_allocator
+
+DEFAULT_CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+
+
+def iter_rows(stream, file_format):
+    """
+    Yield (row_number, row_dict) pairs from a binary or text stream.
+
+    Args:
+        stream: File-like object (uploaded file, open file, stdin)
+        file_format (str): 'csv' or 'ndjson'
+    """
+    if isinstance(stream, io.TextIOBase):
+        text = stream
+    else:
+        text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+
+    if file_format == 'csv':
+        # Header is line 1, so data rows start at 2
+        for row_number, row in enumerate(csv.DictReader(text), start=2):
+            yield row_number, row
+    elif file_format == 'ndjson':
+        for row_number, line in enumerate(text, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                row = None
+            yield row_number, row if isinstance(row, dict) else {'__invalid__': line}
+    else:
+        raise ValueError(f'Unsupported import format: {file_format}')
+
+
+def _chunks(rows, chunk_size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _clean(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _validate_row(row, users, groups, members_by_group, payer_id=None):
+    """
+    Validate one row against the preloaded chunk data.
+    `users` maps user id to the user's currency.
+
+    Returns:
+        tuple: (cleaned dict, None) or (None, list of error messages)
+    """
+    if '__invalid__' in row:
+        return None, ['Row is not a JSON object']
+
+    errors = []
+    paid_by = _clean(row.get('paid_by')) or payer_id
+    group_id = _clean(row.get('group_id'))
+    friend_id = _clean(row.get('friend_id'))
+
+    if not paid_by or paid_by not in users:
+        errors.append('paid_by must be an existing user id')
+    elif payer_id and paid_by != payer_id:
+        errors.append('paid_by must be the importing user')
+
+    if bool(group_id) == bool(friend_id):
+        errors.append('Exactly one of group_id or friend_id is required')
+    elif group_id:
+        if group_id not in groups:
+            errors.append('group_id does not exist')
+        elif paid_by not in members_by_group.get(group_id, ()):
+            errors.append('paid_by is not a member of the group')
+    elif friend_id not in users:
+        errors.append('friend_id must be an existing user id')
+    elif friend_id == paid_by:
+        errors.append('friend_id must differ from paid_by')
+
+    try:
+        total_amount = Decimal(str(row.get('total_amount'))).quantize(split_allocator.CENT)
+        if total_amount <= 0 or total_amount >= Decimal('100000000'):
+            errors.append('total_amount must be positive and below 100000000')
+    except (InvalidOperation, TypeError, ValueError):
+        total_amount = None
+        errors.append('total_amount must be a number')
+
+    currency = _clean(row.get('currency'))
+    if currency and len(currency) > 10:
+        errors.append('currency must be at most 10 characters')
+
+    deadline = _clean(row.get('deadline'))
+    if deadline:
+        parsed = parse_datetime(deadline)
+        if parsed is None:
+            errors.append('deadline must be an ISO 8601 datetime')
+        deadline = parsed
+
+    if errors:
+        return None, errors
+
+    return {
+        'paid_by': paid_by,
+        'group_id': group_id,
+        'friend_id': friend_id,
+        'total_amount': total_amount,
+        'currency': currency.upper() if currency else users[paid_by],
+        'description': _clean(row.get('description')) or '',
+        'deadline': deadline,
+        'receipt_url': _clean(row.get('receipt_url')),
+    }, None
+
+
+def build_expense(data, members_by_group):
+    """Build an unsaved Expense and its equal splits in exact cents."""
+    expense_id = str(uuid.uuid4())
+    if data['group_id']:
+        participants = sorted(members_by_group[data['group_id']])
+    else:
+        participants = [data['paid_by'], data['friend_id']]
+
+    shares = split_allocator.allocate_cents(
+        split_allocator.to_cents(data['total_amount']), [1] * len(participants)
+    )
+
+    splits = []
+    remaining_amount = Decimal('0')
+    for user_id, cents in zip(participants, shares):
+        amount = split_allocator.from_cents(cents)
+        is_payer = user_id == data['paid_by']
+        if not is_payer:
+            remaining_amount += amount
+        splits.append(ExpenseSplit(
+            id=str(uuid.uuid4()),
+            expense_id=expense_id,
+            user_id=user_id,
+            total_amount=amount,
+            remaining_amount=Decimal('0') if is_payer else amount,
+            is_paid=is_payer
+        ))
+
+    expense = Expense(
+        id=expense_id,
+        group_id=data['group_id'],
+        friend_id=data['friend_id'],
+        paid_by_id=data['paid_by'],
+        total_amount=data['total_amount'],
+        remaining_amount=remaining_amount,
+        currency=data['currency'],
+        description=data['description'],
+        deadline=data['deadline'],
+        receipt_url=data['receipt_url']
+    )
+    return expense, splits
+
+
+def import_expenses(rows, chunk_size=DEFAULT_CHUNK_SIZE, payer_id=None, progress=None):
+    """
+    Validate and insert expenses from an iterable of (row_number, row) pairs.
+
+    Args:
+        rows (iterable): Output of iter_rows
+        chunk_size (int): Rows validated and written per transaction
+        payer_id (str, optional): Force every row to be paid by this user
+        progress (callable, optional): Called as progress(summary) after each chunk
+    Returns:
+        dict: processed / created / failed counts and per-row errors
+    """
+    summary = {'processed': 0, 'created': 0, 'failed': 0, 'errors': []}
+
+    for chunk in _chunks(rows, chunk_size):
+        user_ids = set()
+        group_ids = set()
+        for _, row in chunk:
+            if '__invalid__' in row:
+                continue
+            user_ids.update(filter(None, (_clean(row.get('paid_by')), _clean(row.get('friend_id')))))
+            group_id = _clean(row.get('group_id'))
+            if group_id:
+                group_ids.add(group_id)
+        if payer_id:
+            user_ids.add(payer_id)
+
+        users = dict(User.objects.filter(id__in=user_ids).values_list('id', 'currency'))
+        groups = set(Group.objects.filter(id__in=group_ids).values_list('id', flat=True))
+        members_by_group = defaultdict(set)
+        for group_id, user_id in GroupMember.objects.filter(group_id__in=groups).values_list('group_id', 'user_id'):
+            members_by_group[group_id].add(user_id)
+
+        expenses = []
+        splits = []
+        for row_number, row in chunk:
+            data, errors = _validate_row(row, users, groups, members_by_group, payer_id)
+            if errors:
+                summary['failed'] += 1
+                if len(summary['errors']) < MAX_REPORTED_ERRORS:
+                    summary['errors'].append({'row': row_number, 'errors': errors})
+                continue
+            expense, expense_splits = build_expense(data, members_by_group)
+            expenses.append(expense)
+            splits.extend(expense_splits)
+
+        with transaction.atomic():
+            Expense.objects.bulk_create(expenses, batch_size=chunk_size)
+            ExpenseSplit.objects.bulk_create(splits, batch_size=chunk_size)
+            # bulk_create skips the post_save signal
+            group_summary.invalidate(*{expense.group_id for expense in expenses})
+
+        summary['processed'] += len(chunk)
+        summary['created'] += len(expenses)
+        if progress:
+            progress(summary)
+
+    return summary
@@ -0,0 +1,265 @@
+"""
+Friend graph cached as per-user adjacency sets in Redis.
+
+Every user has up to four sets of user ids:
+    friends:<id>:accepted      accepted friends
+    friends:<id>:pending_in    users who sent this user a request
+    friends:<id>:pending_out   users this user sent a request to
+    friends:<id>:blocked       users on the other side of a block, either way
+plus a friends:<id>:loaded marker. A user's sets are loaded from the
+database on first use and expire after FRIEND_GRAPH_TTL seconds, so an
+empty set with the marker present means "no such relation" while a
+missing marker means "not cached yet".
+
+Every applied change bumps friends:<id>:version of both users. A load
+WATCHes that key from before its database read until it writes the sets,
+so an unfriend or block applied in between aborts the write instead of
+being overwritten by the older read. Loads from inside a transaction are
+not cached, their snapshot may predate changes already applied.
+
+The sets are updated from the Friendship post_save / post_delete signals
+after commit, which covers the friend request, accept, reject, remove and
+block flows as well as cascades from deleted users. Code that writes
+friendships without signals (bulk_create) must call record_change itself.
+When Redis is unavailable every lookup falls back to the database;
+rebuild_friend_graph recreates all sets from the database.
+"""
+
+import logging
+
+import redis
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .models import Friendship, User
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+ACCEPTED = 'accepted'
+PENDING_IN = 'pending_in'
+PENDING_OUT = 'pending_out'
+BLOCKED = 'blocked'
+KINDS = (ACCEPTED, PENDING_IN, PENDING_OUT, BLOCKED)
+
+SET_KEY = 'friends:{}:{}'
+LOADED_KEY = 'friends:{}:loaded'
+VERSION_KEY = 'friends:{}:version'
+
+
+def _ttl():
+    return getattr(settings, 'FRIEND_GRAPH_TTL', 24 * 60 * 60)
+
+
+def _keys(user_id):
+    return [SET_KEY.format(user_id, kind) for kind in KINDS]
+
+
+def kinds_for(status, action_user_id, user1_id, user2_id):
+    """
+    Relation kind as seen by user1 and by user2 for one friendship row.
+
+    Returns:
+        tuple: (kind for user1, kind for user2)
+    """
+    if status == Friendship.ACCEPTED:
+        return ACCEPTED, ACCEPTED
+    if status == Friendship.BLOCKED:
+        return BLOCKED, BLOCKED
+    if action_user_id == user1_id:
+        return PENDING_OUT, PENDING_IN
+    return PENDING_IN, PENDING_OUT
+
+
+def _relations_from_db(user_id, other_ids=None):
+    """other user id -> relation kind, read from the friendships table"""
+    fields = ('user1_id', 'user2_id', 'status', 'action_user_id')
+    if other_ids is None:
+        rows = Friendship.of_user(user_id, fields)
+    else:
+        pairs = Q()
+        for other_id in other_ids:
+            user1_id, user2_id = Friendship.ordered(user_id, other_id)
+            pairs |= Q(user1_id=user1_id, user2_id=user2_id)
+        rows = Friendship.objects.filter(pairs).values_list(*fields) if pairs else []
+
+    relations = {}
+    for user1_id, user2_id, status, action_user_id in rows:
+        kind1, kind2 = kinds_for(status, action_user_id, user1_id, user2_id)
+        if user1_id == user_id:
+            relations[user2_id] = kind1
+        else:
+            relations[user1_id] = kind2
+    return relations
+
+
+def _load(client, user_id):
+    if connection.in_atomic_block:
+        return _relations_from_db(user_id)
+
+    ttl = _ttl()
+    with client.pipeline(transaction=True) as pipe:
+        pipe.watch(VERSION_KEY.format(user_id))
+        relations = _relations_from_db(user_id)
+        pipe.multi()
+        pipe.delete(*_keys(user_id))
+        for kind in KINDS:
+            members = [other_id for other_id, other_kind in relations.items() if other_kind == kind]
+            if members:
+                key = SET_KEY.format(user_id, kind)
+                pipe.sadd(key, *members)
+                pipe.expire(key, ttl)
+        pipe.set(LOADED_KEY.format(user_id), 1, ex=ttl)
+        try:
+            pipe.execute()
+        except redis.WatchError:
+            # A change was applied meanwhile; the next lookup loads again
+            pass
+    return relations
+
+
+def relations(user_id):
+    """
+    Every relation of one user.
+
+    Returns:
+        dict: other user id -> one of KINDS
+    """
+    try:
+        client = get_redis()
+        pipe = client.pipeline(transaction=False)
+        pipe.exists(LOADED_KEY.format(user_id))
+        for key in _keys(user_id):
+            pipe.smembers(key)
+        loaded, *members = pipe.execute()
+        if not loaded:
+            return _load(client, user_id)
+        return {other_id: kind for kind, ids in zip(KINDS, members) for other_id in ids}
+    except redis.RedisError:
+        logger.warning("Friend graph unavailable, reading user %s from the database", user_id, exc_info=True)
+        return _relations_from_db(user_id)
+
+
+def relation(user_id, other_id):
+    """Relation kind between two users, or None, with O(1) set lookups"""
+    try:
+        client = get_redis()
+        pipe = client.pipeline(transaction=False)
+        pipe.exists(LOADED_KEY.format(user_id))
+        for key in _keys(user_id):
+            pipe.sismember(key, other_id)
+        loaded, *found = pipe.execute()
+        if not loaded:
+            return _load(client, user_id).get(other_id)
+        for kind, is_member in zip(KINDS, found):
+            if is_member:
+                return kind
+        return None
+    except redis.RedisError:
+        logger.warning("Friend graph unavailable, reading user %s from the database", user_id, exc_info=True)
+        return _relations_from_db(user_id, [other_id]).get(other_id)
+
+
+def are_friends(user_id, other_id):
+    return relation(user_id, other_id) == ACCEPTED
+
+
+def _apply(changes):
+    """
+    Write relation changes, a list of (user_a, user_b, kind_a, kind_b) where
+    a kind of None removes the relation. Sets of users that are not cached
+    yet are written too; they are replaced on the next load.
+    """
+    ttl = _ttl()
+    try:
+        pipe = get_redis().pipeline(transaction=True)
+        for user_a, user_b, kind_a, kind_b in changes:
+            for user_id, other_id, new_kind in ((user_a, user_b, kind_a), (user_b, user_a, kind_b)):
+                for kind in KINDS:
+                    pipe.srem(SET_KEY.format(user_id, kind), other_id)
+                if new_kind:
+                    key = SET_KEY.format(user_id, new_kind)
+                    pipe.sadd(key, other_id)
+                    pipe.expire(key, ttl)
+                pipe.incr(VERSION_KEY.format(user_id))
+                pipe.expire(VERSION_KEY.format(user_id), ttl)
+        pipe.execute()
+    except redis.RedisError:
+        logger.warning("Could not update the friend graph, dropping the affected users", exc_info=True)
+        try:
+            user_ids = {user_id for change in changes for user_id in change[:2]}
+            pipe = get_redis().pipeline(transaction=True)
+            for user_id in user_ids:
+                pipe.delete(LOADED_KEY.format(user_id))
+                pipe.incr(VERSION_KEY.format(user_id))
+                pipe.expire(VERSION_KEY.format(user_id), ttl)
+            pipe.execute()
+        except redis.RedisError:
+            # The sets expire on their own after FRIEND_GRAPH_TTL
+            pass
+
+
+def record_change(*friendships):
+    """Update the graph for saved friendships once the transaction commits"""
+    changes = [
+        (f.user1_id, f.user2_id, *kinds_for(f.status, f.action_user_id, f.user1_id, f.user2_id))
+        for f in friendships
+    ]
+    if changes:
+        transaction.on_commit(lambda: _apply(changes))
+
+
+def record_removal(*pairs):
+    """Remove relations between (user1_id, user2_id) pairs once the transaction commits"""
+    changes = [(user1_id, user2_id, None, None) for user1_id, user2_id in pairs]
+    if changes:
+        transaction.on_commit(lambda: _apply(changes))
+
+
+def rebuild(chunk_size=5000):
+    """
+    Recreate every user's sets from the database. Lookups made while it
+    runs load users lazily as usual. Returns the number of friendships.
+    """
+    client = get_redis()
+    pipe = client.pipeline(transaction=False)
+    for count, key in enumerate(client.scan_iter(match='friends:*', count=chunk_size), start=1):
+        pipe.delete(key)
+        if count % chunk_size == 0:
+            pipe.execute()
+    pipe.execute()
+
+    written = 0
+    last_id = ''
+    while True:
+        rows = list(
+            Friendship.objects.filter(id__gt=last_id).order_by('id')
+            .values_list('id', 'user1_id', 'user2_id', 'status', 'action_user_id')[:chunk_size]
+        )
+        if not rows:
+            break
+        pipe = client.pipeline(transaction=False)
+        for _, user1_id, user2_id, status, action_user_id in rows:
+            kind1, kind2 = kinds_for(status, action_user_id, user1_id, user2_id)
+            pipe.sadd(SET_KEY.format(user1_id, kind1), user2_id)
+            pipe.sadd(SET_KEY.format(user2_id, kind2), user1_id)
+        pipe.execute()
+        written += len(rows)
+        last_id = rows[-1][0]
+
+    # Mark every user as loaded, including those without friendships
+    ttl = _ttl()
+    last_id = ''
+    while True:
+        user_ids = list(User.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size])
+        if not user_ids:
+            break
+        pipe = client.pipeline(transaction=False)
+        for user_id in user_ids:
+            for key in _keys(user_id):
+                pipe.expire(key, ttl)
+            pipe.set(LOADED_KEY.format(user_id), 1, ex=ttl)
+        pipe.execute()
+        last_id = user_ids[-1]
+    return written
@@ -0,0 +1,94 @@
+"""
+Per-user friendship versions for incremental friends lists.
+
+Every change to a friendship (create, status change, delete) bumps
+User.friends_version of both users and logs a FriendshipChange row per user
+with the new version. A client that remembers the version of its last
+friends list can then ask only for the friendships changed since, or send
+it back as an ETag and get a 304 when nothing changed.
+
+A friend changing their profile (name, e-mail or avatar) shows up in
+every friends list they appear in, so profile_changed bumps the version of
+each of their friends and logs the friendship as changed for them.
+"""
+
+import hashlib
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import Friendship, FriendshipChange, User
+
+
+def bump(*friendships):
+    """
+    Advance friends_version of both users of each friendship and log the
+    changes, in the caller's transaction. Called from the Friendship signals;
+    code that writes friendships in bulk must call it itself.
+    """
+    changed = defaultdict(list)
+    for friendship in friendships:
+        changed[friendship.user1_id].append(friendship.id)
+        changed[friendship.user2_id].append(friendship.id)
+    _advance(changed)
+
+
+def profile_changed(user_id):
+    """
+    Advance friends_version of everyone whose friends list shows this
+    user, in the caller's transaction. Called from the User signal on
+    profile saves; code that updates profiles with update() must call it.
+    """
+    changed = defaultdict(list)
+    for friendship_id, user1_id, user2_id in Friendship.of_user(user_id, ('id', 'user1_id', 'user2_id')):
+        changed[user2_id if user1_id == user_id else user1_id].append(friendship_id)
+    _advance(changed)
+
+
+def _advance(changed):
+    """Bump the version of each user once per friendship id in `changed` (user id -> ids)"""
+    if not changed:
+        return
+
+    with transaction.atomic():
+        # Row locks serialize concurrent bumps, in id order to avoid deadlocks
+        versions = dict(
+            User.objects.select_for_update().filter(id__in=changed)
+            .order_by('id').values_list('id', 'friends_version')
+        )
+        changes = []
+        users_by_increment = defaultdict(list)
+        for user_id, version in versions.items():
+            friendship_ids = changed[user_id]
+            users_by_increment[len(friendship_ids)].append(user_id)
+            changes.extend(
+                FriendshipChange(user_id=user_id, version=version + offset, friendship_id=friendship_id)
+                for offset, friendship_id in enumerate(friendship_ids, start=1)
+            )
+        for increment, user_ids in users_by_increment.items():
+            User.objects.filter(id__in=user_ids).update(friends_version=F('friends_version') + increment)
+        FriendshipChange.objects.bulk_create(changes)
+
+
+def changes_since(user_id, version, limit=None):
+    """
+    Friendships of a user changed after `version`, oldest change first.
+
+    Returns:
+        tuple: (friendship ids without duplicates, version reached, has_more)
+    """
+    rows = FriendshipChange.objects.filter(
+        user_id=user_id, version__gt=version
+    ).order_by('version').values_list('version', 'friendship_id')
+    rows = list(rows[:limit + 1] if limit else rows)
+    has_more = bool(limit) and len(rows) > limit
+    rows = rows[:limit] if has_more else rows
+    friendship_ids = list(dict.fromkeys(friendship_id for _, friendship_id in rows))
+    return friendship_ids, rows[-1][0] if rows else version, has_more
+
+
+def etag(user_id, version, *params):
+    """Strong ETag for a friends list response at `version` with the given request params"""
+    digest = hashlib.sha256(repr((user_id, *params)).encode('utf-8')).hexdigest()[:16]
+    return f'"friends-{version}-{digest}"'
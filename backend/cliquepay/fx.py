@@ -0,0 +1,269 @@
+"""
+Currency conversion backed by the local FxRate table.
+
+Rates are stored against one pivot currency (settings.FX_BASE_CURRENCY,
+USD by default) and loaded from a provider: the bundled JSON fixture works
+offline, a live provider only has to return the same payload shape:
+
+    {"base": "USD", "source": "...", "rates": {"2025-01-01": {"EUR": "0.965", ...}}}
+
+Conversions use the latest rate on or before the requested date; dates
+older than every loaded rate of a currency use its earliest rate. Resolved
+rates are kept in an in-process LRU keyed by (from, to, date), and
+convert_many resolves every missing key of a batch with a single query.
+
+Every process sees the rates loaded by any other: load_rates bumps the
+fx_rates:version Redis key after commit, and each lookup compares it with
+the version its cache was filled under, clearing the cache when it moved.
+Entries also expire after FX_CACHE_TTL seconds, which bounds staleness
+when Redis is unavailable. Rates of dates later than a currency's latest
+loaded rate are not cached, a newer rate may still be loaded for them.
+"""
+
+import bisect
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from datetime import date as date_type, datetime
+from decimal import Decimal
+from pathlib import Path
+
+import redis
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import FxRate
+from .redis_client import get_redis
+from .split_allocator import CENT
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FIXTURE = Path(__file__).resolve().parent / 'fixtures' / 'fx_rates.json'
+CACHE_SIZE = 4096
+CACHE_TTL = getattr(settings, 'FX_CACHE_TTL', 10 * 60)
+
+VERSION_KEY = 'fx_rates:version'
+
+
+class FxRateError(LookupError):
+    """Raised when no rate at all is known for a currency."""
+
+
+def base_currency():
+    return getattr(settings, 'FX_BASE_CURRENCY', 'USD')
+
+
+class _RateCache:
+    """Thread-safe LRU of conversion rates keyed by (from, to, date), with expiry."""
+
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            rate, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return rate
+
+    def put(self, key, rate):
+        with self._lock:
+            self._data[key] = (rate, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def sync(self, version):
+        """Clear the entries if the rates were reloaded since they were cached."""
+        with self._lock:
+            if version != self._version:
+                self._data.clear()
+                self._version = version
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_cache = _RateCache()
+
+
+def _sync_version():
+    try:
+        version = get_redis().get(VERSION_KEY)
+    except redis.RedisError:
+        # Entries still expire after FX_CACHE_TTL
+        logger.warning("Rate version unavailable, relying on the cache expiry", exc_info=True)
+        return
+    _cache.sync(version)
+
+
+def _bump_version():
+    try:
+        get_redis().incr(VERSION_KEY)
+    except redis.RedisError:
+        logger.warning("Could not publish reloaded rates, other processes see them within FX_CACHE_TTL",
+                       exc_info=True)
+
+
+class FixtureProvider:
+    """Offline provider reading rates from a JSON file."""
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else DEFAULT_FIXTURE
+
+    def fetch(self):
+        with open(self.path, encoding='utf-8') as f:
+            return json.load(f)
+
+
+def load_rates(payload):
+    """
+    Upsert the rates of a provider payload into FxRate.
+
+    Args:
+        payload (dict): {"base", "source" (optional), "rates": {date: {quote: rate}}}
+    Returns:
+        int: Number of rates written
+    """
+    base = payload['base'].upper()
+    if base != base_currency():
+        raise ValueError(f'Rates must be quoted against {base_currency()}, got {base}')
+
+    source = payload.get('source', 'fixture')
+    rows = [
+        FxRate(base=base, quote=quote.upper(), date=date_type.fromisoformat(day), rate=Decimal(str(rate)), source=source)
+        for day, quotes in payload['rates'].items()
+        for quote, rate in quotes.items()
+    ]
+
+    with transaction.atomic():
+        if connection.features.supports_update_conflicts_with_target:
+            FxRate.objects.bulk_create(
+                rows, update_conflicts=True, unique_fields=['base', 'quote', 'date'],
+                update_fields=['rate', 'source', 'updated_at']
+            )
+        else:
+            # MySQL upserts on any unique key and rejects unique_fields
+            FxRate.objects.bulk_create(rows, update_conflicts=True, update_fields=['rate', 'source', 'updated_at'])
+        transaction.on_commit(_bump_version)
+
+    _cache.clear()
+    return len(rows)
+
+
+def load_fixture(path=None):
+    """Load rates from a JSON fixture, the bundled one by default."""
+    return load_rates(FixtureProvider(path).fetch())
+
+
+def _as_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _resolve(keys):
+    """Resolve (from, to, date) keys with one query and cache the final rates."""
+    base = base_currency()
+    currencies = {currency for key in keys for currency in key[:2]} - {base}
+    history = defaultdict(list)
+    # Currencies with a rate loaded after every requested date
+    superseded = set()
+    if currencies:
+        last_day = max(key[2] for key in keys)
+        rows = (
+            FxRate.objects.filter(base=base, quote__in=currencies, date__lte=last_day)
+            .order_by('quote', 'date')
+            .values_list('quote', 'date', 'rate')
+        )
+        for quote, day, rate in rows:
+            history[quote].append((day, rate))
+        # Every requested date predates these currencies' rates, fall back to the earliest
+        for quote in currencies - set(history):
+            earliest = (
+                FxRate.objects.filter(base=base, quote=quote).order_by('date')
+                .values_list('date', 'rate').first()
+            )
+            if earliest:
+                history[quote].append(earliest)
+        behind = {quote for quote, dates in history.items() if dates[-1][0] < last_day}
+        if behind:
+            superseded = set(
+                FxRate.objects.filter(base=base, quote__in=behind, date__gt=last_day)
+                .values_list('quote', flat=True).distinct()
+            )
+
+    def pivot_rate(currency, day):
+        """Rate against the base, and whether a later load can no longer change it"""
+        if currency == base:
+            return Decimal('1'), True
+        dates = history.get(currency, [])
+        if not dates:
+            raise FxRateError(f'No {base}/{currency} rate loaded')
+        position = bisect.bisect_right(dates, (day, Decimal('Infinity')))
+        # Past the latest loaded rate the rate of a newer date may still arrive
+        return dates[max(position, 1) - 1][1], day <= dates[-1][0] or currency in superseded
+
+    rates = {}
+    for key in keys:
+        from_currency, to_currency, day = key
+        (to_rate, to_final), (from_rate, from_final) = pivot_rate(to_currency, day), pivot_rate(from_currency, day)
+        rates[key] = to_rate / from_rate
+        if to_final and from_final:
+            _cache.put(key, rates[key])
+    return rates
+
+
+def get_rate(from_currency, to_currency, on_date):
+    """Rate to multiply an amount in from_currency by to get to_currency."""
+    key = (from_currency.upper(), to_currency.upper(), _as_date(on_date))
+    if key[0] == key[1]:
+        return Decimal('1')
+    _sync_version()
+    rate = _cache.get(key)
+    if rate is None:
+        rate = _resolve([key])[key]
+    return rate
+
+
+def convert_many(entries, to_currency):
+    """
+    Convert a batch of amounts to one currency in a single pass.
+
+    Args:
+        entries (iterable): (amount, currency, date or datetime) tuples
+        to_currency (str): Target currency
+    Returns:
+        list[Decimal]: Converted amounts rounded to cents, in input order
+    """
+    entries = list(entries)
+    to_currency = to_currency.upper()
+    keys = [(currency.upper(), to_currency, _as_date(day)) for _, currency, day in entries]
+
+    _sync_version()
+    rates = {}
+    missing = set()
+    for key in set(keys):
+        rate = Decimal('1') if key[0] == to_currency else _cache.get(key)
+        if rate is None:
+            missing.add(key)
+        else:
+            rates[key] = rate
+    if missing:
+        rates.update(_resolve(missing))
+
+    return [(Decimal(amount) * rates[key]).quantize(CENT) for (amount, _, _), key in zip(entries, keys)]
+
+
+def clear_cache():
+    _cache.clear()
@@ -0,0 +1,177 @@
+"""
+Group details with members and pending invitations, in a fixed number of
+queries and cached per group.
+
+The group row, its members (joined to their users) and its invitations
+(joined to the invited users) are loaded with prefetch_related, and every
+query is projected with only(). That is three queries whatever the group
+size. The result is cached in Redis as JSON, shared by every worker, and
+invalidated after commit by the Group, GroupMember and GroupInvitation
+signals, by member profile changes (invalidate_user), and explicitly by the
+bulk paths that bypass signals.
+
+Invalidation also bumps group_info:<group_id>:version, which a fill WATCHes
+from before its queries, so info read before a change committed is never
+cached after it. The cached member list is for display only; access is
+checked against group_membership. When Redis is unavailable the info is
+loaded on every request.
+"""
+
+import json
+import logging
+from datetime import datetime
+
+import redis
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Prefetch
+
+from .models import Group, GroupInvitation, GroupMember
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+CACHE_TIMEOUT = getattr(settings, 'GROUP_INFO_CACHE_TTL', 5 * 60)
+
+INFO_KEY = 'group_info:{}'
+VERSION_KEY = 'group_info:{}:version'
+
+USER_FIELDS = ('id', 'name', 'full_name', 'avatar_url', 'avatar_variants')
+
+
+def _drop_now(group_ids):
+    try:
+        pipe = get_redis().pipeline(transaction=True)
+        for group_id in group_ids:
+            pipe.delete(INFO_KEY.format(group_id))
+            pipe.incr(VERSION_KEY.format(group_id))
+            pipe.expire(VERSION_KEY.format(group_id), CACHE_TIMEOUT)
+        pipe.execute()
+    except redis.RedisError:
+        # Stale info expires after GROUP_INFO_CACHE_TTL
+        logger.warning("Could not drop cached info of groups %s", group_ids, exc_info=True)
+
+
+def invalidate(*group_ids):
+    """Drop the cached info of the groups once the transaction commits."""
+    group_ids = {group_id for group_id in group_ids if group_id}
+    if group_ids:
+        transaction.on_commit(lambda: _drop_now(group_ids))
+
+
+def invalidate_user(user_id):
+    """Drop the cached info of the groups showing a user's profile"""
+    invalidate(
+        *GroupMember.objects.filter(user_id=user_id).values_list('group_id', flat=True),
+        *GroupInvitation.objects.filter(invited_user_id=user_id).values_list('group_id', flat=True)
+    )
+
+
+def _load(group_id):
+    members = GroupMember.objects.select_related('user').only(
+        'id', 'group', 'user', 'role', 'joined_at', 'user__phone_number',
+        *(f'user__{field}' for field in USER_FIELDS)
+    ).order_by('joined_at', 'id')
+    invitations = GroupInvitation.objects.select_related('invited_user').only(
+        'id', 'group', 'invited_user', 'created_at', 'invited_by',
+        *(f'invited_user__{field}' for field in USER_FIELDS)
+    ).order_by('created_at', 'id')
+
+    group = Group.objects.only(
+        'id', 'name', 'description', 'created_at', 'photo_url', 'created_by'
+    ).prefetch_related(
+        Prefetch('members', queryset=members),
+        Prefetch('invitations', queryset=invitations),
+    ).get(id=group_id)
+
+    group_members = [{
+        'user_id': member.user.id,
+        'username': member.user.name,
+        'full_name': member.user.full_name,
+        'profile_photo': member.user.list_avatar_url,
+        'phone_number': member.user.phone_number,
+        'role': member.role,
+        'joined_at': member.joined_at,
+        'status': 'member'
+    } for member in group.members.all()]
+
+    invited_users = [{
+        'user_id': invite.invited_user.id,
+        'username': invite.invited_user.name,
+        'full_name': invite.invited_user.full_name,
+        'profile_photo': invite.invited_user.list_avatar_url,
+        'invited_at': invite.created_at,
+        'invited_by': invite.invited_by_id,
+        'invite_id': invite.id,
+        'status': 'invited'
+    } for invite in group.invitations.all()]
+
+    return {
+        'group_info': {
+            'group_name': group.name,
+            'group_id': group.id,
+            'description': group.description,
+            'created_at': group.created_at,
+            'photo_url': group.photo_url,
+            'group_size': len(group_members),
+            'created_by': group.created_by_id
+        },
+        'group_members': group_members,
+        'invited_users': invited_users
+    }
+
+
+def _dumps(info):
+    return json.dumps({
+        'group_info': {**info['group_info'], 'created_at': info['group_info']['created_at'].isoformat()},
+        'group_members': [
+            {**member, 'joined_at': member['joined_at'].isoformat()} for member in info['group_members']
+        ],
+        'invited_users': [
+            {**invite, 'invited_at': invite['invited_at'].isoformat()} for invite in info['invited_users']
+        ],
+    })
+
+
+def _loads(payload):
+    info = json.loads(payload)
+    info['group_info']['created_at'] = datetime.fromisoformat(info['group_info']['created_at'])
+    for member in info['group_members']:
+        member['joined_at'] = datetime.fromisoformat(member['joined_at'])
+    for invite in info['invited_users']:
+        invite['invited_at'] = datetime.fromisoformat(invite['invited_at'])
+    return info
+
+
+def _fill(client, group_id):
+    if connection.in_atomic_block:
+        # The snapshot may predate changes already committed
+        return _load(group_id)
+
+    with client.pipeline(transaction=True) as pipe:
+        pipe.watch(VERSION_KEY.format(group_id))
+        info = _load(group_id)
+        pipe.multi()
+        pipe.set(INFO_KEY.format(group_id), _dumps(info), ex=CACHE_TIMEOUT)
+        try:
+            pipe.execute()
+        except redis.WatchError:
+            # Invalidated meanwhile; the next request loads again
+            pass
+    return info
+
+
+def get(group_id):
+    """
+    Cached group info, members and invitations.
+    Raises Group.DoesNotExist for unknown groups.
+    """
+    try:
+        client = get_redis()
+        payload = client.get(INFO_KEY.format(group_id))
+        if payload is None:
+            return _fill(client, group_id)
+        return _loads(payload)
+    except redis.RedisError:
+        logger.warning("Group info cache unavailable, loading group %s", group_id, exc_info=True)
+        return _load(group_id)
@@ -0,0 +1,166 @@
+"""
+Group membership and roles cached as one Redis hash per group.
+
+    group_members:<group_id>    user id -> role ('admin' or 'member')
+
+plus a LOADED_FIELD marker field. A group's hash is loaded from the
+database on first use and expires after GROUP_MEMBERSHIP_TTL seconds. A
+hash without the marker (for example one created by a change applied
+before the group was loaded) is not trusted and is reloaded.
+
+Every applied change also bumps group_members:<group_id>:version. A load
+WATCHes that key from before its database read until it writes the hash,
+so a removal or demotion applied in between aborts the write instead of
+being overwritten by the older read. Loads from inside a transaction,
+whose snapshot may predate changes already applied, are not cached.
+
+Authorization checks of the group methods read the hash with a single
+HGET instead of querying group_members. The hash is updated from the
+GroupMember post_save / post_delete signals after commit, so a rolled back
+join or removal never shows up. Code that writes memberships without
+signals (bulk_create, raw deletes) must call record_change / drop itself.
+When Redis is unavailable every lookup falls back to the database.
+"""
+
+import logging
+
+import redis
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import GroupMember
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+ADMIN = 'admin'
+MEMBER = 'member'
+
+HASH_KEY = 'group_members:{}'
+VERSION_KEY = 'group_members:{}:version'
+LOADED_FIELD = '*loaded'
+
+
+def _ttl():
+    return getattr(settings, 'GROUP_MEMBERSHIP_TTL', 24 * 60 * 60)
+
+
+def _roles_from_db(group_id):
+    return dict(GroupMember.objects.filter(group_id=group_id).values_list('user_id', 'role'))
+
+
+def _load(client, group_id):
+    if connection.in_atomic_block:
+        return _roles_from_db(group_id)
+
+    key = HASH_KEY.format(group_id)
+    with client.pipeline(transaction=True) as pipe:
+        pipe.watch(VERSION_KEY.format(group_id))
+        roles = _roles_from_db(group_id)
+        pipe.multi()
+        pipe.delete(key)
+        pipe.hset(key, mapping={LOADED_FIELD: 1, **roles})
+        pipe.expire(key, _ttl())
+        try:
+            pipe.execute()
+        except redis.WatchError:
+            # A change was applied meanwhile; the next lookup loads again
+            pass
+    return roles
+
+
+def roles(group_id):
+    """
+    Every member of a group with their role.
+
+    Returns:
+        dict: user id -> role
+    """
+    try:
+        client = get_redis()
+        roles = client.hgetall(HASH_KEY.format(group_id))
+        if LOADED_FIELD not in roles:
+            return _load(client, group_id)
+        del roles[LOADED_FIELD]
+        return roles
+    except redis.RedisError:
+        logger.warning("Membership cache unavailable, reading group %s from the database", group_id, exc_info=True)
+        return _roles_from_db(group_id)
+
+
+def role(group_id, user_id):
+    """Role of a user in a group, or None if they are not a member"""
+    try:
+        client = get_redis()
+        loaded, role = client.hmget(HASH_KEY.format(group_id), LOADED_FIELD, user_id)
+        if not loaded:
+            return _load(client, group_id).get(user_id)
+        return role
+    except redis.RedisError:
+        logger.warning("Membership cache unavailable, reading group %s from the database", group_id, exc_info=True)
+        return GroupMember.objects.filter(group_id=group_id, user_id=user_id).values_list('role', flat=True).first()
+
+
+def is_member(group_id, user_id):
+    return role(group_id, user_id) is not None
+
+
+def is_admin(group_id, user_id):
+    return role(group_id, user_id) == ADMIN
+
+
+def _drop_now(group_ids):
+    try:
+        pipe = get_redis().pipeline(transaction=True)
+        for group_id in group_ids:
+            pipe.delete(HASH_KEY.format(group_id))
+            pipe.incr(VERSION_KEY.format(group_id))
+            pipe.expire(VERSION_KEY.format(group_id), _ttl())
+        pipe.execute()
+    except redis.RedisError:
+        # The hashes expire on their own after GROUP_MEMBERSHIP_TTL
+        logger.warning("Could not drop cached memberships of groups %s", group_ids, exc_info=True)
+
+
+def _apply(changes):
+    """
+    Write membership changes, a list of (group_id, user_id, role) where a
+    role of None removes the member. Hashes of groups that are not loaded
+    yet get no marker and are replaced on the next load.
+    """
+    try:
+        pipe = get_redis().pipeline(transaction=True)
+        for group_id, user_id, role in changes:
+            key = HASH_KEY.format(group_id)
+            if role:
+                pipe.hset(key, user_id, role)
+                pipe.expire(key, _ttl())
+            else:
+                pipe.hdel(key, user_id)
+            pipe.incr(VERSION_KEY.format(group_id))
+            pipe.expire(VERSION_KEY.format(group_id), _ttl())
+        pipe.execute()
+    except redis.RedisError:
+        logger.warning("Could not update the membership cache, dropping the affected groups", exc_info=True)
+        _drop_now({group_id for group_id, _, _ in changes})
+
+
+def record_change(*memberships):
+    """Update the cache for saved GroupMember rows once the transaction commits"""
+    changes = [(m.group_id, m.user_id, m.role) for m in memberships]
+    if changes:
+        transaction.on_commit(lambda: _apply(changes))
+
+
+def record_removal(*pairs):
+    """Remove (group_id, user_id) memberships once the transaction commits"""
+    changes = [(group_id, user_id, None) for group_id, user_id in pairs]
+    if changes:
+        transaction.on_commit(lambda: _apply(changes))
+
+
+def drop(*group_ids):
+    """Forget the cached members of groups once the transaction commits"""
+    group_ids = {group_id for group_id in group_ids if group_id}
+    if group_ids:
+        transaction.on_commit(lambda: _drop_now(group_ids))
@@ -0,0 +1,237 @@
+"""
+Per-group expense totals computed with one aggregation query.
+
+The summary is built from a single GROUP BY over ExpenseSplit joined to
+Expense, grouped by (debtor, payer, currency, expense date) so every amount
+is converted at the rate of its expense's date, the same policy as the
+financial summary and settlement data. The rows are cached per group in
+Redis as JSON. Every write that changes a group's expenses or splits calls
+invalidate(); the model signals cover single-row saves, and bulk writes
+(imports, recurring runs, payments) call it explicitly because they bypass
+signals.
+
+Invalidation also bumps group_summary:<group_id>:version, which a fill
+WATCHes from before its aggregation query, so rows read before a change
+committed are never cached after it. When Redis is unavailable the rows are
+aggregated on every request.
+
+The converted totals are cached too, one hash field per currency in
+group_summary:<group_id>:summaries, tagged with fx_rates:version so a rate
+reload makes them recompute from the cached rows. Neither cache holds names;
+member names are looked up with one query per summary, so a renamed member
+shows up without invalidating anything.
+"""
+
+import json
+import logging
+from collections import defaultdict
+from datetime import date, timezone as dt_timezone
+from decimal import Decimal
+
+import redis
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+
+from . import fx
+from .models import ExpenseSplit, User
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+CACHE_TIMEOUT = getattr(settings, 'GROUP_SUMMARY_CACHE_TTL', 60 * 60)
+
+ROWS_KEY = 'group_summary:{}'
+VERSION_KEY = 'group_summary:{}:version'
+SUMMARIES_KEY = 'group_summary:{}:summaries'
+
+
+def _drop_now(group_ids):
+    try:
+        pipe = get_redis().pipeline(transaction=True)
+        for group_id in group_ids:
+            pipe.delete(ROWS_KEY.format(group_id), SUMMARIES_KEY.format(group_id))
+            pipe.incr(VERSION_KEY.format(group_id))
+            pipe.expire(VERSION_KEY.format(group_id), CACHE_TIMEOUT)
+        pipe.execute()
+    except redis.RedisError:
+        # Stale rows expire after GROUP_SUMMARY_CACHE_TTL
+        logger.warning("Could not drop cached summaries of groups %s", group_ids, exc_info=True)
+
+
+def invalidate(*group_ids):
+    """Drop the cached summaries of the groups once the transaction commits."""
+    group_ids = {group_id for group_id in group_ids if group_id}
+    if group_ids:
+        transaction.on_commit(lambda: _drop_now(group_ids))
+
+
+def _aggregate(group_id):
+    """Raw per (debtor, payer, currency, day) totals for the group."""
+    return [
+        {
+            'user_id': row['user_id'],
+            'payer_id': row['expense__paid_by_id'],
+            'currency': row['expense__currency'],
+            'day': row['day'],
+            'share': row['share'],
+            'remaining': row['remaining'],
+        }
+        for row in (
+            ExpenseSplit.objects.filter(expense__group_id=group_id)
+            .annotate(day=TruncDate('expense__created_at', tzinfo=dt_timezone.utc))
+            .values('user_id', 'expense__paid_by_id', 'expense__currency', 'day')
+            .annotate(share=Sum('total_amount'), remaining=Sum('remaining_amount'))
+            .order_by()
+        )
+    ]
+
+
+def _dumps(rows):
+    return json.dumps([
+        {**row, 'day': row['day'].isoformat(), 'share': str(row['share']), 'remaining': str(row['remaining'])}
+        for row in rows
+    ])
+
+
+def _loads(payload):
+    return [
+        {**row, 'day': date.fromisoformat(row['day']),
+         'share': Decimal(row['share']), 'remaining': Decimal(row['remaining'])}
+        for row in json.loads(payload)
+    ]
+
+
+def _fill(client, group_id):
+    if connection.in_atomic_block:
+        # The snapshot may predate changes already committed
+        return _aggregate(group_id)
+
+    with client.pipeline(transaction=True) as pipe:
+        pipe.watch(VERSION_KEY.format(group_id))
+        rows = _aggregate(group_id)
+        pipe.multi()
+        pipe.set(ROWS_KEY.format(group_id), _dumps(rows), ex=CACHE_TIMEOUT)
+        try:
+            pipe.execute()
+        except redis.WatchError:
+            # Invalidated meanwhile; the next request aggregates again
+            pass
+    return rows
+
+
+def get_rows(group_id):
+    try:
+        client = get_redis()
+        payload = client.get(ROWS_KEY.format(group_id))
+        if payload is None:
+            return _fill(client, group_id)
+        return _loads(payload)
+    except redis.RedisError:
+        logger.warning("Summary cache unavailable, aggregating group %s", group_id, exc_info=True)
+        return _aggregate(group_id)
+
+
+def _summarize(rows, currency):
+    """Totals of the rows converted into currency, members keyed by id."""
+    converted = fx.convert_many(
+        [(row[field], row['currency'], row['day']) for row in rows for field in ('share', 'remaining')],
+        currency
+    )
+
+    zero = Decimal('0')
+    members = defaultdict(lambda: {'paid': zero, 'share': zero, 'owed_to_them': zero, 'they_owe': zero})
+    total_spent = zero
+    outstanding = zero
+    for index, row in enumerate(rows):
+        share, remaining = converted[2 * index], converted[2 * index + 1]
+        total_spent += share
+        members[row['user_id']]['share'] += share
+        members[row['payer_id']]['paid'] += share
+        if row['user_id'] != row['payer_id']:
+            outstanding += remaining
+            members[row['user_id']]['they_owe'] += remaining
+            members[row['payer_id']]['owed_to_them'] += remaining
+
+    return {
+        'total_spent': float(total_spent),
+        'outstanding': float(outstanding),
+        'members': [
+            {
+                'user_id': user_id,
+                'paid': float(totals['paid']),
+                'share': float(totals['share']),
+                'owed_to_them': float(totals['owed_to_them']),
+                'they_owe': float(totals['they_owe']),
+                'net': float(totals['owed_to_them'] - totals['they_owe']),
+            }
+            for user_id, totals in members.items()
+        ],
+    }
+
+
+def _fill_summary(client, group_id, currency):
+    if connection.in_atomic_block:
+        # Same as _fill: the rows may predate changes already committed
+        return _summarize(get_rows(group_id), currency)
+
+    with client.pipeline(transaction=True) as pipe:
+        pipe.watch(VERSION_KEY.format(group_id), fx.VERSION_KEY)
+        fx_version = pipe.get(fx.VERSION_KEY)
+        summary = _summarize(get_rows(group_id), currency)
+        pipe.multi()
+        pipe.hset(SUMMARIES_KEY.format(group_id), currency,
+                  json.dumps({'fx_version': fx_version, 'summary': summary}))
+        pipe.expire(SUMMARIES_KEY.format(group_id), CACHE_TIMEOUT)
+        try:
+            pipe.execute()
+        except redis.WatchError:
+            # Expenses or rates changed meanwhile; the next request converts again
+            pass
+    return summary
+
+
+def _get_summary(group_id, currency):
+    try:
+        client = get_redis()
+        pipe = client.pipeline(transaction=False)
+        pipe.get(fx.VERSION_KEY)
+        pipe.hget(SUMMARIES_KEY.format(group_id), currency)
+        fx_version, payload = pipe.execute()
+        if payload is not None:
+            cached = json.loads(payload)
+            if cached['fx_version'] == fx_version:
+                return cached['summary']
+        return _fill_summary(client, group_id, currency)
+    except redis.RedisError:
+        logger.warning("Summary cache unavailable, aggregating group %s", group_id, exc_info=True)
+        return _summarize(_aggregate(group_id), currency)
+
+
+def build_summary(group_id, currency):
+    """
+    Group totals and per-member net positions in one currency.
+
+    Amounts in other currencies are converted at the rate of their
+    expense's date.
+
+    Returns:
+        dict: total_spent, outstanding, currency and one entry per member with
+              paid (expenses they covered), share (their part of the expenses),
+              owed_to_them, they_owe and net (owed_to_them - they_owe)
+    """
+    summary = _get_summary(group_id, currency)
+    user_ids = [member['user_id'] for member in summary['members']]
+    names = dict(User.objects.filter(id__in=user_ids).values_list('id', 'full_name')) if user_ids else {}
+
+    return {
+        'group_id': group_id,
+        'currency': currency,
+        'total_spent': summary['total_spent'],
+        'outstanding': summary['outstanding'],
+        'members': [
+            {'user_id': member['user_id'], 'name': names.get(member['user_id']), **member}
+            for member in summary['members']
+        ],
+    }
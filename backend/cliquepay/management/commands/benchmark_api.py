@@ -0,0 +1,226 @@
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import jwt
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from cliquepay import bench_data, query_budget, storage_service
+from cliquepay.models import DirectMessage, GroupMember
+
+
+def _percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def _token(user):
+    # Views only decode the ID token, so an unsigned one stands in for Cognito
+    return jwt.encode({'sub': user['cognito_id'], 'cognito:username': user['name'], 'email': user['email']},
+                      'benchmark', algorithm='HS256')
+
+
+ENDPOINTS = {
+    'inbox': ('post', 'get_direct_messages', lambda ctx: {'id_token': ctx['token'], 'page': 1, 'page_size': 25}),
+    'thread': ('post', 'get_direct_messages_between_users',
+               lambda ctx: {'id_token': ctx['token'], 'recipient_id': ctx['partner_id'], 'page': 1, 'page_size': 20}),
+    'group_list': ('post', 'get_user_groups', lambda ctx: {'id_token': ctx['token']}),
+    'group_messages': ('post', 'get_group_messages',
+                       lambda ctx: {'id_token': ctx['token'], 'group_id': ctx['group_id'], 'page': 1, 'page_size': 50}),
+    'settlement': ('post', 'get_settlement_data', lambda ctx: {'id_token': ctx['token']}),
+    'financial_summary': ('get', 'get_financial_summary', lambda ctx: {'idToken': ctx['token']}),
+    'search': ('post', 'search_user', lambda ctx: {'id_token': ctx['token'], 'query': ctx['search_term']}),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic data set (users, power-law friendships, groups, messages, "
+        "expenses) and time the hot API endpoints through the full Django stack, "
+        "recording latency percentiles and query counts as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--mean-friends', type=int, default=20)
+        parser.add_argument('--groups', type=int, default=1000)
+        parser.add_argument('--group-size', type=int, default=6)
+        parser.add_argument('--direct-messages', type=int, default=1_000_000)
+        parser.add_argument('--group-messages', type=int, default=500_000)
+        parser.add_argument('--expenses', type=int, default=200_000)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Timed requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=5,
+                            help='Untimed requests per endpoint, to fill caches')
+        parser.add_argument('--sample-users', type=int, default=25,
+                            help='Seeded users the requests rotate through, busiest first')
+        parser.add_argument('--endpoint', action='append', choices=sorted(ENDPOINTS),
+                            help='Only run these endpoints (repeatable)')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument('--compare', help='Previous JSON results to compare against')
+        parser.add_argument('--seed-only', action='store_true', help='Seed the data set and exit')
+        parser.add_argument('--cleanup', action='store_true', help='Delete the synthetic data and exit')
+        parser.add_argument('--database-name',
+                            help='Name of the configured database, required to run against anything but SQLite')
+
+    def handle(self, *args, **options):
+        self._check_database(options['database_name'])
+        log = self.stdout.write
+        if options['cleanup']:
+            counts = bench_data.cleanup(options['batch_size'], log=log)
+            self.stdout.write(self.style.SUCCESS(f"Deleted {sum(counts.values())} rows"))
+            return
+
+        if not bench_data.seeded_users().exists():
+            self.stdout.write("Seeding benchmark data...")
+            started = time.perf_counter()
+            bench_data.generate(
+                seed=options['seed'], users=options['users'], mean_friends=options['mean_friends'],
+                groups=options['groups'], group_size=options['group_size'],
+                direct_messages=options['direct_messages'], group_messages=options['group_messages'],
+                expenses=options['expenses'], batch_size=options['batch_size'],
+                log=lambda message: log(f"  {message}")
+            )
+            self.stdout.write(f"Seeded in {time.perf_counter() - started:.1f} s")
+        if options['seed_only']:
+            return
+
+        # Files never leave the process; Cognito is never called, see _token
+        storage_service.set_storage_service(storage_service.InMemoryStorageService())
+        contexts = self._contexts(random.Random(options['seed']), options['sample_users'])
+        client = Client()
+        results = {}
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], QUERY_BUDGET_RAISE=False):
+            for name in options['endpoint'] or ENDPOINTS:
+                results[name] = self._run(client, name, contexts, options['warmup'], options['requests'])
+
+        report = {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'commit': self._commit(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'data': {key: options[key] for key in (
+                'seed', 'users', 'mean_friends', 'groups', 'group_size',
+                'direct_messages', 'group_messages', 'expenses'
+            )},
+            'requests': options['requests'],
+            'endpoints': results,
+        }
+        self._print(results, self._load(options['compare']))
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def _check_database(self, confirmed_name):
+        """Refuse to seed, time or clean up a server database nobody named explicitly"""
+        if connection.vendor == 'sqlite':
+            return
+        name = connection.settings_dict['NAME']
+        if confirmed_name != name:
+            raise CommandError(
+                f"Refusing to write benchmark data to the {connection.vendor} database {name!r}. "
+                f"Point the settings at a local or benchmark database and pass --database-name {name}."
+            )
+
+    def _contexts(self, rng, count):
+        """Request parameters for the busiest seeded users: token, a chat partner, a group and a search term"""
+        users = list(
+            bench_data.seeded_users()
+            .annotate(sent=Count('sent_direct_messages'))
+            .order_by('-sent', 'id')
+            .values('id', 'cognito_id', 'name', 'email')[:count]
+        )
+        contexts = []
+        for user in users:
+            partner_id = (
+                DirectMessage.objects.filter(sender_id=user['id'])
+                .values_list('recipient_id', flat=True).first()
+            )
+            group_id = GroupMember.objects.filter(user_id=user['id']).values_list('group_id', flat=True).first()
+            name = rng.choice(users)['name']
+            contexts.append({
+                'token': _token(user),
+                'partner_id': partner_id or user['id'],
+                'group_id': group_id or '',
+                'search_term': name[:rng.randint(2, 5)],
+            })
+        return contexts
+
+    def _run(self, client, name, contexts, warmup, requests):
+        method, url_name, payload = ENDPOINTS[name]
+        url = reverse(url_name)
+        send = getattr(client, method)
+        kwargs = {} if method == 'get' else {'content_type': 'application/json'}
+
+        def request(ctx):
+            data = payload(ctx)
+            return send(url, data if method == 'get' else json.dumps(data), **kwargs)
+
+        for index in range(warmup):
+            request(contexts[index % len(contexts)])
+
+        latencies, queries, db_times, statuses = [], [], [], {}
+        for index in range(requests):
+            ctx = contexts[index % len(contexts)]
+            with query_budget.count_queries() as counter:
+                started = time.perf_counter()
+                response = request(ctx)
+                latencies.append((time.perf_counter() - started) * 1000)
+            queries.append(counter.count)
+            db_times.append(counter.duration * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        latencies.sort()
+        return {
+            'p50_ms': round(statistics.median(latencies), 3),
+            'p95_ms': round(_percentile(latencies, 0.95), 3),
+            'p99_ms': round(_percentile(latencies, 0.99), 3),
+            'mean_ms': round(statistics.fmean(latencies), 3),
+            'queries_mean': round(statistics.fmean(queries), 2),
+            'queries_max': max(queries),
+            'db_ms_mean': round(statistics.fmean(db_times), 3),
+            'statuses': {str(code): count for code, count in sorted(statuses.items())},
+        }
+
+    def _print(self, results, baseline):
+        self.stdout.write("endpoint              p50 ms   p95 ms   p99 ms  queries  db ms   vs baseline")
+        for name, result in results.items():
+            line = (
+                f"{name:<20} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f} "
+                f"{result['queries_mean']:>8.1f} {result['db_ms_mean']:>6.2f}"
+            )
+            previous = baseline.get(name)
+            if previous:
+                line += (
+                    f"   p50 x{result['p50_ms'] / max(previous['p50_ms'], 0.001):.2f}, "
+                    f"queries {result['queries_mean'] - previous['queries_mean']:+.1f}"
+                )
+            if set(result['statuses']) != {'200'}:
+                line += f"   statuses {result['statuses']}"
+            self.stdout.write(line)
+
+    def _load(self, path):
+        if not path:
+            return {}
+        with open(path) as f:
+            return json.load(f)['endpoints']
+
+    def _commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,86 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cliquepay import bench_data, fx, group_summary
+from cliquepay.models import Expense, FxRate
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed one group with many expenses and time group_summary.build_summary "
+        "with the summary cached in Redis (warm) and aggregated from the database "
+        "(cold). Latencies are reported per 10k expenses against --target-ms."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--expenses', type=int, default=10000)
+        parser.add_argument('--members', type=int, default=8)
+        parser.add_argument('--days', type=int, default=365,
+                            help='Expenses are spread over this many past days')
+        parser.add_argument('--currencies', default='USD',
+                            help='Comma separated expense currencies; rates are loaded from the fixture if missing')
+        parser.add_argument('--currency', default='USD', help='Currency of the summary')
+        parser.add_argument('--rounds', type=int, default=50)
+        parser.add_argument('--target-ms', type=float, default=10.0,
+                            help='Warm latency budget per 10k expenses')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--cleanup', action='store_true',
+                            help='Delete every seeded row and exit')
+
+    def handle(self, *args, **options):
+        if options['cleanup']:
+            counts = bench_data.cleanup(log=self.stdout.write)
+            self.stdout.write(self.style.SUCCESS(f"Deleted {sum(counts.values())} rows"))
+            return
+
+        currencies = tuple(code.strip().upper() for code in options['currencies'].split(',') if code.strip())
+        foreign = set(currencies) - {fx.base_currency()}
+        if foreign and FxRate.objects.filter(quote__in=foreign).values('quote').distinct().count() < len(foreign):
+            fx.load_fixture()
+
+        group_id = bench_data.generate_group(
+            seed=options['seed'], members=options['members'], expenses=options['expenses'],
+            days=options['days'], currencies=currencies, batch_size=options['batch_size'], log=self.stdout.write
+        )
+        expenses = Expense.objects.filter(group_id=group_id).count()
+        if not expenses:
+            raise CommandError(f"Group {group_id} has no expenses")
+
+        # Cold: every call drops the cached rows and summaries first, so it aggregates again
+        cold = []
+        for _ in range(max(1, options['rounds'] // 10)):
+            group_summary._drop_now({group_id})
+            started = time.perf_counter()
+            group_summary.build_summary(group_id, options['currency'])
+            cold.append((time.perf_counter() - started) * 1000)
+
+        group_summary.build_summary(group_id, options['currency'])
+        warm = []
+        for _ in range(options['rounds']):
+            started = time.perf_counter()
+            summary = group_summary.build_summary(group_id, options['currency'])
+            warm.append((time.perf_counter() - started) * 1000)
+
+        rows = len(group_summary.get_rows(group_id))
+        scale = 10000 / expenses
+        self.stdout.write(
+            f"{expenses} expenses, {len(summary['members'])} members, {rows} cached rows, "
+            f"currencies {','.join(currencies)} -> {options['currency']}"
+        )
+        self.stdout.write("         median ms     p95 ms   per 10k expenses")
+        for name, samples in (('cold', cold), ('warm', warm)):
+            samples.sort()
+            p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+            median = statistics.median(samples)
+            self.stdout.write(f"{name:<6} {median:>11.2f} {p95:>10.2f} {median * scale:>18.2f}")
+
+        per_10k = statistics.median(warm) * scale
+        if per_10k <= options['target_ms']:
+            self.stdout.write(self.style.SUCCESS(f"Warm summary within {options['target_ms']} ms per 10k expenses"))
+        else:
+            self.stdout.write(self.style.ERROR(
+                f"Warm summary takes {per_10k:.2f} ms per 10k expenses, over {options['target_ms']} ms"
+            ))
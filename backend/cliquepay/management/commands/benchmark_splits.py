@@ -0,0 +1,60 @@
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from cliquepay import split_allocator
+
+
+class Command(BaseCommand):
+    help = (
+        "Time split_allocator.allocate for every split mode on a large member "
+        "vector and check that each allocation adds up to the total."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, default=10000)
+        parser.add_argument('--rounds', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        members = [f'user-{index}' for index in range(options['members'])]
+        total = Decimal(rng.randint(100, 10 ** 9)) / 100
+
+        exact_cents = split_allocator.allocate_cents(
+            split_allocator.to_cents(total), [rng.randint(1, 100) for _ in members]
+        )
+        cases = {
+            'equal': {},
+            'exact': {'values': {
+                user_id: split_allocator.from_cents(cents) for user_id, cents in zip(members, exact_cents)
+            }},
+            'percentage': {'values': dict(zip(
+                members, split_allocator.rescale([Decimal(1)] * len(members), Decimal(100))
+            ))},
+            'shares': {'values': {user_id: rng.randint(1, 5) for user_id in members}},
+            'itemized': {'items': [
+                {'amount': Decimal(rng.randint(1, 5000)) / 100, 'user_ids': rng.sample(members, 3)}
+                for _ in range(len(members) // 10)
+            ]},
+        }
+
+        backend = 'numpy' if split_allocator.np is not None else 'python'
+        self.stdout.write(f"{len(members)} members, total {total}, backend {backend}")
+        for mode, kwargs in cases.items():
+            if mode == 'itemized':
+                total_for_mode = sum(item['amount'] for item in kwargs['items']) + Decimal('12.34')
+            else:
+                total_for_mode = total
+
+            started = time.perf_counter()
+            for _ in range(options['rounds']):
+                shares = split_allocator.allocate(total_for_mode, members, mode, **kwargs)
+            elapsed = (time.perf_counter() - started) / options['rounds']
+
+            if sum(shares.values()) != total_for_mode:
+                self.stdout.write(self.style.ERROR(f"{mode}: shares do not add up to {total_for_mode}"))
+                continue
+            self.stdout.write(f"{mode:<11} {elapsed * 1000:8.2f} ms")
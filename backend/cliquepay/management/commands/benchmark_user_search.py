@@ -0,0 +1,81 @@
+import random
+import statistics
+import string
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from cliquepay import user_search
+from cliquepay.models import User
+
+SEED_DOMAIN = 'bench.cliquepay.invalid'
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed synthetic users and report per-keystroke search latency "
+        "(p50/p95/p99 by prefix length) for user_search.search_queryset."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1_000_000,
+                            help='Synthetic users to have in the table')
+        parser.add_argument('--queries', type=int, default=200,
+                            help='Search terms to type, one keystroke at a time')
+        parser.add_argument('--limit', type=int, default=15)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--cleanup', action='store_true',
+                            help='Delete the synthetic users and exit')
+
+    def handle(self, *args, **options):
+        seeded = User.objects.filter(email__endswith=f'@{SEED_DOMAIN}')
+        if options['cleanup']:
+            deleted, _ = seeded.delete()
+            self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} rows"))
+            return
+
+        rng = random.Random(options['seed'])
+        missing = options['users'] - seeded.count()
+        if missing > 0:
+            self._seed(rng, missing, options['batch_size'])
+
+        names = list(seeded.order_by('?').values_list('name', flat=True)[:options['queries']])
+        timings = {}
+        for name in names:
+            for length in range(1, min(len(name), 8) + 1):
+                started = time.perf_counter()
+                list(user_search.search_queryset(name[:length])[:options['limit']].values_list('id', flat=True))
+                timings.setdefault(length, []).append((time.perf_counter() - started) * 1000)
+
+        self.stdout.write("chars  queries     p50 ms     p95 ms     p99 ms")
+        for length, samples in sorted(timings.items()):
+            samples.sort()
+            p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+            p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+            self.stdout.write(
+                f"{length:>5}  {len(samples):>7}  {statistics.median(samples):>9.2f}  {p95:>9.2f}  {p99:>9.2f}"
+            )
+
+    def _seed(self, rng, count, batch_size):
+        self.stdout.write(f"Seeding {count} users...")
+        syllables = ['ka', 'ri', 'to', 'mo', 'an', 'el', 'sa', 'lu', 'ne', 'vi', 'or', 'da', 'jo', 'mi']
+        created = 0
+        while created < count:
+            batch = []
+            for _ in range(min(batch_size, count - created)):
+                first = ''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4))).capitalize()
+                last = ''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4))).capitalize()
+                suffix = ''.join(rng.choice(string.digits) for _ in range(4))
+                username = f"{first.lower()}{last.lower()}{suffix}"
+                batch.append(User(
+                    id=str(uuid.uuid4()),
+                    cognito_id=str(uuid.uuid4()),
+                    name=f"{username}_{uuid.uuid4().hex[:6]}",
+                    full_name=f"{first} {last}",
+                    email=f"{username}.{uuid.uuid4().hex[:8]}@{SEED_DOMAIN}",
+                ))
+            User.objects.bulk_create(batch, batch_size=batch_size)
+            created += len(batch)
+            self.stdout.write(f"  {created}/{count}")
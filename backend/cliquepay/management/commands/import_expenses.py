@@ -0,0 +1,46 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cliquepay.expense_import import DEFAULT_CHUNK_SIZE, import_expenses, iter_rows
+
+
+class Command(BaseCommand):
+    help = "Import expenses from a CSV or NDJSON file (use - for stdin)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, or - to read stdin')
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help='Defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format']
+        if not file_format:
+            if path.endswith('.csv'):
+                file_format = 'csv'
+            elif path.endswith(('.ndjson', '.jsonl')):
+                file_format = 'ndjson'
+            else:
+                raise CommandError('Could not infer the format, pass --format')
+
+        def report(summary):
+            self.stdout.write(
+                f"processed {summary['processed']} rows, "
+                f"created {summary['created']}, failed {summary['failed']}"
+            )
+
+        if path == '-':
+            summary = import_expenses(iter_rows(sys.stdin, file_format),
+                                      chunk_size=options['chunk_size'], progress=report)
+        else:
+            with open(path, 'rb') as stream:
+                summary = import_expenses(iter_rows(stream, file_format),
+                                          chunk_size=options['chunk_size'], progress=report)
+
+        for error in summary['errors']:
+            self.stderr.write(f"row {error['row']}: {'; '.join(error['errors'])}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {summary['created']} expenses created, {summary['failed']} rows rejected"
+        ))
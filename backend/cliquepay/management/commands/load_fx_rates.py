@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cliquepay import fx
+
+
+class Command(BaseCommand):
+    help = (
+        "Load exchange rates into the FxRate table from a JSON file, "
+        "the bundled offline fixture by default."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=None,
+                            help='Rates file, defaults to cliquepay/fixtures/fx_rates.json')
+
+    def handle(self, *args, **options):
+        try:
+            loaded = fx.load_fixture(options['path'])
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f"Could not load rates: {e}")
+        self.stdout.write(self.style.SUCCESS(f"Loaded {loaded} exchange rates"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from cliquepay import autocomplete
+
+
+class Command(BaseCommand):
+    help = "Rebuild the Redis autocomplete index of usernames and full names from the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        indexed = autocomplete.rebuild(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} users"))
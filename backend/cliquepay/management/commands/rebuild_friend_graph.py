@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from cliquepay import friend_graph
+
+
+class Command(BaseCommand):
+    help = "Rebuild the Redis friend graph adjacency sets from the friendships table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        written = friend_graph.rebuild(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Loaded {written} friendships"))
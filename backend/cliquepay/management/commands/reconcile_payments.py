@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from cliquepay.db_service import DatabaseService
+from cliquepay.models import PaymentAllocation
+
+
+class Command(BaseCommand):
+    help = (
+        "Check split and expense balances against the payment ledger, "
+        "streaming only the allocations written after --since."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=int, default=0,
+                            help='Last allocation id already reconciled')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        cursor = options['since']
+        chunk_size = options['chunk_size']
+        mismatches = 0
+
+        while True:
+            chunk = list(
+                PaymentAllocation.objects.filter(id__gt=cursor)
+                .order_by('id')
+                .values_list('id', 'split_id')[:chunk_size]
+            )
+            if not chunk:
+                break
+
+            cursor = chunk[-1][0]
+            split_ids = {split_id for _, split_id in chunk if split_id}
+            for mismatch in DatabaseService.check_split_balances(split_ids):
+                mismatches += 1
+                self.stdout.write(
+                    f"{mismatch['type']} {mismatch['id']}: "
+                    f"stored {mismatch['stored']} expected {mismatch['expected']}"
+                )
+
+        style = self.style.SUCCESS if not mismatches else self.style.WARNING
+        self.stdout.write(style(f"Reconciled up to allocation {cursor}, {mismatches} mismatches"))
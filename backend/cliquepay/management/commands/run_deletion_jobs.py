@@ -0,0 +1,39 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from cliquepay import deletion_jobs
+from cliquepay.models import DeletionJob
+
+
+class Command(BaseCommand):
+    help = (
+        "Run pending and failed group / account deletion jobs, resuming each "
+        "from its last completed chunk. Run it from cron to recover jobs "
+        "interrupted by a restart."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=None)
+        parser.add_argument('--stalled-minutes', type=int, default=15,
+                            help='Resume running jobs without progress for this long')
+
+    def handle(self, *args, **options):
+        released = deletion_jobs.release_stalled(timedelta(minutes=options['stalled_minutes']))
+        if released:
+            self.stdout.write(f"Resuming {released} stalled jobs")
+
+        job_ids = list(
+            DeletionJob.objects.filter(status__in=('pending', 'failed'))
+            .order_by('created_at').values_list('id', flat=True)
+        )
+        failed = 0
+        for job_id in job_ids:
+            job = deletion_jobs.run(job_id, chunk_size=options['chunk_size'])
+            if job is None:
+                continue
+            self.stdout.write(f"{job.kind} {job.target_id}: {job.status} {job.progress}")
+            failed += job.status == 'failed'
+
+        style = self.style.SUCCESS if not failed else self.style.WARNING
+        self.stdout.write(style(f"Ran {len(job_ids)} jobs, {failed} failed"))
@@ -0,0 +1,31 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from cliquepay.recurring import DEFAULT_BATCH_SIZE, materialize_due, run_scheduler
+
+
+class Command(BaseCommand):
+    help = (
+        "Materialize due recurring expenses. Runs forever by default and is "
+        "safe to start on several nodes at once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Process the currently due rules and exit')
+        parser.add_argument('--interval', type=int, default=60,
+                            help='Seconds between runs')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options['once']:
+            created = materialize_due(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f"Created {created} expenses"))
+            return
+
+        self.stdout.write(f"Recurring expense scheduler running every {options['interval']}s")
+        try:
+            asyncio.run(run_scheduler(options['interval'], options['batch_size']))
+        except KeyboardInterrupt:
+            pass
@@ -4,10 +4,15 @@ Redis-based message broker for SSE events
 
 import asyncio
 import json
+import logging
 import redis.asyncio as redis
 from datetime import datetime
 import os
 
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
 class RedisMessageBroker:
     """Redis-based broker to handle message dispatch across processes"""
     _instance = None
@@ -32,9 +37,9 @@ class RedisMessageBroker:
                     decode_responses=True
                 )
                 self.initialized = True
-                print(f"Redis message broker initialized with host: {redis_host}:{redis_port}")
-            except Exception as e:
-                print(f"Redis connection error: {e}")
+                logger.info("Redis message broker initialized with host: %s:%s", redis_host, redis_port)
+            except Exception:
+                logger.exception("Redis connection error")
                 # Fallback to in-memory queue system
                 self.initialized = False
     
@@ -44,19 +49,14 @@ class RedisMessageBroker:
         
         # Start a background task to listen for messages from Redis
         asyncio.create_task(self._listener(channel, queue))
-        print(f"BROKER: Subscribed to Redis channel '{channel}'")
+        logger.debug("Subscribed to Redis channel %s", channel)
         return queue
     
     async def unsubscribe(self, channel, queue):
         """Unsubscribe a queue from a channel"""
-        print(f"BROKER: Unsubscribing from Redis channel '{channel}'")
-        try:
-            # We don't need to do anything with Redis here since the listener task
-            # will automatically terminate when the queue is garbage collected
-            # Just print a log message for debugging
-            print(f"Queue unsubscribed from channel {channel}")
-        except Exception as e:
-            print(f"Error unsubscribing from channel {channel}: {e}")
+        # We don't need to do anything with Redis here since the listener task
+        # will automatically terminate when the queue is garbage collected
+        logger.debug("Queue unsubscribed from Redis channel %s", channel)
     
     async def _listener(self, channel, queue):
         """Background task that listens for Redis messages and forwards to queue"""
@@ -64,7 +64,7 @@ class RedisMessageBroker:
             # Create a new connection for the pubsub client
             pubsub = self.redis.pubsub()
             await pubsub.subscribe(channel)
-            print(f"Listener started for channel {channel}")
+            logger.debug("Listener started for channel %s", channel)
             
             while True:
                 message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
@@ -73,13 +73,13 @@ class RedisMessageBroker:
                     try:
                         data = json.loads(message["data"])
                         await queue.put(data)
-                        print(f"Message from Redis forwarded to queue for channel {channel}")
+                        metrics.inc('cliquepay_broker_messages_total', operation='receive')
                     except json.JSONDecodeError:
-                        print(f"Invalid JSON in Redis message: {message['data']}")
+                        logger.warning("Invalid JSON in Redis message on channel %s", channel)
                 # Small sleep to avoid tight loop
                 await asyncio.sleep(0.01)
-        except Exception as e:
-            print(f"Redis listener error: {e}")
+        except Exception:
+            logger.exception("Redis listener error on channel %s", channel)
     
     async def publish(self, channel, message):
         """Publish a message to all subscribers of a channel"""
@@ -89,8 +89,22 @@ class RedisMessageBroker:
         message_json = json.dumps(message)
         
         # Publish to Redis channel
-        await self.redis.publish(channel, message_json)
-        print(f"BROKER: Published to Redis channel '{channel}'")
+        with metrics.timer('cliquepay_broker_publish_seconds', operation='publish'):
+            await self.redis.publish(channel, message_json)
+        metrics.inc('cliquepay_broker_messages_total', operation='publish')
+
+    async def publish_many(self, messages):
+        """Publish (channel, message) pairs in a single Redis pipeline"""
+        if not messages:
+            return
+        await self.initialize()
+
+        with metrics.timer('cliquepay_broker_publish_seconds', operation='publish_many'):
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for channel, message in messages:
+                    pipe.publish(channel, json.dumps(message))
+                await pipe.execute()
+        metrics.inc('cliquepay_broker_messages_total', len(messages), operation='publish_many')
     
     def get_queue(self, channel):
         """Get a new queue and subscribe it to a channel"""
@@ -0,0 +1,137 @@
+"""
+In-process counters and latency histograms, exported in the Prometheus
+text format by api.views.metrics.
+
+    metrics.inc('cliquepay_broker_messages_total', 3, operation='publish_many')
+    with metrics.timer('cliquepay_cognito_call_seconds', operation='initiate_auth'):
+        ...
+
+Series are keyed by metric name and label values and live in the memory of
+one process; with several workers Prometheus scrapes each one. Recording is
+a dict update under a lock, cheap enough for every query and SSE event.
+Database queries are timed by a wrapper installed on each new connection
+(see instrument_connection), so every ORM call is covered without touching
+DatabaseService.
+"""
+
+import bisect
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Upper bounds in seconds, from a cached lookup to a slow Cognito round trip
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+HELP = {
+    'cliquepay_db_query_seconds': 'Database query latency by statement type',
+    'cliquepay_broker_publish_seconds': 'Redis broker publish latency',
+    'cliquepay_broker_messages_total': 'Messages published to or received from the Redis broker',
+    'cliquepay_cognito_call_seconds': 'Cognito API call latency by operation',
+    'cliquepay_cognito_errors_total': 'Cognito API calls that raised',
+    'cliquepay_sse_send_seconds': 'Time to write one SSE event to the client',
+    'cliquepay_sse_events_total': 'SSE events sent by event type',
+    'cliquepay_sse_connections': 'Open SSE connections',
+}
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_gauges = defaultdict(float)
+# (name, labels) -> [bucket counts..., +Inf count, sum]
+_histograms = {}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, amount=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] += amount
+
+
+def gauge_add(name, amount, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] += amount
+
+
+def observe(name, seconds, **labels):
+    key = _key(name, labels)
+    index = bisect.bisect_left(BUCKETS, seconds)
+    with _lock:
+        series = _histograms.get(key)
+        if series is None:
+            series = _histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+        series[index] += 1
+        series[-1] += seconds
+
+
+@contextmanager
+def timer(name, **labels):
+    """Observe the duration of the block, including blocks that raise"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def _statement_type(sql):
+    return sql.lstrip().split(None, 1)[0].upper() if sql.strip() else 'OTHER'
+
+
+def _time_query(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        observe('cliquepay_db_query_seconds', time.perf_counter() - start,
+                statement=_statement_type(sql), alias=context['connection'].alias)
+
+
+def instrument_connection(sender, connection, **kwargs):
+    """connection_created receiver timing every query of the new connection"""
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+def _labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ''
+    escaped = (
+        (key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in pairs
+    )
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+def render():
+    """Every series in the Prometheus text exposition format"""
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        histograms = {key: list(series) for key, series in _histograms.items()}
+
+    lines = []
+    for kind, series in (('counter', counters), ('gauge', gauges), ('histogram', histograms)):
+        by_name = defaultdict(list)
+        for (name, labels), value in series.items():
+            by_name[name].append((labels, value))
+        for name in sorted(by_name):
+            if name in HELP:
+                lines.append(f'# HELP {name} {HELP[name]}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in sorted(by_name[name]):
+                if kind != 'histogram':
+                    lines.append(f'{name}{_labels(labels)} {value}')
+                    continue
+                cumulative = 0
+                for bound, count in zip((*BUCKETS, '+Inf'), value[:-1]):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels(labels, [("le", bound)])} {cumulative}')
+                lines.append(f'{name}_sum{_labels(labels)} {value[-1]}')
+                lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
@@ -1,8 +1,11 @@
+import logging
 from channels.db import database_sync_to_async
 from channels.middleware import BaseMiddleware
 from cliquepay.models import User
 from cliquepay.aws_cognito import CognitoService
 
+logger = logging.getLogger(__name__)
+
 class TokenAuthMiddleware(BaseMiddleware):
     async def __call__(self, scope, receive, send):
         # Get raw headers as list of tuples
@@ -80,7 +83,7 @@ class TokenAuthMiddleware(BaseMiddleware):
             if result['status'] == 'SUCCESS':
                 return User.objects.get(cognito_id=result['user_sub'])
         except Exception as e:
-            print(f"Error authenticating: {e}")
+            logger.info("Error authenticating SSE connection: %s", e)
             return None
     
     async def unauthorized_response(self, send):
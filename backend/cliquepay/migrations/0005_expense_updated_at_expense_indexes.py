@@ -0,0 +1,28 @@
+# Generated by Django 5.1.5 on 2026-10-19 11:20
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cliquepay', '0004_payment_paymentallocation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expense',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['paid_by', 'created_at'], name='expense_payer_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['updated_at'], name='expense_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.1.5 on 2026-10-19 14:10
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def currency_from_payer(apps, schema_editor):
+    # Amounts were entered in the payer's currency before expenses had one
+    User = apps.get_model('cliquepay', 'User')
+    payer_currency = Subquery(User.objects.filter(id=OuterRef('paid_by_id')).values('currency')[:1])
+    for model_name in ('Expense', 'RecurringExpense'):
+        apps.get_model('cliquepay', model_name).objects.update(currency=payer_currency)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cliquepay', '0006_recurringexpense'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expense',
+            name='currency',
+            field=models.CharField(default='USD', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='recurringexpense',
+            name='currency',
+            field=models.CharField(default='USD', max_length=10),
+        ),
+        migrations.RunPython(currency_from_payer, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='FxRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base', models.CharField(max_length=10)),
+                ('quote', models.CharField(max_length=10)),
+                ('date', models.DateField()),
+                ('rate', models.DecimalField(decimal_places=10, max_digits=20)),
+                ('source', models.CharField(default='fixture', max_length=50)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'fx_rates',
+                'unique_together': {('base', 'quote', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-19 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cliquepay', '0007_expense_currency_fxrate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expense',
+            name='receipt_thumbnail_url',
+            field=models.URLField(blank=True, null=True),
+        ),
+    ]
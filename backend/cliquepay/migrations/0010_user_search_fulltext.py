@@ -0,0 +1,27 @@
+# Generated by Django 5.1.5 on 2026-10-19 16:20
+
+from django.db import migrations
+
+
+def create_fulltext_index(apps, schema_editor):
+    # FULLTEXT with the ngram parser is MySQL specific, other backends search with LIKE
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute(
+            'CREATE FULLTEXT INDEX user_search_ft ON users (name, full_name, email) WITH PARSER ngram'
+        )
+
+
+def drop_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('DROP INDEX user_search_ft ON users')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cliquepay', '0009_user_avatar_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
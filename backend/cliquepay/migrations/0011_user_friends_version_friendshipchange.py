@@ -0,0 +1,32 @@
+# Generated by Django 5.1.5 on 2026-10-19 17:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cliquepay', '0010_user_search_fulltext'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='friends_version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='FriendshipChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField()),
+                ('friendship_id', models.CharField(max_length=128)),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='friendship_changes', to='cliquepay.user')),
+            ],
+            options={
+                'db_table': 'friendship_changes',
+                'constraints': [models.UniqueConstraint(fields=('user', 'version'), name='unique_friendship_change')],
+            },
+        ),
+    ]
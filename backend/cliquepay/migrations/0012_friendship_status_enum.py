@@ -0,0 +1,56 @@
+# Generated by Django 5.1.5 on 2026-10-19 17:30
+
+from django.db import migrations, models
+
+STATUS_CODES = {'PENDING': 0, 'ACCEPTED': 1, 'BLOCKED': 2}
+
+
+def status_to_code(apps, schema_editor):
+    # Rows were written both as 'ACCEPTED' and as 'accepted'
+    Friendship = apps.get_model('cliquepay', 'Friendship')
+    for label, code in STATUS_CODES.items():
+        Friendship.objects.filter(status__iexact=label).update(status_code=code)
+
+
+def code_to_status(apps, schema_editor):
+    Friendship = apps.get_model('cliquepay', 'Friendship')
+    for label, code in STATUS_CODES.items():
+        Friendship.objects.filter(status_code=code).update(status=label)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cliquepay', '0011_user_friends_version_friendshipchange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='friendship',
+            name='status_code',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(status_to_code, code_to_status),
+        migrations.RemoveField(
+            model_name='friendship',
+            name='status',
+        ),
+        migrations.RenameField(
+            model_name='friendship',
+            old_name='status_code',
+            new_name='status',
+        ),
+        migrations.AlterField(
+            model_name='friendship',
+            name='status',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'PENDING'), (1, 'ACCEPTED'), (2, 'BLOCKED')], default=0),
+        ),
+        migrations.AddIndex(
+            model_name='friendship',
+            index=models.Index(fields=['user1', 'status'], name='friendship_user1_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='friendship',
+            index=models.Index(fields=['user2', 'status'], name='friendship_user2_status_idx'),
+        ),
+    ]
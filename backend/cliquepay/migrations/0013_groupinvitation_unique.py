@@ -0,0 +1,34 @@
+# Generated by Django 5.1.5 on 2026-10-19 17:55
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def remove_duplicate_invitations(apps, schema_editor):
+    # Keep the oldest invitation of each user to each group
+    GroupInvitation = apps.get_model('cliquepay', 'GroupInvitation')
+    duplicates = (
+        GroupInvitation.objects.values('group_id', 'invited_user_id')
+        .annotate(count=Count('id')).filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        invitations = GroupInvitation.objects.filter(
+            group_id=duplicate['group_id'], invited_user_id=duplicate['invited_user_id']
+        ).order_by('created_at', 'id')
+        keep = invitations.values_list('id', flat=True).first()
+        invitations.exclude(id=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cliquepay', '0012_friendship_status_enum'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_invitations, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='groupinvitation',
+            constraint=models.UniqueConstraint(fields=('group', 'invited_user'), name='unique_group_invitation'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.5 on 2026-10-19 18:20
+
+import uuid
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cliquepay', '0013_groupinvitation_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletionJob',
+            fields=[
+                ('id', models.CharField(default=uuid.uuid4, max_length=128, primary_key=True, serialize=False, unique=True)),
+                ('kind', models.CharField(choices=[('group', 'Group'), ('user', 'User')], max_length=10)),
+                ('target_id', models.CharField(max_length=128)),
+                ('requested_by', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('step', models.PositiveSmallIntegerField(default=0)),
+                ('progress', models.JSONField(blank=True, default=dict)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'deletion_jobs',
+                'indexes': [models.Index(fields=['kind', 'target_id'], name='deletion_job_target_idx'), models.Index(fields=['status', 'updated_at'], name='deletion_job_status_idx')],
+            },
+        ),
+    ]
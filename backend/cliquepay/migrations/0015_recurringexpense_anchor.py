@@ -0,0 +1,36 @@
+# Generated by Django 5.1.5 on 2026-10-19 18:45
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def anchor_at_next_run(apps, schema_editor):
+    # Earlier runs may have drifted, the next run is the best anchor left
+    RecurringExpense = apps.get_model('cliquepay', 'RecurringExpense')
+    RecurringExpense.objects.update(start_at=F('next_run_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cliquepay', '0014_deletionjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recurringexpense',
+            name='start_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='recurringexpense',
+            name='run_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(anchor_at_next_run, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='recurringexpense',
+            name='start_at',
+            field=models.DateTimeField(),
+        ),
+    ]
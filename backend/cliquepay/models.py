@@ -1,7 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import RegexValidator
+from django.core.serializers.json import DjangoJSONEncoder
 import uuid 
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from asgiref.sync import async_to_sync
 import asyncio
@@ -32,10 +33,17 @@ class User(models.Model):
         default='https://storage.cloud.google.com/cliquepay_profile_photo_bucket/Default_pfp.jpg',
         blank=True
     )
+    # Resized WebP copies of avatar_url keyed by width in px, e.g. {"64": url}
+    avatar_variants = models.JSONField(default=dict, blank=True)
     currency = models.CharField(max_length=10, default='USD')
+    # Bumped on every change to one of the user's friendships
+    friends_version = models.PositiveBigIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Variant used wherever the avatar is shown as a small icon in a list
+    LIST_AVATAR_SIZE = 64
+
     class Meta:
         db_table = 'users'
         indexes = [
@@ -46,18 +54,47 @@ class User(models.Model):
 
     def __str__(self):
         return f"{self.full_name} ({self.email})"
+
+    def avatar_url_for(self, size):
+        """Smallest avatar variant at least `size` px wide, the original otherwise"""
+        for width in sorted(int(width) for width in self.avatar_variants or {}):
+            if width >= size:
+                return self.avatar_variants[str(width)]
+        return self.avatar_url
+
+    @property
+    def list_avatar_url(self):
+        return self.avatar_url_for(self.LIST_AVATAR_SIZE)
     
+@receiver(post_save, sender=User)
+def index_user_for_autocomplete(sender, instance, update_fields=None, **kwargs):
+    """Keep the autocomplete index in sync with username and full name"""
+    if update_fields is not None and not {'name', 'full_name'} & set(update_fields):
+        return
+    from .autocomplete import index_user
+    user_id, name, full_name = instance.id, instance.name, instance.full_name
+    transaction.on_commit(lambda: index_user(user_id, name, full_name))
+
+@receiver(post_delete, sender=User)
+def remove_user_from_autocomplete(sender, instance, **kwargs):
+    from .autocomplete import remove_user
+    user_id = instance.id
+    transaction.on_commit(lambda: remove_user(user_id))
+
 class Friendship(models.Model):
+    PENDING = 0
+    ACCEPTED = 1
+    BLOCKED = 2
     STATUS_CHOICES = [
-        ('pending', 'Pending'),
-        ('accepted', 'Accepted'),
-        ('blocked', 'Blocked'),
+        (PENDING, 'PENDING'),
+        (ACCEPTED, 'ACCEPTED'),
+        (BLOCKED, 'BLOCKED'),
     ]
     
     id = models.CharField(max_length=128, primary_key=True, default=uuid.uuid4, unique=True)
     user1 = models.ForeignKey(User, on_delete=models.CASCADE, related_name='user1_friendships')
     user2 = models.ForeignKey(User, on_delete=models.CASCADE, related_name='user2_friendships')
-    status = models.CharField(max_length=8, choices=STATUS_CHOICES, default='pending')
+    status = models.PositiveSmallIntegerField(choices=STATUS_CHOICES, default=PENDING)
     created_at = models.DateTimeField(auto_now_add=True)
     action_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='friendship_actions')
 
@@ -73,6 +110,69 @@ class Friendship(models.Model):
                 name='force_user_order'
             )
         ]
+        indexes = [
+            models.Index(fields=['user1', 'status'], name='friendship_user1_status_idx'),
+            models.Index(fields=['user2', 'status'], name='friendship_user2_status_idx'),
+        ]
+
+    @classmethod
+    def ordered(cls, user_a_id, user_b_id):
+        """The (user1_id, user2_id) pair a friendship between two users is stored as"""
+        return (user_a_id, user_b_id) if user_a_id < user_b_id else (user_b_id, user_a_id)
+
+    @classmethod
+    def between(cls, user_a_id, user_b_id):
+        """Friendship between two users, a single lookup on the unique (user1, user2) index"""
+        user1_id, user2_id = cls.ordered(user_a_id, user_b_id)
+        return cls.objects.filter(user1_id=user1_id, user2_id=user2_id)
+
+    @classmethod
+    def of_user(cls, user_id, fields, status=None, extra=None):
+        """
+        values_list of `fields` for the friendships of one user, as a union
+        of the user1 and user2 sides so each side is served by its
+        (user, status) index instead of an OR across both columns.
+        `extra` is an optional Q applied to both sides.
+        """
+        sides = [cls.objects.filter(user1_id=user_id), cls.objects.filter(user2_id=user_id)]
+        if status is not None:
+            sides = [side.filter(status=status) for side in sides]
+        if extra is not None:
+            sides = [side.filter(extra) for side in sides]
+        sides = [side.values_list(*fields) for side in sides]
+        return sides[0].union(sides[1], all=True)
+
+class FriendshipChange(models.Model):
+    """
+    One row per user per friendship change, numbered with the user's
+    friends_version so clients can fetch only what changed since a version.
+    No FK constraint: rows written while a user is deleted must not block it.
+    """
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False,
+                             related_name='friendship_changes')
+    version = models.PositiveBigIntegerField()
+    friendship_id = models.CharField(max_length=128)
+
+    class Meta:
+        db_table = 'friendship_changes'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'version'], name='unique_friendship_change')
+        ]
+
+@receiver(post_save, sender=Friendship)
+def friendship_saved(sender, instance, **kwargs):
+    """Keep the cached friend graph and the friends versions in sync"""
+    from .friend_graph import record_change
+    from .friend_versions import bump
+    record_change(instance)
+    bump(instance)
+
+@receiver(post_delete, sender=Friendship)
+def friendship_deleted(sender, instance, **kwargs):
+    from .friend_graph import record_removal
+    from .friend_versions import bump
+    record_removal((instance.user1_id, instance.user2_id))
+    bump(instance)
 
 class Group(models.Model):
     id = models.CharField(max_length=128, primary_key=True, default=uuid.uuid4, unique=True)
@@ -144,6 +244,57 @@ class GroupInvitation(models.Model):
 
     class Meta:
         db_table = 'group_invitations'
+        constraints = [
+            # Lets bulk invites skip users that were invited concurrently
+            models.UniqueConstraint(
+                fields=['group', 'invited_user'],
+                name='unique_group_invitation'
+            )
+        ]
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_info(sender, instance, **kwargs):
+    """Drop the cached group info when the group changes"""
+    from .group_info import invalidate
+    invalidate(instance.id)
+
+@receiver(post_save, sender=GroupMember)
+def group_member_saved(sender, instance, **kwargs):
+    from .group_membership import record_change
+    record_change(instance)
+
+@receiver(post_delete, sender=GroupMember)
+def group_member_deleted(sender, instance, **kwargs):
+    from .group_membership import record_removal
+    record_removal((instance.group_id, instance.user_id))
+
+@receiver(post_save, sender=GroupMember)
+@receiver(post_delete, sender=GroupMember)
+@receiver(post_save, sender=GroupInvitation)
+@receiver(post_delete, sender=GroupInvitation)
+def invalidate_membership_group_info(sender, instance, **kwargs):
+    """Drop the cached group info when its members or invitations change"""
+    from .group_info import invalidate
+    invalidate(instance.group_id)
+
+@receiver(post_save, sender=User)
+def invalidate_user_group_info(sender, instance, created=False, update_fields=None, **kwargs):
+    """Drop the cached info of the groups showing this user's profile"""
+    profile_fields = {'name', 'full_name', 'avatar_url', 'avatar_variants', 'phone_number'}
+    if created or (update_fields is not None and not profile_fields & set(update_fields)):
+        return
+    from .group_info import invalidate_user
+    invalidate_user(instance.id)
+
+@receiver(post_save, sender=User)
+def bump_friends_on_profile_change(sender, instance, created=False, update_fields=None, **kwargs):
+    """Friends lists show the user's profile, so their ETags and deltas must change with it"""
+    profile_fields = {'name', 'full_name', 'email', 'avatar_url', 'avatar_variants'}
+    if created or (update_fields is not None and not profile_fields & set(update_fields)):
+        return
+    from .friend_versions import profile_changed
+    profile_changed(instance.id)
 
 class ChatMessage(models.Model):
     MESSAGE_TYPES = [
@@ -288,13 +439,20 @@ class Expense(models.Model):
     )
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
     remaining_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    currency = models.CharField(max_length=10, default='USD')
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     deadline = models.DateTimeField(blank=True, null=True)
     receipt_url = models.URLField(blank=True, null=True)
+    receipt_thumbnail_url = models.URLField(blank=True, null=True)
 
     class Meta:
         db_table = 'expenses'
+        indexes = [
+            models.Index(fields=['paid_by', 'created_at'], name='expense_payer_created_idx'),
+            models.Index(fields=['updated_at'], name='expense_updated_idx'),
+        ]
 
     def __str__(self):
         return f"{self.paid_by.full_name} paid ${self.amount} for {self.group.name}"
@@ -326,4 +484,227 @@ class ExpenseSplit(models.Model):
         unique_together = ['expense', 'user']
 
     def __str__(self):
-        return f"{self.user.full_name} owes ${self.remaining_amount} for {self.expense.description}"
\ No newline at end of file
+        return f"{self.user.full_name} owes ${self.remaining_amount} for {self.expense.description}"
+
+@receiver(post_save, sender=Expense)
+@receiver(post_delete, sender=Expense)
+def invalidate_expense_group_summary(sender, instance, **kwargs):
+    """Drop the cached group summary when one of its expenses changes"""
+    from .group_summary import invalidate
+    invalidate(instance.group_id)
+
+class IdempotencyKey(models.Model):
+    """
+    Stores the response of a write endpoint under a client supplied key so
+    that retries of the same request are replayed instead of applied twice.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='idempotency_keys'
+    )
+    endpoint = models.CharField(max_length=64)
+    key = models.CharField(max_length=128)
+    # SHA-256 of the request parameters; a retry must carry the same ones
+    request_hash = models.CharField(max_length=64, blank=True, default='')
+    response = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'idempotency_keys'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'endpoint', 'key'],
+                name='unique_idempotency_key'
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.endpoint}:{self.key} ({self.user_id})"
+
+
+class Payment(models.Model):
+    """
+    Append-only record of a settlement made through record_payment.
+    The auto-increment id doubles as the cursor for the payments feed, which
+    only serves payments once every lower id has committed.
+    """
+    id = models.BigAutoField(primary_key=True)
+    payer = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='payments_made'
+    )
+    recipient = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        related_name='payments_received',
+        null=True,
+        blank=True
+    )
+    group = models.ForeignKey(
+        Group,
+        on_delete=models.SET_NULL,
+        related_name='payments',
+        null=True,
+        blank=True
+    )
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    description = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'payments'
+
+    def __str__(self):
+        return f"{self.payer_id} paid ${self.amount}"
+
+
+class PaymentAllocation(models.Model):
+    """
+    The part of a payment applied to a single expense split.
+    """
+    id = models.BigAutoField(primary_key=True)
+    payment = models.ForeignKey(
+        Payment,
+        on_delete=models.CASCADE,
+        related_name='allocations'
+    )
+    split = models.ForeignKey(
+        ExpenseSplit,
+        on_delete=models.SET_NULL,
+        related_name='allocations',
+        null=True
+    )
+    expense = models.ForeignKey(
+        Expense,
+        on_delete=models.SET_NULL,
+        related_name='payment_allocations',
+        null=True
+    )
+    recipient = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='payment_allocations_received'
+    )
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        db_table = 'payment_allocations'
+        indexes = [
+            models.Index(fields=['recipient', 'payment'], name='allocation_recipient_idx'),
+        ]
+
+
+class RecurringExpense(models.Model):
+    """
+    Rule that materializes a new Expense every interval (rent, subscriptions).
+    """
+    INTERVAL_CHOICES = [
+        ('daily', 'Daily'),
+        ('weekly', 'Weekly'),
+        ('monthly', 'Monthly'),
+        ('yearly', 'Yearly'),
+    ]
+
+    id = models.CharField(max_length=128, primary_key=True, default=uuid.uuid4, unique=True)
+    paid_by = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='recurring_expenses'
+    )
+    group = models.ForeignKey(
+        Group,
+        on_delete=models.CASCADE,
+        related_name='recurring_expenses',
+        null=True,
+        blank=True
+    )
+    friend = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='recurring_expenses_with',
+        null=True,
+        blank=True
+    )
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    currency = models.CharField(max_length=10, default='USD')
+    description = models.TextField(blank=True)
+    interval = models.CharField(max_length=10, choices=INTERVAL_CHOICES, default='monthly')
+    interval_count = models.PositiveSmallIntegerField(default=1)
+    # Occurrence n runs n * interval_count intervals after start_at, so a rule
+    # starting on the 31st returns to the 31st after a shorter month
+    start_at = models.DateTimeField()
+    run_count = models.PositiveIntegerField(default=0)
+    next_run_at = models.DateTimeField()
+    last_run_at = models.DateTimeField(null=True, blank=True)
+    end_at = models.DateTimeField(null=True, blank=True)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'recurring_expenses'
+        indexes = [
+            models.Index(fields=['is_active', 'next_run_at'], name='recurring_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.description} every {self.interval_count} {self.interval}"
+
+
+class FxRate(models.Model):
+    """
+    Daily exchange rate: 1 unit of base is worth `rate` units of quote.
+    """
+    base = models.CharField(max_length=10)
+    quote = models.CharField(max_length=10)
+    date = models.DateField()
+    rate = models.DecimalField(max_digits=20, decimal_places=10)
+    source = models.CharField(max_length=50, default='fixture')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'fx_rates'
+        unique_together = ('base', 'quote', 'date')
+
+
+class DeletionJob(models.Model):
+    """
+    Background deletion of a group or a user account and everything that
+    hangs off it, done in chunks. `step` and `progress` are saved after each
+    chunk so a failed or interrupted job resumes where it stopped.
+    """
+    KIND_CHOICES = [
+        ('group', 'Group'),
+        ('user', 'User'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.CharField(max_length=128, primary_key=True, default=uuid.uuid4, unique=True)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    target_id = models.CharField(max_length=128)
+    # Cognito id of the user who asked for the deletion
+    requested_by = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    step = models.PositiveSmallIntegerField(default=0)
+    # Rows deleted or detached so far, by step name
+    progress = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'deletion_jobs'
+        indexes = [
+            models.Index(fields=['kind', 'target_id'], name='deletion_job_target_idx'),
+            models.Index(fields=['status', 'updated_at'], name='deletion_job_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"delete {self.kind} {self.target_id} ({self.status})"
@@ -0,0 +1,60 @@
+"""
+Batched SSE notifications.
+
+Bulk operations notify many users at once; instead of one broker round
+trip per recipient, the events are collected and published through a
+single Redis pipeline after the transaction commits.
+"""
+
+import logging
+
+from asgiref.sync import async_to_sync
+from django.db import transaction
+from django.utils import timezone
+
+from .message_broker import broker
+
+logger = logging.getLogger(__name__)
+
+
+def notification(user_id, notification_type, message, **extra):
+    """(channel, event) pair for a notification shown to one user"""
+    return f"user-{user_id}", {
+        "event": "message",
+        "data": {
+            "type": "notification",
+            "notification_type": notification_type,
+            "message": message,
+            "timestamp": timezone.now().isoformat(),
+            **extra
+        }
+    }
+
+
+def group_update(user_id, group_id, message):
+    """(channel, event) pair telling one member that a group changed"""
+    return f"user-{user_id}", {
+        "event": "message",
+        "data": {
+            "type": "group_update",
+            "group_id": str(group_id),
+            "message": message,
+            "timestamp": timezone.now().isoformat()
+        }
+    }
+
+
+def publish_on_commit(messages):
+    """Publish (channel, event) pairs in one pipeline once the transaction commits"""
+    messages = list(messages)
+    if not messages:
+        return
+
+    def publish():
+        try:
+            async_to_sync(broker.publish_many)(messages)
+        except Exception:
+            # Notifications are best effort, the data is already committed
+            logger.warning("Could not publish %d notifications", len(messages), exc_info=True)
+
+    transaction.on_commit(publish)
@@ -0,0 +1,147 @@
+"""
+Per-request query counting, query budgets and N+1 detection.
+
+QueryCounter hooks into every database connection with execute_wrapper and
+records the number of queries, the time spent in the database and how often
+each SQL shape ran. The shape is the SQL with its parameters already left
+out by Django and IN lists collapsed, so the same lookup repeated for every
+row of a loop (the usual lazy foreign key access) shows up as one shape
+with a high count.
+
+QueryBudgetMiddleware applies it to every request:
+    QUERY_BUDGET            default query budget per request (50)
+    QUERY_BUDGETS           url name -> budget, overriding the default
+    QUERY_BUDGET_RAISE      raise QueryBudgetExceeded instead of logging
+    N_PLUS_ONE_THRESHOLD    repeats of one shape reported as N+1 (5)
+With DEBUG on, responses carry X-DB-Query-Count, X-DB-Time-Ms and
+X-DB-Repeated-Queries headers.
+
+Tests use the same counter through assert_max_queries:
+
+    with assert_max_queries(6):
+        client.get(reverse('get_user_friends'), ...)
+"""
+
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def sql_shape(sql):
+    """SQL without the length of IN lists, so one lookup per row counts as one shape"""
+    return _WHITESPACE.sub(' ', _IN_LIST.sub('IN (...)', sql)).strip()
+
+
+class QueryCounter:
+    """execute_wrapper recording query count, database time and SQL shapes"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.shapes[sql_shape(sql)] += 1
+
+    def repeated(self, threshold=None):
+        """(shape, count) of the shapes that ran at least `threshold` times, most frequent first"""
+        threshold = threshold or n_plus_one_threshold()
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    def describe(self, threshold=None):
+        lines = [f'{self.count} queries in {self.duration * 1000:.1f} ms']
+        lines.extend(f'  {count}x {shape}' for shape, count in self.repeated(threshold))
+        return '\n'.join(lines)
+
+
+@contextmanager
+def count_queries(using=None):
+    """Count the queries run inside the block on the given (or every) database alias"""
+    counter = QueryCounter()
+    aliases = [using] if using else list(connections)
+    with ExitStack() as stack:
+        for alias in aliases:
+            stack.enter_context(connections[alias].execute_wrapper(counter))
+        yield counter
+
+
+@contextmanager
+def assert_max_queries(budget, using=None, allow_repeated=False):
+    """
+    Fail the block if it runs more than `budget` queries or, unless
+    allow_repeated is set, if any SQL shape repeats N_PLUS_ONE_THRESHOLD times.
+    """
+    with count_queries(using) as counter:
+        yield counter
+    if counter.count > budget:
+        raise QueryBudgetExceeded(f'Query budget of {budget} exceeded: {counter.describe()}')
+    if not allow_repeated and counter.repeated():
+        raise QueryBudgetExceeded(f'Repeated queries (possible N+1): {counter.describe()}')
+
+
+def default_budget():
+    return getattr(settings, 'QUERY_BUDGET', 50)
+
+
+def n_plus_one_threshold():
+    return getattr(settings, 'N_PLUS_ONE_THRESHOLD', 5)
+
+
+def budget_for(url_name):
+    return getattr(settings, 'QUERY_BUDGETS', {}).get(url_name, default_budget())
+
+
+class QueryBudgetMiddleware:
+    """
+    Count the queries of every request, log (or raise) when it goes over
+    its route's budget or repeats a query shape, and report the numbers in
+    debug response headers. Add 'cliquepay.query_budget.QueryBudgetMiddleware'
+    to MIDDLEWARE.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with count_queries() as counter:
+            response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        route = (match.url_name or match.view_name) if match else request.path
+        budget = budget_for(route)
+        problems = []
+        if counter.count > budget:
+            problems.append(f'over its budget of {budget}')
+        if counter.repeated():
+            problems.append('with repeated queries (possible N+1)')
+        if problems:
+            message = f'{request.method} {route} ran {" and ".join(problems)}: {counter.describe()}'
+            if getattr(settings, 'QUERY_BUDGET_RAISE', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+        if settings.DEBUG:
+            response['X-DB-Query-Count'] = str(counter.count)
+            response['X-DB-Time-Ms'] = f'{counter.duration * 1000:.1f}'
+            response['X-DB-Repeated-Queries'] = str(sum(count for _, count in counter.repeated()))
+        return response
@@ -0,0 +1,107 @@
+"""
+Expense receipt uploads.
+
+The uploaded file is streamed to the storage backend in fixed-size chunks
+(a resumable upload on GCS), so memory stays bounded whatever the file
+size. The thumbnail is generated afterwards by a background job and stored
+next to the receipt.
+
+Receipts are only ever stored under receipts/<expense id>/, and only keys
+under that prefix are deleted: receipt URLs imported from CSV files are
+not trusted to point at files this module owns.
+"""
+
+import io
+import logging
+import tempfile
+import uuid
+
+from django.utils import timezone
+from PIL import Image
+
+from . import background
+from .models import Expense
+from .storage_service import get_storage_service
+
+logger = logging.getLogger(__name__)
+
+MAX_RECEIPT_SIZE = 10 * 1024 * 1024
+ALLOWED_CONTENT_TYPES = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+    'image/webp': 'webp',
+    'application/pdf': 'pdf',
+}
+THUMBNAIL_SIZE = (320, 320)
+# Downloads larger than this spill from memory to a temporary file
+SPOOL_SIZE = 1024 * 1024
+
+
+def store_receipt(expense, file):
+    """
+    Upload a receipt, attach it to the expense and queue its thumbnail.
+
+    Args:
+        expense (Expense): Expense the receipt belongs to
+        file (UploadedFile): Validated receipt file
+    Returns:
+        str: Public URL of the receipt
+    """
+    key = f"{key_prefix(expense.id)}{uuid.uuid4()}.{ALLOWED_CONTENT_TYPES[file.content_type]}"
+    receipt_url = get_storage_service().upload_stream(file, key, file.content_type)
+
+    Expense.objects.filter(id=expense.id).update(
+        receipt_url=receipt_url,
+        receipt_thumbnail_url=None,
+        updated_at=timezone.now()
+    )
+    if file.content_type.startswith('image/'):
+        background.submit_on_commit(generate_thumbnail, expense.id, key, receipt_url)
+    old_urls = [url for url in (expense.receipt_url, expense.receipt_thumbnail_url) if url]
+    if old_urls:
+        background.submit_on_commit(delete_stored_files, expense.id, old_urls)
+    return receipt_url
+
+
+def key_prefix(expense_id):
+    return f"receipts/{expense_id}/"
+
+
+def delete_stored_files(expense_id, urls):
+    """
+    Delete replaced receipts of an expense. Only keys under the expense's own
+    receipt prefix are deleted; any other URL is left alone.
+    """
+    storage = get_storage_service()
+    prefix = key_prefix(expense_id)
+    for url in urls:
+        key = storage.key_from_url(url)
+        if key and key.startswith(prefix) and '..' not in key:
+            storage.delete(key)
+
+
+def generate_thumbnail(expense_id, key, receipt_url):
+    """Build a WebP thumbnail of a stored receipt and attach it to the expense."""
+    storage = get_storage_service()
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as original:
+        storage.download_to_file(key, original)
+        original.seek(0)
+        with Image.open(original) as image:
+            # Let the JPEG decoder downscale while decoding
+            image.draft('RGB', THUMBNAIL_SIZE)
+            image.thumbnail(THUMBNAIL_SIZE)
+            thumbnail = io.BytesIO()
+            image.convert('RGB').save(thumbnail, 'WEBP', quality=80)
+
+    thumbnail.seek(0)
+    thumbnail_key = key.rsplit('.', 1)[0] + '-thumb.webp'
+    thumbnail_url = storage.upload_stream(thumbnail, thumbnail_key, 'image/webp')
+
+    # Skip if another receipt replaced this one meanwhile
+    updated = Expense.objects.filter(id=expense_id, receipt_url=receipt_url).update(
+        receipt_thumbnail_url=thumbnail_url
+    )
+    if not updated:
+        storage.delete(thumbnail_key)
+        return
+    logger.info("Receipt thumbnail for expense %s stored at %s", expense_id, thumbnail_key)
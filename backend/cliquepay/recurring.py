@@ -0,0 +1,134 @@
+"""
+Scheduler that turns due RecurringExpense rules into real expenses.
+
+Due rules are claimed in batches with SELECT ... FOR UPDATE SKIP LOCKED on
+the (is_active, next_run_at) index, so several nodes can run the scheduler
+at once without materializing the same occurrence twice. Each batch creates
+its expenses and splits with bulk_create and advances next_run_at in the
+same transaction. Each expense is dated at its scheduled occurrence, not at
+the time the scheduler ran, so a catch-up after downtime lands every expense
+on its own date and converts it at that date's rate. Every occurrence is computed from the rule's start_at and
+the number of runs so far, never from the previous occurrence, so monthly
+and yearly rules do not drift after a clamped month end.
+"""
+
+import asyncio
+import calendar
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.utils import timezone
+
+from . import group_summary
+from .expense_import import build_expense
+from .models import Expense, ExpenseSplit, GroupMember, RecurringExpense
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 100
+# Occurrences materialized per rule per batch when catching up after downtime
+MAX_CATCH_UP = 12
+
+
+def next_occurrence(current, interval, count=1):
+    """Return the run time `count` intervals after `current`."""
+    if interval == 'daily':
+        return current + timedelta(days=count)
+    if interval == 'weekly':
+        return current + timedelta(weeks=count)
+
+    months = count if interval == 'monthly' else 12 * count
+    month_index = current.month - 1 + months
+    year = current.year + month_index // 12
+    month = month_index % 12 + 1
+    # Clamp the 29th-31st to the end of shorter months
+    day = min(current.day, calendar.monthrange(year, month)[1])
+    return current.replace(year=year, month=month, day=day)
+
+
+def materialize_due(now=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Create the expenses for every rule due at `now`, one batch per transaction.
+
+    Returns:
+        int: Number of expenses created
+    """
+    now = now or timezone.now()
+    created = 0
+
+    while True:
+        with transaction.atomic():
+            rules = list(
+                RecurringExpense.objects.select_for_update(skip_locked=True)
+                .filter(is_active=True, next_run_at__lte=now)
+                .order_by('next_run_at')[:batch_size]
+            )
+            if not rules:
+                break
+
+            members_by_group = defaultdict(set)
+            group_ids = {rule.group_id for rule in rules if rule.group_id}
+            for group_id, user_id in GroupMember.objects.filter(group_id__in=group_ids).values_list('group_id', 'user_id'):
+                members_by_group[group_id].add(user_id)
+
+            expenses = []
+            occurrences = []
+            splits = []
+            for rule in rules:
+                runs = 0
+                while rule.is_active and rule.next_run_at <= now and runs < MAX_CATCH_UP:
+                    if rule.group_id and rule.paid_by_id not in members_by_group[rule.group_id]:
+                        logger.info("Deactivating recurring expense %s: payer left the group", rule.id)
+                        rule.is_active = False
+                        break
+
+                    expense, expense_splits = build_expense({
+                        'paid_by': rule.paid_by_id,
+                        'group_id': rule.group_id,
+                        'friend_id': rule.friend_id,
+                        'total_amount': rule.total_amount,
+                        'currency': rule.currency,
+                        'description': rule.description,
+                        'deadline': None,
+                        'receipt_url': None,
+                    }, members_by_group)
+                    expenses.append(expense)
+                    occurrences.append(rule.next_run_at)
+                    splits.extend(expense_splits)
+
+                    rule.last_run_at = rule.next_run_at
+                    rule.run_count += 1
+                    rule.next_run_at = next_occurrence(
+                        rule.start_at, rule.interval, rule.interval_count * rule.run_count
+                    )
+                    if rule.end_at and rule.next_run_at > rule.end_at:
+                        rule.is_active = False
+                    runs += 1
+
+            Expense.objects.bulk_create(expenses)
+            # bulk_create stamps created_at with the current time, date each expense at its occurrence
+            for expense, occurrence in zip(expenses, occurrences):
+                expense.created_at = occurrence
+            Expense.objects.bulk_update(expenses, ['created_at'])
+            ExpenseSplit.objects.bulk_create(splits)
+            group_summary.invalidate(*{expense.group_id for expense in expenses})
+            RecurringExpense.objects.bulk_update(rules, ['next_run_at', 'last_run_at', 'run_count', 'is_active'])
+
+        created += len(expenses)
+
+    return created
+
+
+async def run_scheduler(interval=60, batch_size=DEFAULT_BATCH_SIZE):
+    """Materialize due rules every `interval` seconds until cancelled."""
+    while True:
+        try:
+            created = await sync_to_async(materialize_due)(batch_size=batch_size)
+            if created:
+                logger.info("Materialized %d recurring expenses", created)
+        except Exception:
+            logger.exception("Recurring expense run failed")
+        await asyncio.sleep(interval)
@@ -0,0 +1,33 @@
+"""
+Shared synchronous Redis client for caches and indexes.
+
+The async message broker keeps its own connection; this client is for
+request-path lookups from sync views and signal handlers. It is created
+lazily and shared by all threads of the process through redis-py's own
+connection pool.
+"""
+
+import os
+import threading
+
+import redis
+
+_client = None
+_lock = threading.Lock()
+
+
+def get_redis():
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = redis.Redis(
+                    host=os.getenv('REDIS_HOST', 'redis'),
+                    port=int(os.getenv('REDIS_PORT', 6379)),
+                    decode_responses=True,
+                    # Callers fall back to the database, so fail fast
+                    socket_timeout=0.5,
+                    socket_connect_timeout=0.5,
+                    health_check_interval=30,
+                )
+    return _client
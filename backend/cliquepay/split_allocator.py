@@ -0,0 +1,210 @@
+"""
+Integer-cent allocation helpers for expense splits.
+
+All arithmetic is done on whole cents so that the allocated parts always
+add up exactly to the total; the cents that do not divide evenly are handed
+out with the largest-remainder method. The whole member vector is allocated
+at once, with NumPy when it is installed and the vector is large.
+
+Supported split modes:
+    equal       every participant pays the same
+    exact       values are the amounts, they must add up to the total
+    percentage  values are percentages, they must add up to 100
+    shares      values are relative weights (e.g. 2 shares vs 1 share)
+    Percentages and shares are used with up to WEIGHT_PLACES decimal places,
+    so 33.3333 / 33.3333 / 33.3334 adds up to 100 exactly.
+    itemized    items are split equally among the users who had them;
+                the rest of the total (tax, tip) follows the item subtotals
+"""
+
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional speedup
+    np = None
+
+CENT = Decimal('0.01')
+# Decimal places kept from percentages and shares
+WEIGHT_PLACES = 4
+SPLIT_MODES = ('equal', 'exact', 'percentage', 'shares', 'itemized')
+# Below this size the pure Python loop is faster than building arrays
+NUMPY_THRESHOLD = 1000
+_INT64_SAFE = 2 ** 62
+
+
+class SplitError(ValueError):
+    """Raised when split values are inconsistent with the total."""
+
+
+def to_cents(amount):
+    """Convert a money amount (Decimal, str, int) to integer cents."""
+    return int((Decimal(str(amount)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents):
+    """Convert integer cents back to a 2-place Decimal."""
+    return (Decimal(cents) / 100).quantize(CENT)
+
+
+def allocate_cents(total_cents, weights):
+    """
+    Split total_cents proportionally to non-negative integer weights.
+
+    Args:
+        total_cents (int): Amount to split, in cents
+        weights (list[int]): One weight per share; all zero means equal shares
+    Returns:
+        list[int]: Cents per share, summing exactly to total_cents
+    """
+    count = len(weights)
+    if count == 0:
+        return []
+
+    weight_sum = sum(weights)
+    if weight_sum <= 0:
+        weights = [1] * count
+        weight_sum = count
+
+    if np is not None and count >= NUMPY_THRESHOLD and abs(total_cents) * max(weights) < _INT64_SAFE:
+        return _allocate_cents_numpy(total_cents, weights, weight_sum)
+
+    shares = []
+    remainders = []
+    for index, weight in enumerate(weights):
+        share, remainder = divmod(total_cents * weight, weight_sum)
+        shares.append(share)
+        remainders.append((remainder, -index))
+
+    # Leftover cents go to the largest remainders, earlier shares win ties
+    leftover = total_cents - sum(shares)
+    for _, negative_index in sorted(remainders, reverse=True)[:leftover]:
+        shares[-negative_index] += 1
+    return shares
+
+
+def rescale(amounts, new_total):
+    """
+    Scale amounts proportionally so they add up to new_total exactly.
+
+    Args:
+        amounts (list[Decimal]): Current amounts
+        new_total (Decimal): Target total
+    Returns:
+        list[Decimal]: Rescaled amounts in the same order
+    """
+    weights = [to_cents(amount) for amount in amounts]
+    return [from_cents(cents) for cents in allocate_cents(to_cents(new_total), weights)]
+
+
+def _allocate_cents_numpy(total_cents, weights, weight_sum):
+    """Vectorized allocate_cents, same result as the Python loop."""
+    products = np.asarray(weights, dtype=np.int64) * total_cents
+    shares, remainders = np.divmod(products, weight_sum)
+    leftover = int(total_cents - shares.sum())
+    if leftover:
+        # Largest remainder first, lower index first on ties
+        order = np.lexsort((np.arange(len(weights)), -remainders))
+        shares[order[:leftover]] += 1
+    return shares.tolist()
+
+
+def _to_decimal(value, name):
+    try:
+        return Decimal(str(value))
+    except (InvalidOperation, TypeError, ValueError):
+        raise SplitError(f'{name} must be a number')
+
+
+def _to_weight(value, name):
+    """Percentage or shares as an integer number of 1 / 10**WEIGHT_PLACES units"""
+    weight = _to_decimal(value, name).scaleb(WEIGHT_PLACES)
+    if weight != weight.to_integral_value():
+        raise SplitError(f'{name.capitalize()} can have at most {WEIGHT_PLACES} decimal places')
+    return int(weight)
+
+
+def _to_exact_cents(value):
+    amount = _to_decimal(value, 'amount')
+    if amount != amount.quantize(CENT):
+        raise SplitError('Amounts can have at most 2 decimal places')
+    return to_cents(amount)
+
+
+def allocate(total, participants, mode='equal', values=None, items=None):
+    """
+    Allocate an expense total over its participants.
+
+    Args:
+        total (Decimal): Expense total
+        participants (list[str]): User ids, in a stable order
+        mode (str): One of SPLIT_MODES
+        values (dict, optional): user_id -> amount / percentage / shares
+        items (list[dict], optional): For itemized mode,
+            [{'amount': Decimal, 'user_ids': [...]}, ...]
+    Returns:
+        dict: user_id -> Decimal share, summing exactly to total
+    """
+    if mode not in SPLIT_MODES:
+        raise SplitError(f'Unknown split mode: {mode}')
+    if not participants:
+        raise SplitError('At least one participant is required')
+
+    total_cents = to_cents(total)
+    values = values or {}
+    unknown = set(values) - set(participants)
+    if unknown:
+        raise SplitError(f'Users are not participants of this expense: {", ".join(sorted(unknown))}')
+
+    if mode == 'equal':
+        cents = allocate_cents(total_cents, [1] * len(participants))
+
+    elif mode == 'exact':
+        cents = [_to_exact_cents(values.get(user_id, 0)) for user_id in participants]
+        if any(part < 0 for part in cents):
+            raise SplitError('Amounts cannot be negative')
+        if sum(cents) != total_cents:
+            raise SplitError('Exact amounts must add up to the total')
+
+    elif mode == 'percentage':
+        weights = [_to_weight(values.get(user_id, 0), 'percentage') for user_id in participants]
+        if any(weight < 0 for weight in weights):
+            raise SplitError('Percentages cannot be negative')
+        if sum(weights) != 100 * 10 ** WEIGHT_PLACES:
+            raise SplitError('Percentages must add up to 100')
+        cents = allocate_cents(total_cents, weights)
+
+    elif mode == 'shares':
+        weights = [_to_weight(values.get(user_id, 0), 'shares') for user_id in participants]
+        if any(weight < 0 for weight in weights) or not any(weights):
+            raise SplitError('Shares must be non-negative with at least one positive share')
+        cents = allocate_cents(total_cents, weights)
+
+    else:
+        cents = _allocate_itemized(total_cents, participants, items or [])
+
+    return {user_id: from_cents(part) for user_id, part in zip(participants, cents)}
+
+
+def _allocate_itemized(total_cents, participants, items):
+    index = {user_id: position for position, user_id in enumerate(participants)}
+    subtotals = [0] * len(participants)
+    items_cents = 0
+
+    for item in items:
+        user_ids = item.get('user_ids') or []
+        if not user_ids or any(user_id not in index for user_id in user_ids):
+            raise SplitError('Every item needs user_ids taken from the participants')
+        item_cents = to_cents(_to_decimal(item.get('amount'), 'item amount'))
+        if item_cents < 0:
+            raise SplitError('Item amounts cannot be negative')
+        items_cents += item_cents
+        for user_id, part in zip(user_ids, allocate_cents(item_cents, [1] * len(user_ids))):
+            subtotals[index[user_id]] += part
+
+    if items_cents > total_cents:
+        raise SplitError('Items add up to more than the total')
+
+    # Tax, tip and fees follow each participant's item subtotal
+    extra = allocate_cents(total_cents - items_cents, subtotals)
+    return [subtotal + part for subtotal, part in zip(subtotals, extra)]
@@ -1,96 +1,355 @@
 from google.cloud import storage
+from google.auth.transport.requests import AuthorizedSession
 from django.conf import settings
+from django.core import signing
+from datetime import timedelta
+from requests.adapters import HTTPAdapter
+import logging
+import os
+import shutil
+import threading
 import uuid
 
+# Resumable uploads must use a multiple of 256 KB per request
+UPLOAD_CHUNK_SIZE = 8 * 256 * 1024
+UPLOAD_URL_EXPIRY = timedelta(minutes=15)
+LOCAL_UPLOAD_SALT = 'cliquepay.local-upload'
+DEFAULT_PROFILE_PICTURE = 'Default_pfp.jpg'
+
+logger = logging.getLogger(__name__)
+
+_client = None
+_service = None
+# Reentrant: building the service may build the client under the same lock
+_lock = threading.RLock()
+
+
+def iter_chunks(file, chunk_size=UPLOAD_CHUNK_SIZE):
+    """Yield a Django UploadedFile or any binary file object in chunks."""
+    if hasattr(file, 'chunks'):
+        yield from file.chunks(chunk_size)
+        return
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+def get_client():
+    """
+    Process-wide GCS client, created on first use.
+    All requests share one authorized session whose connection pool is
+    sized by GS_HTTP_POOL_SIZE, so TLS connections are reused across requests.
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                pool_size = getattr(settings, 'GS_HTTP_POOL_SIZE', 32)
+                session = AuthorizedSession(settings.GS_CREDENTIALS)
+                session.mount('https://', HTTPAdapter(pool_connections=pool_size,
+                                                      pool_maxsize=pool_size,
+                                                      max_retries=3))
+                _client = storage.Client(credentials=settings.GS_CREDENTIALS,
+                                         project=settings.GS_PROJECT_ID,
+                                         _http=session)
+    return _client
+
+
 class CloudStorageService:
-    def __init__(self):
-        self.client = storage.Client(credentials=settings.GS_CREDENTIALS,
-                                   project=settings.GS_PROJECT_ID)
+    def __init__(self, client=None):
+        self.client = client or get_client()
         self.bucket = self.client.bucket(settings.GS_BUCKET_NAME)
 
-    def upload_profile_picture(self, file, old_url=None):
+    def key_from_url(self, url):
+        """Extract the object key from a public URL of this bucket"""
+        for prefix in ('https://storage.googleapis.com/', 'https://storage.cloud.google.com/'):
+            bucket_prefix = f"{prefix}{settings.GS_BUCKET_NAME}/"
+            if url.startswith(bucket_prefix):
+                return url[len(bucket_prefix):]
+        return None
+
+    def upload_stream(self, file, key, content_type, chunk_size=UPLOAD_CHUNK_SIZE):
+        """
+        Stream a file to the bucket with a resumable upload and return its public URL.
+        Only one chunk is held in memory at a time.
+        """
+        blob = self.bucket.blob(key)
+        with blob.open('wb', chunk_size=chunk_size, content_type=content_type) as writer:
+            for chunk in iter_chunks(file, chunk_size):
+                writer.write(chunk)
+        blob.make_public()
+        return blob.public_url
+
+    def download_to_file(self, key, file):
+        """Stream an object into a writable binary file object"""
+        self.bucket.blob(key).download_to_file(file)
+
+    def generate_upload_url(self, key, content_type, max_size, expires_in=UPLOAD_URL_EXPIRY):
+        """
+        Signed URL the client can PUT the object to directly.
+        Returns the URL and the headers the client must send with it.
+        """
+        headers = {
+            'Content-Type': content_type,
+            'x-goog-content-length-range': f'0,{max_size}',
+        }
+        url = self.bucket.blob(key).generate_signed_url(
+            version='v4',
+            expiration=expires_in,
+            method='PUT',
+            content_type=content_type,
+            headers={'x-goog-content-length-range': headers['x-goog-content-length-range']}
+        )
+        return url, headers
+
+    def get_metadata(self, key):
+        """Size and content type of an object, or None if it does not exist"""
+        blob = self.bucket.get_blob(key)
+        if blob is None:
+            return None
+        return {'size': blob.size, 'content_type': blob.content_type}
+
+    def make_public(self, key):
+        """Make an uploaded object public and return its URL"""
+        blob = self.bucket.blob(key)
+        blob.make_public()
+        return blob.public_url
+
+    def delete(self, key):
+        """Delete an object, ignoring objects that are already gone"""
+        blob = self.bucket.get_blob(key)
+        if blob is None:
+            return False
+        blob.delete(if_generation_match=blob.generation)
+        return True
+
+    def upload_profile_picture(self, file, old_url=None, prefix='profile_pictures/'):
         """
-        Upload a profile picture and return its public URL.
+        Upload a profile picture under prefix and return its public URL.
         If old_url exists and is not default, delete it first.
         """
         try:
             # Check if old picture exists and is not default
-            if old_url and 'Default_pfp.jpg' not in old_url:
+            if old_url and DEFAULT_PROFILE_PICTURE not in old_url:
                 self.delete_profile_picture(old_url)
 
             # Create unique filename
             extension = file.name.split('.')[-1]
-            filename = f"profile_pictures/{str(uuid.uuid4())}.{extension}"
-            
+            filename = f"{prefix}{str(uuid.uuid4())}.{extension}"
+
             # Upload file
             blob = self.bucket.blob(filename)
             blob.upload_from_file(file, content_type=file.content_type)
-            
+
             # Make public and return URL
             blob.make_public()
             return blob.public_url
-            
-        except Exception as e:
-            print(f"Error uploading file: {str(e)}")
+
+        except Exception:
+            logger.exception("Error uploading profile picture")
             return None
 
     def delete_profile_picture(self, url):
         """Delete a profile picture by its URL"""
         try:
             if not url:
-                print("DEBUG: No URL provided")
                 return False
 
             # Extract blob name from URL
-            blob_name = url.replace('https://storage.googleapis.com/cliquepay_profile_photo_bucket/', '')
+            blob_name = self.key_from_url(url)
             if not blob_name:
-                print("DEBUG: Could not extract blob name from URL")
+                logger.debug("Could not extract blob name from URL %s", url)
                 return False
 
             blob = self.bucket.blob(blob_name)
-            
+
             # Fetch blob metadata
             blob.reload()
             generation_match_precondition = blob.generation
 
             # Delete with generation match precondition
             blob.delete(if_generation_match=generation_match_precondition)
-            
-            print(f"DEBUG: Successfully deleted blob: {blob_name}")
+
+            logger.debug("Deleted blob %s", blob_name)
             return True
 
-        except Exception as e:
-            print(f"DEBUG: Error deleting file: {type(e).__name__}")
-            print(f"DEBUG: Error details: {str(e)}")
+        except Exception:
+            logger.warning("Error deleting profile picture %s", url, exc_info=True)
             return False
-        
-    def delete_user_profile_picture(self, user_id):
+
+    def delete_user_profile_picture(self, avatar_url, variants=None):
         """
-        Delete a user's profile picture by user ID
+        Delete a user's profile picture and its size variants
         Returns True if picture was deleted or if user had default picture
         """
-        try:
-            # Check if this user has a custom profile picture in the database
-            from cliquepay.models import User
-            user = User.objects.get(cognito_id=user_id)
-            
-            # If the user has a custom profile picture (not the default)
-            if user.avatar_url and 'Default_pfp.jpg' not in user.avatar_url:
-                # Delete the picture from cloud storage
-                return self.delete_profile_picture(user.avatar_url)
-            
-            # User has default picture, nothing to delete
-            return True
-            
-        except Exception as e:
-            print(f"Error deleting user profile picture: {str(e)}")
-            return False
-        
+        for variant_url in (variants or {}).values():
+            key = self.key_from_url(variant_url)
+            if key:
+                self.delete(key)
+
+        # If the user has a custom profile picture (not the default)
+        if avatar_url and DEFAULT_PROFILE_PICTURE not in avatar_url:
+            # Delete the picture from cloud storage
+            return self.delete_profile_picture(avatar_url)
+
+        # User has default picture, nothing to delete
+        return True
+
     def reset_profile_picture(self, current_url):
         """
         Delete current profile picture and return default picture URL.
         Returns default URL even if deletion fails.
         """
-        if current_url and 'Default_pfp.jpg' not in current_url:
+        if current_url and DEFAULT_PROFILE_PICTURE not in current_url:
             self.delete_profile_picture(current_url)
-        return 'https://storage.cloud.google.com/cliquepay_profile_photo_bucket/Default_pfp.jpg'
\ No newline at end of file
+        return f'https://storage.cloud.google.com/cliquepay_profile_photo_bucket/{DEFAULT_PROFILE_PICTURE}'
+
+
+class LocalStorageService(CloudStorageService):
+    """
+    Filesystem stand-in for CloudStorageService, used in tests and local
+    development (STORAGE_BACKEND = 'local'). Objects are stored under
+    LOCAL_STORAGE_ROOT and served from LOCAL_STORAGE_URL.
+    """
+
+    def __init__(self, root=None, base_url=None):
+        self.root = os.path.abspath(root or getattr(settings, 'LOCAL_STORAGE_ROOT', 'local_storage'))
+        self.base_url = base_url or getattr(settings, 'LOCAL_STORAGE_URL', '/local-storage/')
+
+    def _path(self, key):
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    def key_from_url(self, url):
+        if url.startswith(self.base_url):
+            return url[len(self.base_url):]
+        return None
+
+    def upload_stream(self, file, key, content_type, chunk_size=UPLOAD_CHUNK_SIZE):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as out:
+            for chunk in iter_chunks(file, chunk_size):
+                out.write(chunk)
+        # Sidecar file, the filesystem has no object metadata
+        with open(path + '.content-type', 'w') as f:
+            f.write(content_type or '')
+        return f"{self.base_url}{key}"
+
+    def download_to_file(self, key, file):
+        with open(self._path(key), 'rb') as source:
+            shutil.copyfileobj(source, file)
+
+    def generate_upload_url(self, key, content_type, max_size, expires_in=UPLOAD_URL_EXPIRY):
+        # Served by api.views.local_storage_upload, the stand-in for a signed GCS URL
+        token = signing.dumps({'key': key, 'content_type': content_type, 'max_size': max_size},
+                              salt=LOCAL_UPLOAD_SALT)
+        return f"/api/local-storage-upload/?token={token}", {'Content-Type': content_type}
+
+    def read_upload_token(self, token, expires_in=UPLOAD_URL_EXPIRY):
+        """Payload of a token issued by generate_upload_url, or None if invalid or expired"""
+        try:
+            return signing.loads(token, salt=LOCAL_UPLOAD_SALT, max_age=expires_in)
+        except signing.BadSignature:
+            return None
+
+    def get_metadata(self, key):
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        content_type = None
+        try:
+            with open(path + '.content-type') as f:
+                content_type = f.read()
+        except FileNotFoundError:
+            pass
+        return {'size': os.path.getsize(path), 'content_type': content_type}
+
+    def make_public(self, key):
+        return f"{self.base_url}{key}"
+
+    def delete(self, key):
+        path = self._path(key)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        if os.path.exists(path + '.content-type'):
+            os.remove(path + '.content-type')
+        return True
+
+    def upload_profile_picture(self, file, old_url=None, prefix='profile_pictures/'):
+        if old_url and DEFAULT_PROFILE_PICTURE not in old_url:
+            self.delete_profile_picture(old_url)
+        extension = file.name.split('.')[-1]
+        return self.upload_stream(file, f"{prefix}{uuid.uuid4()}.{extension}", file.content_type)
+
+    def delete_profile_picture(self, url):
+        key = self.key_from_url(url) if url else None
+        return bool(key) and self.delete(key)
+
+
+class InMemoryStorageService(LocalStorageService):
+    """
+    Fake backend keeping objects in a dict, for tests and benchmarks
+    (STORAGE_BACKEND = 'memory'). Safe to share between threads.
+    """
+
+    def __init__(self, base_url='memory://cliquepay/'):
+        self.base_url = base_url
+        self.objects = {}
+        self._objects_lock = threading.Lock()
+
+    def upload_stream(self, file, key, content_type, chunk_size=UPLOAD_CHUNK_SIZE):
+        data = b''.join(iter_chunks(file, chunk_size))
+        with self._objects_lock:
+            self.objects[key] = (data, content_type)
+        return f"{self.base_url}{key}"
+
+    def download_to_file(self, key, file):
+        with self._objects_lock:
+            data, _ = self.objects[key]
+        file.write(data)
+
+    def get_metadata(self, key):
+        with self._objects_lock:
+            stored = self.objects.get(key)
+        if stored is None:
+            return None
+        return {'size': len(stored[0]), 'content_type': stored[1]}
+
+    def delete(self, key):
+        with self._objects_lock:
+            return self.objects.pop(key, None) is not None
+
+
+BACKENDS = {
+    'gcs': CloudStorageService,
+    'local': LocalStorageService,
+    'memory': InMemoryStorageService,
+}
+
+
+def get_storage_service():
+    """
+    Process-wide storage backend selected by settings.STORAGE_BACKEND
+    ('gcs', 'local' or 'memory'), created on first use.
+    """
+    global _service
+    if _service is None:
+        with _lock:
+            if _service is None:
+                _service = BACKENDS[getattr(settings, 'STORAGE_BACKEND', 'gcs')]()
+    return _service
+
+
+def set_storage_service(service):
+    """Swap the process-wide backend, e.g. for an InMemoryStorageService in tests"""
+    global _service
+    with _lock:
+        _service = service
+    return service
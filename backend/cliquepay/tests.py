@@ -1,3 +1,565 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import random
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import jwt
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
+from django.http import QueryDict
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import override_settings
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+
+from api.urls import urlpatterns
+from cliquepay import avatars, group_summary, recurring, split_allocator, storage_service
+from cliquepay.db_service import DatabaseService
+from cliquepay.message_broker import broker
+from cliquepay.models import (
+    DeletionJob, DirectMessage, Expense, ExpenseSplit, Friendship, Group, GroupInvitation,
+    GroupMember, GroupMessage, Payment, RecurringExpense, User,
+)
+from cliquepay.query_budget import assert_max_queries
+
+# 1x1 transparent PNG
+PNG = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=='
+)
+
+# Upper bound of queries per route, url name -> budget. Lists are served with
+# a fixed number of queries however many rows they return, so the fixture
+# holds more rows than N_PLUS_ONE_THRESHOLD and a per-row lookup fails the
+# repeated query check as well as the budget.
+ROUTE_BUDGETS = {
+    'api-root': 0,
+    'register_user': 1,
+    'verify_signup': 0,
+    'user_login': 1,
+    'renew_tokens': 0,
+    'logout_user': 0,
+    'initiate_reset_password': 0,
+    'confirm_reset_password': 0,
+    'get_user_friends': 4,
+    'resend_code': 0,
+    'verify_user_access': 0,
+    'get_user_profile': 1,
+    'change_password': 0,
+    'update_user_profile': 10,
+    'send_friend_request': 10,
+    'accept_friend_request': 8,
+    'send_friend_requests': 12,
+    'remove_friend': 8,
+    'block_user': 9,
+    'update_profile_photo': 11,
+    'reset_profile_photo': 11,
+    'profile_picture_upload_url': 1,
+    'confirm_profile_picture': 10,
+    'local_storage_upload': 0,
+    'get_direct_messages': 5,
+    'get_group_messages': 5,
+    'send_direct_message': 4,
+    'search_user': 3,
+    'autocomplete_user': 2,
+    'create_expense': 8,
+    'import_expenses': 8,
+    'upload_receipt': 2,
+    'create_recurring_expense': 3,
+    'get_recurring_expenses': 2,
+    'cancel_recurring_expense': 2,
+    'transactions': 3,
+    'update_expense': 5,
+    'get_expense_detail': 3,
+    'record_payment': 8,
+    'payments_feed': 2,
+    'delete_expense': 5,
+    'reject_friend_request': 8,
+    'get_group_info': 5,
+    'get_group_summary': 3,
+    'create_group': 3,
+    'group_invite': 7,
+    'group_invite_bulk': 10,
+    'leave_group': 3,
+    'get_user_groups': 6,
+    'accept_group_invite': 7,
+    'accept_group_invites': 10,
+    'reject_group_invite': 4,
+    'get_user_invites': 2,
+    'cancel_group_invite': 4,
+    'get_financial_summary': 3,
+    'get_settlement_data': 2,
+    'send_group_message': 6,
+    'invite_search': 3,
+    'delete_group': 4,
+    'deletion_job_status': 1,
+    'edit_group': 4,
+    'remove_from_group': 4,
+    'get_direct_messages_between_users': 5,
+    'delete_user_profile': 3,
+    'metrics': 0,
+}
+
+# Routes answering with something other than 200 OK, url name -> status
+ROUTE_STATUSES = {
+    'register_user': 201,
+    'accept_friend_request': 202,
+    'upload_receipt': 201,
+    'create_expense': 201,
+    'create_recurring_expense': 201,
+    'reject_friend_request': 202,
+    'delete_group': 202,
+}
+
+
+def _token(user):
+    # Views only decode the ID token, so an unsigned one stands in for Cognito
+    return jwt.encode({'sub': user.cognito_id, 'cognito:username': user.name, 'email': user.email},
+                      'tests', algorithm='HS256')
+
+
+def _cognito_client(user):
+    """Stand-in Cognito client answering as boto3 does, with plain dicts, for one signed in user"""
+    client = mock.Mock()
+    client.exceptions = mock.Mock(**{
+        name: type(name, (Exception,), {})
+        for name in ('NotAuthorizedException', 'UserNotFoundException', 'LimitExceededException')
+    })
+    client.sign_up.return_value = {'UserSub': 'cognito-erin'}
+    # Usernames are free, e-mail lookups find the user
+    client.list_users.side_effect = lambda **params: {
+        'Users': [{'Username': user.name}] if params['Filter'].startswith('email') else []
+    }
+    client.initiate_auth.return_value = {'AuthenticationResult': {
+        'AccessToken': 'access', 'RefreshToken': 'refresh', 'IdToken': _token(user), 'ExpiresIn': 3600
+    }}
+    client.get_user.return_value = {
+        'Username': user.name, 'UserAttributes': [{'Name': 'sub', 'Value': user.cognito_id}]
+    }
+    for operation in ('admin_delete_user', 'confirm_sign_up', 'resend_confirmation_code', 'global_sign_out',
+                      'forgot_password', 'confirm_forgot_password', 'change_password'):
+        getattr(client, operation).return_value = {}
+    return client
+
+
+def _user(name):
+    return User.objects.create(
+        id=str(uuid.uuid4()), cognito_id=f'cognito-{name}', name=name,
+        full_name=name.capitalize(), email=f'{name}@example.com'
+    )
+
+
+def _friendship(user, other, status, action_user=None):
+    user1_id, user2_id = Friendship.ordered(user.id, other.id)
+    return Friendship.objects.create(
+        user1_id=user1_id, user2_id=user2_id, status=status, action_user=action_user or user
+    )
+
+
+@override_settings(METRICS_TOKEN='metrics-token', QUERY_BUDGET_RAISE=False)
+class RouteQueryBudgetTests(TestCase):
+    """Every route of api/urls.py succeeds within its ROUTE_BUDGETS entry"""
+
+    @classmethod
+    def setUpClass(cls):
+        # Message signals publish to the broker; only the queries matter here
+        cls.enterClassContext(mock.patch.object(broker, 'publish', new=mock.AsyncMock()))
+        cls.enterClassContext(mock.patch.object(broker, 'publish_many', new=mock.AsyncMock()))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = _user('alice')
+        cls.bob = _user('bob')
+        cls.carol = _user('carol')
+        cls.dave = _user('dave')
+        cls.friends = [_user(f'friend{index}') for index in range(6)]
+
+        cls.friendship = _friendship(cls.alice, cls.bob, Friendship.ACCEPTED)
+        for friend in cls.friends:
+            _friendship(cls.alice, friend, Friendship.ACCEPTED)
+        cls.request = _friendship(cls.carol, cls.alice, Friendship.PENDING)
+
+        cls.group = Group.objects.create(name='Trip', created_by=cls.alice, description='Summer trip')
+        GroupMember.objects.create(group=cls.group, user=cls.alice, role='admin')
+        for member in [cls.bob, *cls.friends]:
+            GroupMember.objects.create(group=cls.group, user=member)
+        cls.other_group = Group.objects.create(name='Flat', created_by=cls.bob)
+        GroupMember.objects.create(group=cls.other_group, user=cls.bob, role='admin')
+        cls.invite = GroupInvitation.objects.create(group=cls.other_group, invited_user=cls.alice, invited_by=cls.bob)
+        cls.sent_invite = GroupInvitation.objects.create(group=cls.group, invited_user=cls.carol, invited_by=cls.alice)
+
+        for index in range(6):
+            DirectMessage.objects.create(sender=cls.bob if index % 2 else cls.alice,
+                                         recipient=cls.alice if index % 2 else cls.bob, content=f'hi {index}')
+            GroupMessage.objects.create(group=cls.group, sender=cls.friends[index], content=f'hello {index}')
+
+        cls.expenses = []
+        for index in range(6):
+            expense = Expense.objects.create(
+                id=str(uuid.uuid4()), group=cls.group, paid_by=cls.bob, total_amount=Decimal('30.00'),
+                remaining_amount=Decimal('15.00'), description=f'expense {index}'
+            )
+            for user in (cls.alice, cls.bob):
+                ExpenseSplit.objects.create(
+                    id=str(uuid.uuid4()), expense=expense, user=user, total_amount=Decimal('15.00'),
+                    remaining_amount=Decimal('15.00'), is_paid=user == cls.bob
+                )
+            cls.expenses.append(expense)
+        cls.own_expense = Expense.objects.create(
+            id=str(uuid.uuid4()), friend=cls.bob, paid_by=cls.alice, total_amount=Decimal('10.00'),
+            remaining_amount=Decimal('10.00'), description='coffee'
+        )
+
+        start_at = timezone.now() + timedelta(days=1)
+        cls.recurring = RecurringExpense.objects.create(
+            paid_by=cls.alice, group=cls.group, total_amount=Decimal('90.00'), description='rent',
+            start_at=start_at, next_run_at=start_at
+        )
+        cls.job = DeletionJob.objects.create(kind='group', target_id=str(uuid.uuid4()),
+                                             requested_by=cls.alice.cognito_id)
+
+    def setUp(self):
+        self.storage = storage_service.InMemoryStorageService()
+        storage_service.set_storage_service(self.storage)
+        self.addCleanup(storage_service.set_storage_service, None)
+        # Routes that talk to Cognito get a stand-in client signed in as alice
+        patcher = mock.patch('cliquepay.aws_cognito.get_client', return_value=_cognito_client(self.alice))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.token = _token(self.alice)
+        # An uploaded avatar waiting for confirmation, and a signed URL for the next one
+        self.avatar_key = f'{avatars.upload_prefix(self.alice)}me.png'
+        self.storage.upload_stream(io.BytesIO(PNG), self.avatar_key, 'image/png')
+        upload_url, _ = self.storage.generate_upload_url(
+            f'{avatars.upload_prefix(self.alice)}next.png', 'image/png', avatars.MAX_AVATAR_SIZE
+        )
+        self.upload_token = QueryDict(upload_url.partition('?')[2])['token']
+
+    def _requests(self):
+        """url name -> (method, payload, how the payload is sent: 'json', 'query' or 'multipart')"""
+        token = self.token
+        group_id = self.group.id
+        return {
+            'api-root': ('get', {}, 'query'),
+            'register_user': ('post', {'username': 'erin', 'fullname': 'Erin', 'password': 'Passw0rd!23',
+                                       'email': 'erin@example.com'}, 'json'),
+            'verify_signup': ('post', {'username': 'alice', 'confirmation_code': '123456'}, 'json'),
+            'user_login': ('post', {'email': 'alice@example.com', 'password': 'Passw0rd!23'}, 'json'),
+            'renew_tokens': ('post', {'refresh_token': 'refresh', 'id_token': token}, 'json'),
+            'logout_user': ('post', {'access_token': 'access'}, 'json'),
+            'initiate_reset_password': ('post', {'email': 'alice@example.com'}, 'json'),
+            'confirm_reset_password': ('post', {'email': 'alice@example.com', 'confirmation_code': '123456',
+                                                'new_password': 'Passw0rd!24'}, 'json'),
+            'get_user_friends': ('post', {'id_token': token}, 'json'),
+            'resend_code': ('post', {'username': 'alice'}, 'json'),
+            'verify_user_access': ('post', {'access_token': 'access'}, 'json'),
+            'get_user_profile': ('post', {'id_token': token}, 'json'),
+            'change_password': ('post', {'old_password': 'Passw0rd!23', 'new_password': 'Passw0rd!24',
+                                         'access_token': 'access'}, 'json'),
+            'update_user_profile': ('patch', {'id_token': token, 'full_name': 'Alice A.'}, 'json'),
+            'send_friend_request': ('post', {'id_token': token, 'recieve_username': 'dave'}, 'json'),
+            'accept_friend_request': ('post', {'id_token': token, 'request_id': self.request.id}, 'json'),
+            'send_friend_requests': ('post', {'id_token': token, 'user_ids': [self.dave.id]}, 'json'),
+            'remove_friend': ('post', {'id_token': token, 'friendship_id': self.friendship.id}, 'json'),
+            'block_user': ('post', {'id_token': token, 'blocked_id': self.friends[0].id}, 'json'),
+            'update_profile_photo': ('post', {'id_token': token, 'profile_picture': SimpleUploadedFile(
+                'me.png', PNG, content_type='image/png')}, 'multipart'),
+            'reset_profile_photo': ('post', {'id_token': token}, 'json'),
+            'profile_picture_upload_url': ('post', {'id_token': token, 'content_type': 'image/png'}, 'json'),
+            'confirm_profile_picture': ('post', {'id_token': token, 'key': self.avatar_key}, 'json'),
+            'local_storage_upload': ('put', {'token': self.upload_token}, 'query'),
+            'get_direct_messages': ('post', {'id_token': token, 'page': 1, 'page_size': 25}, 'json'),
+            'get_group_messages': ('post', {'id_token': token, 'group_id': group_id, 'page_size': 25}, 'json'),
+            'send_direct_message': ('post', {'id_token': token, 'recipient_id': self.bob.id,
+                                             'content': 'hey', 'message_type': 'TEXT'}, 'json'),
+            'search_user': ('post', {'id_token': token, 'query': 'fri'}, 'json'),
+            'autocomplete_user': ('post', {'id_token': token, 'query': 'fri'}, 'json'),
+            'create_expense': ('post', {'paid_by': token, 'group_id': group_id, 'total_amount': '80.00',
+                                        'description': 'dinner'}, 'json'),
+            'import_expenses': ('post', {'id_token': token, 'file': SimpleUploadedFile(
+                'expenses.csv',
+                f'paid_by,group_id,total_amount,description\n{self.alice.id},{group_id},12.00,taxi\n'.encode(),
+                content_type='text/csv')}, 'multipart'),
+            'upload_receipt': ('post', {'id_token': token, 'expense_id': self.own_expense.id,
+                                        'receipt': SimpleUploadedFile('receipt.png', PNG,
+                                                                      content_type='image/png')}, 'multipart'),
+            'create_recurring_expense': ('post', {'id_token': token, 'group_id': group_id, 'total_amount': '40.00',
+                                                  'start_at': (timezone.now() + timedelta(days=1)).isoformat()},
+                                         'json'),
+            'get_recurring_expenses': ('post', {'id_token': token}, 'json'),
+            'cancel_recurring_expense': ('post', {'id_token': token, 'recurring_id': self.recurring.id}, 'json'),
+            'transactions': ('get', {'idToken': token}, 'query'),
+            'update_expense': ('patch', {'expense_id': self.own_expense.id, 'user_id': self.alice.id,
+                                         'total_amount': '12.00'}, 'json'),
+            'get_expense_detail': ('get', {'expense_id': self.own_expense.id}, 'json'),
+            'record_payment': ('post', {'id_token': token, 'group_id': group_id, 'settle_all': True}, 'json'),
+            'payments_feed': ('post', {'id_token': token}, 'json'),
+            'delete_expense': ('delete', {'expense_id': self.own_expense.id}, 'json'),
+            'reject_friend_request': ('post', {'id_token': token, 'request_id': self.request.id}, 'json'),
+            'get_group_info': ('post', {'id_token': token, 'group_id': group_id}, 'json'),
+            'get_group_summary': ('post', {'id_token': token, 'group_id': group_id}, 'json'),
+            'create_group': ('post', {'id_token': token, 'group_name': 'Weekend'}, 'json'),
+            'group_invite': ('post', {'id_token': token, 'invited_id': self.dave.id, 'group_id': group_id}, 'json'),
+            'group_invite_bulk': ('post', {'id_token': token, 'group_id': group_id,
+                                           'user_ids': [self.dave.id, self.carol.id]}, 'json'),
+            'leave_group': ('post', {'id_token': token, 'group_id': group_id}, 'json'),
+            'get_user_groups': ('post', {'id_token': token}, 'json'),
+            'accept_group_invite': ('post', {'id_token': token, 'invite_id': self.invite.id}, 'json'),
+            'accept_group_invites': ('post', {'id_token': token, 'invite_ids': [self.invite.id]}, 'json'),
+            'reject_group_invite': ('post', {'id_token': token, 'invite_id': self.invite.id}, 'json'),
+            'get_user_invites': ('post', {'id_token': token}, 'json'),
+            'cancel_group_invite': ('post', {'id_token': token, 'invite_id': self.sent_invite.id}, 'json'),
+            'get_financial_summary': ('get', {'idToken': token}, 'query'),
+            'get_settlement_data': ('post', {'id_token': token}, 'json'),
+            'send_group_message': ('post', {'id_token': token, 'group_id': group_id, 'content': 'hey all'}, 'json'),
+            'invite_search': ('post', {'id_token': token, 'group_id': group_id, 'search_term': 'da'}, 'json'),
+            'delete_group': ('post', {'id_token': token, 'group_id': group_id}, 'json'),
+            'deletion_job_status': ('post', {'id_token': token, 'job_id': self.job.id}, 'json'),
+            'edit_group': ('post', {'id_token': token, 'group_id': group_id, 'group_name': 'Road trip'}, 'json'),
+            'remove_from_group': ('post', {'id_token': token, 'group_id': group_id,
+                                           'user_id': self.friends[0].id}, 'json'),
+            'get_direct_messages_between_users': ('post', {'id_token': token, 'recipient_id': self.bob.id}, 'json'),
+            'delete_user_profile': ('post', {'access_token': 'access', 'confirmation': 'DELETE'}, 'json'),
+            'metrics': ('get', {}, 'query'),
+        }
+
+    def _send(self, url_name, method, payload, encoding):
+        url = reverse(url_name)
+        send = getattr(self.client, method)
+        if encoding == 'query':
+            if method != 'get':
+                # Raw uploads carry the image as the body
+                url = f'{url}?{"&".join(f"{key}={value}" for key, value in payload.items())}'
+                return send(url, PNG, content_type='image/png')
+            return send(url, payload, HTTP_AUTHORIZATION='Bearer metrics-token')
+        if encoding == 'multipart':
+            return send(url, payload)
+        return self.client.generic(method.upper(), url, json.dumps(payload, default=str),
+                                   content_type='application/json')
+
+    def test_every_route_has_a_budget(self):
+        url_names = {pattern.name for pattern in urlpatterns if isinstance(pattern, URLPattern)}
+        self.assertEqual(url_names, set(ROUTE_BUDGETS))
+        self.assertEqual(url_names, set(self._requests()))
+
+    def test_routes_stay_within_their_budget(self):
+        for url_name, (method, payload, encoding) in self._requests().items():
+            with self.subTest(route=url_name):
+                # Each route starts from the same fixture
+                with transaction.atomic():
+                    with assert_max_queries(ROUTE_BUDGETS[url_name]):
+                        response = self._send(url_name, method, payload, encoding)
+                    transaction.set_rollback(True)
+                self.assertEqual(response.status_code, ROUTE_STATUSES.get(url_name, 200), response.content[:500])
+
+
+class MetricsViewTests(TestCase):
+
+    @override_settings(METRICS_TOKEN='metrics-token')
+    def test_requires_the_token(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer metrics-token')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+
+    @override_settings(METRICS_TOKEN=None)
+    def test_disabled_without_a_token(self):
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer ').status_code, 404)
+
+
+class PaymentIdempotencyTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = _user('alice')
+        cls.bob = _user('bob')
+        expense = Expense.objects.create(
+            id=str(uuid.uuid4()), friend=cls.alice, paid_by=cls.bob, total_amount=Decimal('20.00'),
+            remaining_amount=Decimal('10.00'), description='lunch'
+        )
+        ExpenseSplit.objects.create(
+            id=str(uuid.uuid4()), expense=expense, user=cls.alice, total_amount=Decimal('10.00'),
+            remaining_amount=Decimal('10.00')
+        )
+
+    def _pay(self, amount, key='retry-1'):
+        return DatabaseService.record_payment(self.alice.cognito_id, recipient_id=self.bob.id,
+                                              amount=amount, idempotency_key=key)
+
+    def test_retry_replays_the_result(self):
+        first = self._pay(Decimal('4.00'))
+        self.assertEqual(first['status'], 'SUCCESS')
+        self.assertEqual(self._pay(Decimal('4.00')), first)
+        self.assertEqual(Payment.objects.count(), 1)
+
+    def test_reused_key_with_other_parameters_is_rejected(self):
+        self._pay(Decimal('4.00'))
+        result = self._pay(Decimal('6.00'))
+        self.assertEqual(result['error_code'], 'IDEMPOTENCY_KEY_REUSED')
+        self.assertEqual(Payment.objects.count(), 1)
+
+
+class GroupSummaryCacheTests(TestCase):
+
+    def setUp(self):
+        self.alice = _user('alice')
+        self.bob = _user('bob')
+        self.group = Group.objects.create(name='Trip', created_by=self.alice)
+        expense = Expense.objects.create(
+            id=str(uuid.uuid4()), group=self.group, paid_by=self.bob, total_amount=Decimal('20.00'),
+            remaining_amount=Decimal('10.00'), description='lunch'
+        )
+        ExpenseSplit.objects.create(
+            id=str(uuid.uuid4()), expense=expense, user=self.alice, total_amount=Decimal('10.00'),
+            remaining_amount=Decimal('10.00')
+        )
+        self.addCleanup(group_summary._drop_now, {self.group.id})
+        # TestCase runs inside a transaction, which would skip the cache
+        patcher = mock.patch.object(group_summary, 'connection', mock.Mock(in_atomic_block=False))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cached_summary_shows_renamed_members(self):
+        group_summary.build_summary(self.group.id, 'USD')
+        self.alice.full_name = 'Alice Smith'
+        self.alice.save()
+
+        with mock.patch.object(group_summary, '_aggregate', side_effect=AssertionError):
+            summary = group_summary.build_summary(self.group.id, 'USD')
+
+        names = {member['user_id']: member['name'] for member in summary['members']}
+        self.assertEqual(names[self.alice.id], 'Alice Smith')
+        self.assertEqual(summary['outstanding'], 10.0)
+
+
+class SplitAllocatorPropertyTests(SimpleTestCase):
+    """Invariants of split_allocator checked over seeded random inputs"""
+
+    CASES = 500
+
+    def _cases(self, seed):
+        rng = random.Random(seed)
+        for _ in range(self.CASES):
+            participants = [f'user{index}' for index in range(rng.randint(1, 12))]
+            total = Decimal(rng.randint(0, 10 ** 7)) / 100
+            yield rng, participants, total
+
+    def _assert_allocation(self, shares, participants, total):
+        self.assertEqual(list(shares), participants)
+        self.assertEqual(sum(shares.values()), total)
+        self.assertTrue(all(share >= 0 and share == share.quantize(split_allocator.CENT)
+                            for share in shares.values()))
+
+    def test_allocate_cents_is_exact_and_within_a_cent(self):
+        rng = random.Random(1)
+        for _ in range(self.CASES):
+            total_cents = rng.randint(0, 10 ** 9)
+            weights = [rng.randint(0, 10 ** 6) for _ in range(rng.randint(1, 20))]
+            shares = split_allocator.allocate_cents(total_cents, weights)
+            self.assertEqual(sum(shares), total_cents)
+            weight_sum = sum(weights) or len(weights)
+            for share, weight in zip(shares, weights if sum(weights) else [1] * len(weights)):
+                # Each share is its exact proportion rounded down or up by one cent
+                self.assertLessEqual(abs(share * weight_sum - total_cents * weight), weight_sum)
+
+    def test_numpy_and_python_allocations_match(self):
+        if split_allocator.np is None:
+            self.skipTest('NumPy is not installed')
+        rng = random.Random(2)
+        for _ in range(20):
+            weights = [rng.randint(0, 1000) for _ in range(split_allocator.NUMPY_THRESHOLD + rng.randint(0, 500))]
+            total_cents = rng.randint(0, 10 ** 8)
+            vectorized = split_allocator.allocate_cents(total_cents, weights)
+            with mock.patch.object(split_allocator, 'np', None):
+                self.assertEqual(split_allocator.allocate_cents(total_cents, weights), vectorized)
+
+    def test_equal_shares_differ_by_at_most_a_cent(self):
+        for _, participants, total in self._cases(3):
+            shares = split_allocator.allocate(total, participants)
+            self._assert_allocation(shares, participants, total)
+            self.assertLessEqual(max(shares.values()) - min(shares.values()), split_allocator.CENT)
+
+    def test_exact_amounts_are_kept(self):
+        for rng, participants, total in self._cases(4):
+            cents = split_allocator.allocate_cents(
+                split_allocator.to_cents(total), [rng.randint(0, 100) for _ in participants]
+            )
+            values = {user_id: split_allocator.from_cents(part) for user_id, part in zip(participants, cents)}
+            self.assertEqual(split_allocator.allocate(total, participants, 'exact', values), values)
+
+    def test_percentages_at_input_precision(self):
+        for rng, participants, total in self._cases(5):
+            # Random percentages with four decimal places adding up to exactly 100
+            units = split_allocator.allocate_cents(100 * 10 ** 4, [rng.randint(0, 50) for _ in participants])
+            values = {user_id: Decimal(part).scaleb(-4) for user_id, part in zip(participants, units)}
+            shares = split_allocator.allocate(total, participants, 'percentage', values)
+            self._assert_allocation(shares, participants, total)
+            for user_id, share in shares.items():
+                self.assertLessEqual(abs(share - total * values[user_id] / 100), split_allocator.CENT)
+
+    def test_thirds_in_percentages(self):
+        values = {'a': Decimal('33.3333'), 'b': Decimal('33.3333'), 'c': Decimal('33.3334')}
+        shares = split_allocator.allocate(Decimal('100.00'), ['a', 'b', 'c'], 'percentage', values)
+        self.assertEqual(shares, {'a': Decimal('33.33'), 'b': Decimal('33.33'), 'c': Decimal('33.34')})
+
+    def test_shares_follow_their_weights(self):
+        for rng, participants, total in self._cases(6):
+            values = {user_id: Decimal(rng.randint(1, 40000)).scaleb(-4) for user_id in participants}
+            shares = split_allocator.allocate(total, participants, 'shares', values)
+            self._assert_allocation(shares, participants, total)
+            weight_sum = sum(values.values())
+            for user_id, share in shares.items():
+                self.assertLessEqual(abs(share - total * values[user_id] / weight_sum), split_allocator.CENT)
+
+    def test_itemized_covers_items_and_extras(self):
+        for rng, participants, total in self._cases(7):
+            items = []
+            for _ in range(rng.randint(0, 5)):
+                items.append({'amount': Decimal(rng.randint(0, 5000)) / 100,
+                              'user_ids': rng.sample(participants, rng.randint(1, len(participants)))})
+            total = total + sum(item['amount'] for item in items)
+            shares = split_allocator.allocate(total, participants, 'itemized', items=items)
+            self._assert_allocation(shares, participants, total)
+
+    def test_rescale_keeps_the_new_total(self):
+        for rng, participants, total in self._cases(8):
+            amounts = [Decimal(rng.randint(0, 10 ** 5)) / 100 for _ in participants]
+            self.assertEqual(sum(split_allocator.rescale(amounts, total)), total)
+
+    def test_inconsistent_values_are_rejected(self):
+        with self.assertRaises(split_allocator.SplitError):
+            split_allocator.allocate(Decimal('10'), ['a', 'b'], 'percentage', {'a': '50', 'b': '49.9999'})
+        with self.assertRaises(split_allocator.SplitError):
+            split_allocator.allocate(Decimal('10'), ['a', 'b'], 'percentage', {'a': '50.00001', 'b': '49.99999'})
+        with self.assertRaises(split_allocator.SplitError):
+            split_allocator.allocate(Decimal('10'), ['a', 'b'], 'exact', {'a': '5.005', 'b': '4.995'})
+        with self.assertRaises(split_allocator.SplitError):
+            split_allocator.allocate(Decimal('10'), ['a', 'b'], 'shares', {'a': 0, 'b': 0})
+
+
+class RecurringScheduleTests(TestCase):
+
+    def test_month_end_rules_do_not_drift(self):
+        alice, bob = _user('alice'), _user('bob')
+        start_at = datetime(2025, 1, 31, 9, tzinfo=dt_timezone.utc)
+        rule = RecurringExpense.objects.create(
+            paid_by=alice, friend=bob, total_amount=Decimal('20.00'), interval='monthly',
+            start_at=start_at, next_run_at=start_at
+        )
+
+        self.assertEqual(recurring.materialize_due(now=datetime(2025, 4, 1, tzinfo=dt_timezone.utc)), 3)
+
+        rule.refresh_from_db()
+        self.assertEqual(rule.run_count, 3)
+        self.assertEqual(rule.last_run_at, datetime(2025, 3, 31, 9, tzinfo=dt_timezone.utc))
+        self.assertEqual(rule.next_run_at, datetime(2025, 4, 30, 9, tzinfo=dt_timezone.utc))
+        self.assertEqual(
+            sorted(Expense.objects.filter(paid_by=alice).values_list('created_at', flat=True)),
+            [datetime(2025, month, day, 9, tzinfo=dt_timezone.utc) for month, day in ((1, 31), (2, 28), (3, 31))]
+        )
@@ -0,0 +1,64 @@
+"""
+User search backed by a FULLTEXT index.
+
+On MySQL, users are matched through the ngram FULLTEXT index over
+(name, full_name, email) created in migration 0010, with a phrase query so
+that any substring of at least NGRAM_TOKEN_SIZE characters is found without
+scanning the table. Shorter terms fall back to prefix matches, which can use
+the btree indexes on each column. Other databases (tests, local SQLite) use
+plain icontains.
+
+Results rank exact matches first, then prefix matches, then the rest by
+full-text relevance.
+"""
+
+import re
+
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+
+from .models import User
+
+# Must match the server's ngram_token_size (MySQL default: 2)
+NGRAM_TOKEN_SIZE = 2
+FULLTEXT_COLUMNS = 'name, full_name, email'
+# Characters with a meaning in BOOLEAN MODE queries
+_BOOLEAN_OPERATORS = re.compile(r'[+\-<>()~*"@]')
+
+
+def _rank(term):
+    return Case(
+        When(Q(name__iexact=term) | Q(email__iexact=term) | Q(full_name__iexact=term), then=Value(0)),
+        When(Q(name__istartswith=term) | Q(full_name__istartswith=term) | Q(email__istartswith=term), then=Value(1)),
+        default=Value(2),
+        output_field=IntegerField(),
+    )
+
+
+def search_queryset(term, queryset=None):
+    """
+    Users matching a search term, best matches first.
+
+    Args:
+        term (str): Search term as typed
+        queryset (QuerySet, optional): Base queryset, e.g. with exclusions applied
+    Returns:
+        QuerySet: Matching users ordered by rank; slice it for the page size
+    """
+    term = term.strip()
+    queryset = User.objects.all() if queryset is None else queryset
+    phrase = _BOOLEAN_OPERATORS.sub(' ', term).strip()
+
+    if connection.vendor == 'mysql' and len(phrase) >= NGRAM_TOKEN_SIZE:
+        queryset = queryset.annotate(
+            relevance=RawSQL(f"MATCH({FULLTEXT_COLUMNS}) AGAINST (%s IN BOOLEAN MODE)", (f'"{phrase}"',))
+        ).filter(relevance__gt=0)
+        return queryset.annotate(rank=_rank(term)).order_by('rank', '-relevance', 'name')
+
+    if connection.vendor == 'mysql':
+        # Too short for the ngram index, prefix lookups use the btree indexes
+        matches = Q(name__istartswith=term) | Q(full_name__istartswith=term) | Q(email__istartswith=term)
+    else:
+        matches = Q(name__icontains=term) | Q(full_name__icontains=term) | Q(email__icontains=term)
+    return queryset.filter(matches).annotate(rank=_rank(term)).order_by('rank', 'name')